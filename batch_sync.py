@@ -0,0 +1,167 @@
+import os
+import logging
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _fetch_playlists(playlist_ids: List[str], force: bool = False
+                     ) -> Tuple[Dict[str, Tuple[str, List[Dict], Optional[str]]], Dict[str, Dict]]:
+    """
+    Fetches and parses several playlists at once (BATCH_FETCH_THREADS at a time).
+    Returns (playlist_id -> (name, tracks, snapshot_id), playlist_id -> previous state
+    of playlists that are unchanged since their last sync). Unchanged playlists are
+    not paged through unless force is set; playlists that fail are logged and left out.
+    """
+    from spotify_utils import (setup_spotify_client, get_spotify_playlist_tracks, get_spotify_playlist_snapshot,
+                               parse_spotify_tracks)
+    from playlist_state import get_playlist_state
+    from job_cancellation import check_cancelled
+    clients = threading.local()
+    state = get_playlist_state()
+
+    def fetch(playlist_id):
+        check_cancelled()
+        # spotipy clients share a requests session, so each thread gets its own
+        if not hasattr(clients, 'pair'):
+            clients.pair = setup_spotify_client()
+        _, snapshot_id = get_spotify_playlist_snapshot(*clients.pair, playlist_id)
+        previous = None if force else state.is_unchanged(playlist_id, snapshot_id)
+        if previous:
+            return previous
+        name, raw_tracks = get_spotify_playlist_tracks(*clients.pair, playlist_id)
+        return name, parse_spotify_tracks(raw_tracks), snapshot_id
+
+    threads = int(os.environ.get('BATCH_FETCH_THREADS', '4'))
+    playlists = {}
+    unchanged = {}
+    with ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="playlist-fetch") as executor:
+        # Each fetch runs in a copy of the job's context so its logs and cancellation reach the job
+        futures = {playlist_id: executor.submit(contextvars.copy_context().run, fetch, playlist_id)
+                   for playlist_id in playlist_ids}
+        for playlist_id, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"❌ Could not fetch playlist {playlist_id}: {e}")
+                continue
+            if isinstance(result, dict):
+                unchanged[playlist_id] = result
+                logger.info(f"⏭️  '{result['name']}' is unchanged since the last sync")
+            else:
+                playlists[playlist_id] = result
+                logger.info(f"📋 Fetched '{result[0]}' ({len(result[1])} tracks)")
+    return playlists, unchanged
+
+
+def sync_playlists(playlist_urls: List[str], job_id: Optional[str] = None, force: bool = False) -> Dict[str, int]:
+    """
+    Syncs several playlists as one job. Playlists are fetched concurrently, their
+    tracks are de-duplicated by Spotify ID, and each unique track is matched against
+    Plex and downloaded at most once. After the Plex scan only the tracks that were
+    missing are matched again, then every Plex playlist is updated from the shared
+    results. Playlists unchanged since their last sync are skipped unless force is
+    set. Returns playlist name -> number of tracks in its Plex playlist.
+    """
+    from spotify_utils import get_spotify_playlist_id_from_url
+    from plex_utils import setup_plex_client, get_music_library, create_or_update_plex_playlist, find_plex_match
+    from download_utils import download_missing_tracks_spotdl
+    from job_logging import set_job_progress, add_job_progress
+    from job_cancellation import check_cancelled
+    from plex_scan import wait_for_scan
+    from playlist_state import get_playlist_state, track_key
+
+    playlist_ids = []
+    for url in playlist_urls:
+        playlist_id = get_spotify_playlist_id_from_url(url)
+        if not playlist_id:
+            raise ValueError(f"Invalid Spotify Playlist URL provided: {url}")
+        if playlist_id not in playlist_ids:
+            playlist_ids.append(playlist_id)
+
+    set_job_progress(stage="fetching", playlists_total=len(playlist_ids))
+    logger.info(f"📚 Fetching {len(playlist_ids)} playlists...")
+    playlists, unchanged = _fetch_playlists(playlist_ids, force=force)
+    check_cancelled()
+    if not playlists and not unchanged:
+        raise ValueError("None of the playlists could be fetched.")
+    set_job_progress(playlists_fetched=len(playlists), playlists_unchanged=len(unchanged))
+    results = {previous['name']: previous['tracks_found'] for previous in unchanged.values()}
+    if not playlists:
+        logger.info(f"✅ All {len(unchanged)} playlists are unchanged since their last sync")
+        set_job_progress(stage="unchanged")
+        return results
+
+    unique_tracks: Dict[str, Dict] = {}
+    references = 0
+    for _, tracks, _ in playlists.values():
+        for track in tracks:
+            references += 1
+            unique_tracks.setdefault(track_key(track), track)
+    logger.info(f"🧮 {references} playlist entries, {len(unique_tracks)} unique tracks")
+
+    plex = setup_plex_client()
+    music_library = get_music_library(plex)
+    set_job_progress(stage="matching", tracks_total=len(unique_tracks), tracks_matched=0, tracks_missing=0)
+    logger.info(f"🔍 Matching {len(unique_tracks)} unique tracks with Plex library...")
+    matches = {}
+    missing = []
+    for i, (key, track) in enumerate(unique_tracks.items(), 1):
+        check_cancelled()
+        logger.info(f"[{i}/{len(unique_tracks)}] Searching: {track['artist']} - {track['title']}")
+        plex_match = find_plex_match(music_library, track)
+        if plex_match:
+            matches[key] = plex_match
+            add_job_progress(tracks_matched=1)
+        else:
+            missing.append(key)
+            add_job_progress(tracks_missing=1)
+    logger.info(f"Found {len(matches)} unique tracks in Plex, {len(missing)} missing.")
+
+    if missing:
+        logger.info(f"📥 Need to download: {len(missing)}")
+        set_job_progress(stage="downloading")
+        download_missing_tracks_spotdl([unique_tracks[key] for key in missing], "/app/downloads", job_id=job_id)
+        # download_missing_tracks_spotdl waits for the scan of the folders it filled;
+        # this only waits out a scan that is still running
+        music_library = get_music_library(plex)
+        wait_for_scan(music_library, grace=0)
+        logger.info("🔄 Re-matching downloaded tracks...")
+        set_job_progress(stage="rematching")
+        for key in missing:
+            check_cancelled()
+            plex_match = find_plex_match(music_library, unique_tracks[key])
+            if plex_match:
+                matches[key] = plex_match
+
+    set_job_progress(stage="updating_playlist")
+    state = get_playlist_state()
+    for playlist_id in playlist_ids:
+        if playlist_id not in playlists:
+            continue
+        check_cancelled()
+        name, tracks, snapshot_id = playlists[playlist_id]
+        plex_tracks = []
+        seen = set()
+        for track in tracks:
+            key = track_key(track)
+            if key in matches and key not in seen:
+                seen.add(key)
+                plex_tracks.append(matches[key])
+        logger.info(f"📊 '{name}': {len(plex_tracks)} of {len(tracks)} tracks in Plex")
+        create_or_update_plex_playlist(plex, name, plex_tracks)
+        results[name] = len(plex_tracks)
+        keys = list(dict.fromkeys(track_key(track) for track in tracks))
+        missing_here = sum(1 for key in keys if key not in matches)
+        # Stored so a later single-playlist sync of this playlist can run as a delta
+        state.record(playlist_id, name, snapshot_id, len(tracks), len(plex_tracks), missing_here,
+                     tracks=[(key, matches[key].ratingKey if key in matches else None) for key in keys])
+        add_job_progress(playlists_updated=1)
+    failed = len(playlist_ids) - len(playlists) - len(unchanged)
+    logger.info(f"✅ Batch sync complete: {len(playlists)} playlists updated"
+                + (f", {len(unchanged)} unchanged" if unchanged else "")
+                + (f", {failed} could not be fetched" if failed else ""))
+    return results
@@ -25,3 +25,9 @@ def get_plex_credentials():
 
 def get_plex_music_library():
     return os.getenv("PLEX_MUSIC_LIBRARY", "Music")
+
+def get_state_dir():
+    """Returns the directory used for persistent runtime state (queues, caches)."""
+    state_dir = os.getenv("STATE_DIR", "/app/state")
+    os.makedirs(state_dir, exist_ok=True)
+    return state_dir
@@ -0,0 +1,179 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Optional
+from credential import get_state_dir
+
+logger = logging.getLogger(__name__)
+
+# Item states. spotDL fetches and converts inside a single subprocess, so
+# 'fetching' covers both; 'downloaded' means the file is in the download
+# directory but has not been organized into the library yet.
+QUEUED = "queued"
+FETCHING = "fetching"
+DOWNLOADED = "downloaded"
+MOVED = "moved"
+FAILED = "failed"
+
+PENDING_STATES = (QUEUED, FETCHING, DOWNLOADED)
+STATES = PENDING_STATES + (MOVED, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT,
+    track_id TEXT,
+    url TEXT NOT NULL,
+    artist TEXT,
+    title TEXT,
+    album TEXT,
+    position INTEGER,
+    download_dir TEXT NOT NULL,
+    dest_dir TEXT,
+    state TEXT NOT NULL,
+    file_path TEXT,
+    dest_path TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_downloads_state ON downloads(state);
+CREATE INDEX IF NOT EXISTS idx_downloads_track ON downloads(track_id);
+"""
+
+
+class DownloadQueue:
+    """
+    SQLite-backed record of every track handed to spotDL.
+    Items move queued -> fetching -> downloaded -> moved (or failed), so work that was
+    queued or in flight when the process stopped can be resumed on the next start.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def enqueue(self, tracks: List[Dict], download_dir: str, job_id: Optional[str] = None,
+                dest_dir: Optional[str] = None) -> List[Dict]:
+        """
+        Records tracks as queued and returns their queue items.
+        A track that is already pending from an earlier run is reused instead of duplicated.
+        """
+        from spotify_utils import get_spotify_track_id_from_url
+        items = []
+        now = time.time()
+        with self._lock:
+            for position, track in enumerate(tracks):
+                url = track.get('url')
+                if not url:
+                    continue
+                track_id = get_spotify_track_id_from_url(url)
+                existing = None
+                if track_id:
+                    existing = self._conn.execute(
+                        f"SELECT * FROM downloads WHERE track_id = ? AND state IN ({','.join('?' * len(PENDING_STATES))}) "
+                        "ORDER BY id DESC LIMIT 1",
+                        (track_id, *PENDING_STATES),
+                    ).fetchone()
+                if existing:
+                    self._conn.execute(
+                        "UPDATE downloads SET job_id = ?, position = ?, updated_at = ? WHERE id = ?",
+                        (job_id, position, now, existing['id']),
+                    )
+                    item_id = existing['id']
+                else:
+                    cursor = self._conn.execute(
+                        "INSERT INTO downloads (job_id, track_id, url, artist, title, album, position, download_dir, "
+                        "dest_dir, state, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job_id, track_id, url, track.get('artist'), track.get('title'), track.get('album'),
+                         position, download_dir, dest_dir, QUEUED, now, now),
+                    )
+                    item_id = cursor.lastrowid
+                items.append(self._get(item_id))
+            self._conn.commit()
+        return items
+
+    def update(self, item_id: int, state: str, **fields) -> None:
+        """Moves an item to a new state, optionally updating file_path, dest_path or error."""
+        allowed = {'file_path', 'dest_path', 'error', 'dest_dir'}
+        columns = ["state = ?", "updated_at = ?"]
+        values = [state, time.time()]
+        for key, value in fields.items():
+            if key not in allowed:
+                raise ValueError(f"Unknown download queue field: {key}")
+            columns.append(f"{key} = ?")
+            values.append(value)
+        if state == FETCHING:
+            columns.append("attempts = attempts + 1")
+        with self._lock:
+            self._conn.execute(f"UPDATE downloads SET {', '.join(columns)} WHERE id = ?", (*values, item_id))
+            self._conn.commit()
+
+    def get(self, item_id: int) -> Optional[Dict]:
+        with self._lock:
+            return self._get(item_id)
+
+    def _get(self, item_id: int) -> Optional[Dict]:
+        row = self._conn.execute("SELECT * FROM downloads WHERE id = ?", (item_id,)).fetchone()
+        return dict(row) if row else None
+
+    def pending(self) -> List[Dict]:
+        """Returns all items that have not reached a terminal state, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM downloads WHERE state IN ({','.join('?' * len(PENDING_STATES))}) ORDER BY id",
+                PENDING_STATES,
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def recover_interrupted(self) -> int:
+        """Puts items that were mid-fetch when the process stopped back into the queue."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE downloads SET state = ?, updated_at = ? WHERE state = ?",
+                (QUEUED, time.time(), FETCHING),
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM downloads GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    def prune(self, max_age_seconds: float) -> int:
+        """Deletes finished items older than max_age_seconds."""
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM downloads WHERE state IN (?, ?) AND updated_at < ?",
+                (MOVED, FAILED, cutoff),
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_download_queue() -> DownloadQueue:
+    """Returns the process-wide download queue stored under STATE_DIR."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            db_path = os.path.join(get_state_dir(), "downloads.db")
+            _queue = DownloadQueue(db_path)
+            retention_days = int(os.environ.get('DOWNLOAD_QUEUE_RETENTION_DAYS', '7'))
+            pruned = _queue.prune(retention_days * 86400)
+            if pruned:
+                logger.info(f"🧹 Pruned {pruned} finished download queue entries")
+        return _queue
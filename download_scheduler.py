@@ -0,0 +1,317 @@
+import os
+import time
+import heapq
+import contextvars
+import itertools
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Optional, Tuple
+from metrics import REGISTRY, DOWNLOADS_QUEUED, DOWNLOADS_ACTIVE, DOWNLOAD_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB = "default"
+
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit.
+    Throughput is measured over fixed windows: the limit grows by one when a window
+    had no errors and its throughput beat the previous window's by more than
+    growth_margin, holds when throughput is flat or falling, and is cut by
+    decrease_factor (at most once per window) on any error, timeout or stall.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int,
+                 decrease_factor: float = 0.5, window_seconds: float = 30.0, growth_margin: float = 1.05):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease_factor = decrease_factor
+        self.growth_margin = growth_margin
+        self.window_seconds = window_seconds
+        self.throughput = None
+        self.increases = 0
+        self.decreases = 0
+        self._last_decrease = float('-inf')
+        self._reset_window(time.monotonic())
+
+    def _reset_window(self, now: float):
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_ok = 0
+        self._window_errors = 0
+
+    @property
+    def current(self) -> int:
+        return max(self.minimum, int(self.limit))
+
+    def record(self, ok: bool, nbytes: int = 0) -> None:
+        now = time.monotonic()
+        if not ok:
+            self._window_errors += 1
+            if now - self._last_decrease >= self.window_seconds:
+                self.limit = max(float(self.minimum), self.limit * self.decrease_factor)
+                self.decreases += 1
+                self._last_decrease = now
+                self.throughput = None
+                self._reset_window(now)
+                logger.info(f"[spotDL] 📉 Download concurrency decreased to {self.current}")
+            return
+        self._window_ok += 1
+        self._window_bytes += nbytes
+        elapsed = now - self._window_start
+        if elapsed < self.window_seconds:
+            return
+        throughput = self._window_bytes / elapsed
+        # The first window after a reset only sets the baseline; noise within the margin is not growth
+        if (not self._window_errors and self.throughput is not None
+                and throughput > self.throughput * self.growth_margin):
+            if self.limit < self.maximum:
+                self.limit = min(float(self.maximum), self.limit + 1)
+                self.increases += 1
+                logger.info(f"[spotDL] 📈 Download concurrency increased to {self.current}")
+        self.throughput = throughput
+        self._reset_window(now)
+
+
+class DownloadScheduler:
+    """
+    Process-wide download scheduler with one global concurrency budget.
+    Each job has its own queue ordered by playlist position; workers serve jobs
+    round-robin so concurrent syncs share the budget fairly and the first tracks
+    of every playlist land first. The budget adapts at runtime (AIMD) from the
+    outcomes tasks report through record_outcome().
+    """
+
+    def __init__(self, concurrency: int, min_concurrency: int = 1, max_concurrency: Optional[int] = None,
+                 window_seconds: float = 30.0):
+        max_concurrency = max_concurrency or concurrency
+        self.controller = AIMDController(concurrency, min_concurrency, max_concurrency, window_seconds=window_seconds)
+        self._cond = threading.Condition()
+        self._job_queues: Dict[str, list] = {}
+        self._job_order = deque()
+        self._seq = itertools.count()
+        self._active = 0
+        self._active_by_job: Dict[str, int] = {}
+        self._workers = []
+
+    def submit(self, job_id: Optional[str], position: int, fn, *args, **kwargs) -> Future:
+        """
+        Queues fn(*args, **kwargs) for job_id at the given playlist position and returns its Future.
+        fn runs in a copy of the caller's context, so context variables such as the
+        current job (used for log routing) carry over to the worker thread.
+        """
+        job_id = job_id or DEFAULT_JOB
+        future = Future()
+        context = contextvars.copy_context()
+        with self._cond:
+            if job_id not in self._job_queues:
+                self._job_queues[job_id] = []
+                self._job_order.append(job_id)
+            heapq.heappush(self._job_queues[job_id], (position, next(self._seq), future, context, fn, args, kwargs))
+            self._ensure_workers()
+            self._cond.notify()
+        return future
+
+    @property
+    def concurrency(self) -> int:
+        return self.controller.current
+
+    def record_outcome(self, ok: bool, nbytes: int = 0) -> None:
+        """Feeds a finished download into the AIMD controller; failures should be errors or timeouts."""
+        with self._cond:
+            self.controller.record(ok, nbytes)
+            self._cond.notify_all()
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.controller.maximum:
+            worker = threading.Thread(target=self._worker_loop, name=f"download-worker-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_task(self):
+        # Round-robin across jobs; within a job the lowest playlist position wins
+        job_id = self._job_order.popleft()
+        task_queue = self._job_queues[job_id]
+        task = heapq.heappop(task_queue)
+        if task_queue:
+            self._job_order.append(job_id)
+        else:
+            del self._job_queues[job_id]
+        return job_id, task
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._job_order or self._active >= self.controller.current:
+                    self._cond.wait()
+                job_id, (_, _, future, context, fn, args, kwargs) = self._next_task()
+                if future.cancelled():
+                    # Abandoned while queued (its job was cancelled); takes no capacity
+                    continue
+                self._active += 1
+                self._active_by_job[job_id] = self._active_by_job.get(job_id, 0) + 1
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(context.run(fn, *args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._active -= 1
+                    self._active_by_job[job_id] -= 1
+                    if not self._active_by_job[job_id]:
+                        del self._active_by_job[job_id]
+                    self._cond.notify()
+
+    def queue_depth(self, job_id: Optional[str] = None) -> int:
+        """Number of queued (not yet running) tasks, overall or for one job."""
+        with self._cond:
+            if job_id is not None:
+                return len(self._job_queues.get(job_id, ()))
+            return sum(len(q) for q in self._job_queues.values())
+
+    def stats(self) -> Dict:
+        with self._cond:
+            job_ids = set(self._job_queues) | set(self._active_by_job)
+            return {
+                "concurrency": self.controller.current,
+                "min_concurrency": self.controller.minimum,
+                "max_concurrency": self.controller.maximum,
+                "throughput_bytes_per_second": self.controller.throughput,
+                "concurrency_increases": self.controller.increases,
+                "concurrency_decreases": self.controller.decreases,
+                "active": self._active,
+                "queued": sum(len(q) for q in self._job_queues.values()),
+                "jobs": {
+                    job_id: {
+                        "queued": len(self._job_queues.get(job_id, ())),
+                        "active": self._active_by_job.get(job_id, 0),
+                    }
+                    for job_id in job_ids
+                },
+            }
+
+
+_KEY_LOCK_STRIPES = 64
+
+
+class InflightRegistry:
+    """
+    Process-wide registry of in-flight downloads keyed by Spotify track ID, so a track
+    requested by several jobs at once is fetched exactly once and every requester
+    receives the same result. A requester that gives up (a cancelled job) detaches;
+    the download is only aborted once no requester is left.
+    """
+
+    def __init__(self):
+        # Re-entrant: a future that is already done runs its callback immediately
+        self._lock = threading.RLock()
+        self._futures: Dict[str, Future] = {}
+        self._requesters: Dict[str, set] = {}
+        self._aborts: Dict[str, threading.Event] = {}
+        # Striped so the number of locks stays fixed however many tracks pass through
+        self._key_locks = [threading.Lock() for _ in range(_KEY_LOCK_STRIPES)]
+
+    def submit(self, key: str, submit_fn, requester: Optional[str] = None) -> Tuple[Future, bool]:
+        """
+        Returns (future, attached). If key is in flight its future is returned with
+        attached=True; otherwise submit_fn() is called to start the work.
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None and not future.done():
+                self._requesters[key].add(requester)
+                return future, True
+            self._requesters[key] = {requester}
+            self._aborts[key] = threading.Event()
+            try:
+                future = submit_fn()
+            except BaseException:
+                # Nothing was started, so later requesters must not find this key in flight
+                self._requesters.pop(key, None)
+                self._aborts.pop(key, None)
+                raise
+            self._futures[key] = future
+            future.add_done_callback(lambda done, key=key: self._release(key, done))
+            return future, False
+
+    def _release(self, key: str, future: Future):
+        with self._lock:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+                del self._requesters[key]
+                del self._aborts[key]
+
+    def abort_event(self, key: str) -> threading.Event:
+        """Set once every requester of key has detached; the download should stop."""
+        with self._lock:
+            return self._aborts.get(key) or threading.Event()
+
+    def detach(self, key: str, requester: Optional[str]) -> bool:
+        """
+        Removes requester from key's download. When nobody else wants it, a queued
+        download is cancelled and a running one is told to abort; returns True then.
+        """
+        with self._lock:
+            requesters = self._requesters.get(key)
+            if requesters is None:
+                return False
+            requesters.discard(requester)
+            if requesters:
+                return False
+            self._aborts[key].set()
+            future = self._futures[key]
+        future.cancel()
+        return True
+
+    def lock(self, key: str) -> threading.Lock:
+        """
+        Lock for work that must not run concurrently for the same track. Keys share a
+        fixed set of locks, so unrelated tracks may occasionally wait for each other.
+        """
+        return self._key_locks[hash(key) % _KEY_LOCK_STRIPES]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._futures)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _set_scheduler_gauges():
+    stats = _scheduler.stats()
+    DOWNLOADS_QUEUED.set(stats["queued"])
+    DOWNLOADS_ACTIVE.set(stats["active"])
+    DOWNLOAD_CONCURRENCY.set(stats["concurrency"])
+
+
+_inflight = InflightRegistry()
+
+
+def get_inflight_registry() -> InflightRegistry:
+    return _inflight
+
+
+def get_download_scheduler() -> DownloadScheduler:
+    """
+    Returns the process-wide scheduler. It starts at SPOTDL_THREADS and adapts between
+    SPOTDL_MIN_THREADS and SPOTDL_MAX_THREADS.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            threads = int(os.environ.get('SPOTDL_THREADS', '5'))
+            min_threads = int(os.environ.get('SPOTDL_MIN_THREADS', '1'))
+            max_threads = int(os.environ.get('SPOTDL_MAX_THREADS', str(threads * 2)))
+            window = float(os.environ.get('SPOTDL_AIMD_WINDOW_SECONDS', '30'))
+            _scheduler = DownloadScheduler(threads, min_threads, max_threads, window_seconds=window)
+            REGISTRY.add_collect_hook(_set_scheduler_gauges)
+            logger.info(f"[spotDL] Download scheduler started with {threads} threads (adaptive {min_threads}-{max_threads})")
+        return _scheduler
@@ -0,0 +1,178 @@
+import itertools
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def download_snapshot() -> Dict:
+    """Download scheduler and provider state of the process that runs downloads."""
+    from download_scheduler import get_download_scheduler, get_inflight_registry
+    from ytmusic_cache import get_youtube_search_cache
+    from provider_scoreboard import get_provider_scoreboard
+    return {
+        "scheduler": get_download_scheduler().stats(),
+        "in_flight_tracks": len(get_inflight_registry()),
+        "stalls_by_provider": get_provider_scoreboard().stall_counts(),
+        "providers": get_provider_scoreboard().stats(),
+        "youtube_search_cache": get_youtube_search_cache().stats(),
+    }
+
+
+class DownloadClient:
+    """
+    Used inside a sync worker: hands download_and_organize requests to the API
+    process's DownloadService over the worker's event queue and waits for the reply,
+    which arrives in the worker's inbox. A cancelled job stops waiting and tells the
+    service to drop the job's downloads.
+    """
+
+    def __init__(self, index: int, events):
+        self._index = index
+        self._events = events
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._waiting: Dict[int, list] = {}
+
+    def run(self, job_id: Optional[str], **request):
+        from job_cancellation import JobCancelled, check_cancelled
+        request_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        with self._lock:
+            self._waiting[request_id] = waiter
+        self._events.put(('download', self._index, request_id, job_id, request))
+        try:
+            while not waiter[0].wait(1):
+                check_cancelled()
+        except JobCancelled:
+            self._events.put(('download_cancel', job_id))
+            raise
+        finally:
+            with self._lock:
+                self._waiting.pop(request_id, None)
+        status, value = waiter[1]
+        if status == 'cancelled':
+            raise JobCancelled("Job cancelled")
+        if status == 'error':
+            raise RuntimeError(value)
+        return value
+
+    def resolve(self, request_id: int, status: str, value) -> None:
+        """Delivers a reply from the service; replies nobody waits for any more are dropped."""
+        with self._lock:
+            waiter = self._waiting.get(request_id)
+        if waiter is not None:
+            waiter[1] = (status, value)
+            waiter[0].set()
+
+
+class DownloadService:
+    """
+    Runs every download of the server in the API process, so all sync workers share
+    one download scheduler and concurrency budget, one in-flight registry (a track
+    wanted by several jobs is fetched once), one Plex scan coordinator, one library
+    index and one provider scoreboard. Each request runs download_and_organize in a
+    thread under the requesting job's context; its logs and progress go straight to
+    the job store.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests_by_job: Dict[str, int] = {}
+        self._started = False
+
+    def start(self) -> None:
+        """
+        Routes download logs and progress to the job store, warms the library index
+        and resumes downloads left by a previous run.
+        """
+        from job_store import get_job_store
+        from job_logging import install_job_log_router, set_log_sink, set_progress_sink
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        store = get_job_store()
+        set_log_sink(store.append_log)
+        set_progress_sink(store.update_progress)
+        install_job_log_router()
+        # Built before the first job needs it, so that job does not wait for a full walk
+        from library_index import get_library_index
+        get_library_index().refresh_in_background()
+        threading.Thread(target=self._resume, name="download-resume", daemon=True).start()
+
+    def _resume(self) -> None:
+        from download_utils import resume_pending_downloads
+        try:
+            resume_pending_downloads()
+        except Exception as e:
+            logger.error(f"❌ Resuming pending downloads failed: {e}")
+
+    def handle(self, job_id: Optional[str], request: Dict, reply: Callable[[str, object], None]) -> None:
+        """Starts a request from a sync worker; reply(status, value) is called once it finishes."""
+        from job_cancellation import register_job
+        if job_id is not None:
+            with self._lock:
+                # Registered before the thread starts, so a cancel that follows is never missed
+                register_job(job_id)
+                self._requests_by_job[job_id] = self._requests_by_job.get(job_id, 0) + 1
+        threading.Thread(target=self._serve, args=(job_id, request, reply), name="download-request",
+                         daemon=True).start()
+
+    def _serve(self, job_id: Optional[str], request: Dict, reply: Callable[[str, object], None]) -> None:
+        from job_logging import job_context
+        from job_cancellation import JobCancelled, release_job
+        from download_utils import download_and_organize
+        try:
+            with job_context(job_id):
+                result = ('ok', download_and_organize(job_id=job_id, **request))
+        except JobCancelled:
+            result = ('cancelled', None)
+        except Exception as e:
+            logger.error(f"❌ Download request of job {job_id} failed: {e}")
+            result = ('error', str(e))
+        finally:
+            if job_id is not None:
+                with self._lock:
+                    self._requests_by_job[job_id] -= 1
+                    if not self._requests_by_job[job_id]:
+                        del self._requests_by_job[job_id]
+                        release_job(job_id)
+        try:
+            reply(*result)
+        except Exception as e:
+            logger.warning(f"⚠️  Could not deliver download result of job {job_id}: {e}")
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancels the job's downloads; tracks other jobs also wait for keep downloading."""
+        from job_cancellation import cancel_job
+        return cancel_job(job_id)
+
+    def active_requests(self) -> int:
+        with self._lock:
+            return sum(self._requests_by_job.values())
+
+
+_client: Optional[DownloadClient] = None
+_service: Optional[DownloadService] = None
+_service_lock = threading.Lock()
+
+
+def set_download_client(client: Optional[DownloadClient]) -> None:
+    """Set in sync worker processes so their downloads run in the API process."""
+    global _client
+    _client = client
+
+
+def get_download_client() -> Optional[DownloadClient]:
+    """The client of this sync worker, or None when downloads run in this process."""
+    return _client
+
+
+def get_download_service() -> DownloadService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = DownloadService()
+        return _service
@@ -6,6 +6,9 @@ from mutagen.easyid3 import EasyID3
 from mutagen.id3 import ID3, TXXX
 from spotdl.download.downloader import Downloader
 from spotdl.types.song import Song
+from job_cancellation import JobCancelled, check_cancelled, current_token
+from metrics import (SPOTIFY_PAGE_SECONDS, DOWNLOAD_SECONDS, DOWNLOAD_BYTES, FILE_MOVE_SECONDS,
+                     FILE_MOVE_BYTES)
 
 # Configure logging to always output to console
 logger = logging.getLogger(__name__)
@@ -24,254 +27,608 @@ logging.getLogger("pytube").setLevel(logging.ERROR)
 logging.getLogger("yt_dlp").setLevel(logging.ERROR)
 logging.getLogger("urllib3").setLevel(logging.ERROR)
 
-def download_missing_tracks_spotdl(tracks, download_dir):
-    # Initialize spotDL Spotify client
-    from credential import get_spotify_credentials
-    from spotdl.utils.spotify import SpotifyClient
-    client_id, client_secret = get_spotify_credentials()
-    
-    # Try to initialize SpotifyClient, but don't fail if already initialized
-    try:
-        SpotifyClient.init(client_id, client_secret, user_auth=False)
-    except Exception as e:
-        if "already been initialized" in str(e):
-            logger.info("🔄 SpotifyClient already initialized, reusing existing client")
-        else:
-            logger.warning(f"SpotifyClient initialization warning: {e}")
-    
+# Audio providers spotDL may use; the order per track comes from the provider scoreboard
+AUDIO_PROVIDERS = [p.strip() for p in os.environ.get('SPOTDL_AUDIO_PROVIDERS', 'youtube-music,youtube').split(',') if p.strip()]
+
+STALL_ERROR = "Stalled"
+CANCELLED_ERROR = "Cancelled"
+
+
+def get_spotdl_home(key=None):
     """
-    Downloads missing tracks using spotDL as a library, then tags MBIDs if missing.
-    Expects tracks as a list of dicts with at least 'title', 'artist', 'album', 'url'.
+    HOME directory for a spotDL subprocess. It lives under STATE_DIR so spotDL's temp
+    folder, where yt-dlp keeps its .part files, survives container restarts and
+    interrupted downloads can be continued by yt-dlp. Each track gets its own
+    directory so bytes received can be attributed to a single task.
+    """
+    from credential import get_state_dir
+    spotdl_home = os.environ.get('SPOTDL_HOME_DIR') or os.path.join(get_state_dir(), "spotdl-home")
+    if key:
+        spotdl_home = os.path.join(spotdl_home, key)
+    os.makedirs(spotdl_home, exist_ok=True)
+    return spotdl_home
+
+
+def _directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+def run_spotdl_supervised(cmd, spotdl_home, stall_seconds=None, timeout_seconds=None, abort=None):
+    """
+    Runs a spotDL command and kills it once it stops making progress. Progress is any
+    output line from spotDL or growth of the bytes under its HOME (where yt-dlp writes).
+    Setting the abort event (a threading.Event) kills it right away.
+    Returns (returncode, output_tail, status) with status 'exited', 'stalled', 'timeout' or 'cancelled'.
     """
-    if not tracks:
-        logger.info("No missing tracks to download.")
-        return
-    
-    logger.info(f"🎵 Starting download of {len(tracks)} missing tracks...")
-    os.makedirs(download_dir, exist_ok=True)
-    
-    # Prepare list of Spotify URLs for spotDL
-    track_urls = [t['url'] for t in tracks if t.get('url')]
-    if not track_urls:
-        logger.warning("No valid Spotify URLs to download.")
-        return
     import subprocess
-    import sys
-    # Write URLs to a temporary file
-    # Use spotDL as a library: create Song objects from URLs and download
-    from spotdl.types.song import Song
-    from spotdl.download.downloader import Downloader
-    from thefuzz import process
-    import shutil
-    from plex_utils import setup_plex_client, get_music_library
-    # Create Song objects using Song.from_url
-    song_objs = []
-    logger.info("🔍 Creating download objects for tracks...")
-    for i, t in enumerate(tracks, 1):
-        url = t.get('url')
-        if not url:
+    import threading
+    import time
+    from collections import deque
+    stall_seconds = stall_seconds or float(os.environ.get('SPOTDL_STALL_SECONDS', '120'))
+    timeout_seconds = timeout_seconds or float(os.environ.get('SPOTDL_TIMEOUT_SECONDS', '600'))
+    env = dict(os.environ)
+    env['HOME'] = spotdl_home
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+    output = deque(maxlen=50)
+    last_progress = [time.monotonic()]
+
+    def read_output():
+        for line in process.stdout:
+            output.append(line.rstrip())
+            last_progress[0] = time.monotonic()
+
+    reader = threading.Thread(target=read_output, daemon=True)
+    reader.start()
+    started = time.monotonic()
+    last_bytes = _directory_bytes(spotdl_home)
+    status = "exited"
+    abort = abort or threading.Event()
+    while process.poll() is None:
+        aborted = abort.wait(1)
+        now = time.monotonic()
+        current_bytes = _directory_bytes(spotdl_home)
+        if current_bytes != last_bytes:
+            last_bytes = current_bytes
+            last_progress[0] = now
+        if aborted:
+            status = "cancelled"
+        elif now - started > timeout_seconds:
+            status = "timeout"
+        elif now - last_progress[0] > stall_seconds:
+            status = "stalled"
+        else:
             continue
+        process.terminate()
         try:
-            song = Song.from_url(url)
-            song_objs.append(song)
-            logger.info(f"  [{i}/{len(tracks)}] ✅ {t.get('artist', 'Unknown')} - {t.get('title', 'Unknown')}")
-        except Exception as e:
-            logger.error(f"  [{i}/{len(tracks)}] ❌ Failed to create Song object for {url}: {e}")
-    
-    if not song_objs:
-        logger.warning("No valid Song objects to download.")
-        return
-    logger.info("🚀 Starting download process...")
-    threads = int(os.environ.get('SPOTDL_THREADS', '5'))
-    settings = {
-        'output': f'{download_dir}/{{artist}} - {{title}}.{{output-ext}}',
-        'format': 'mp3',
-        'bitrate': '320k',
-        'threads': threads,  # Download N songs at a time
-        'audio_providers': ['youtube', 'youtube-music'],
-        'lyrics_providers': ['genius', 'musixmatch'],
-        'overwrite': 'skip',
-        'scan_for_songs': True,  # Enable skipping of already-downloaded files
-        'print_errors': True,
-    }
-    import subprocess
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    logger.info(f"📥 Downloading {len(song_objs)} tracks using spotDL CLI subprocesses (threads={threads})...")
-    def download_one(track):
-        url = getattr(track, 'url', None)
-        artist = getattr(track, 'artist', None) or (track.artists[0] if hasattr(track, 'artists') and track.artists else 'Unknown')
-        title = getattr(track, 'name', None) or getattr(track, 'title', None) or 'Unknown'
-        if not url:
-            logger.error(f"No URL for track: {track}")
-            return (track, None)
-        output_path = f"{download_dir}/{artist} - {title}.mp3"
-        # Check if file already exists to avoid redownload
-        if os.path.exists(output_path):
-            logger.info(f"[spotDL] ⏭️ Skipped (exists): {artist} - {title}")
-            return (track, output_path)
-        cmd = [
-            "spotdl",
-            "download",
-            url,
-            "--output", f"{download_dir}/{{title}}.{{output-ext}}",
-            "--format", "mp3",
-            "--bitrate", "320k"
-        ]
-        logger.info(f"[spotDL] [START] {artist} - {title}")
-        try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
-            if result.returncode == 0:
-                # Find the actual downloaded file in download_dir
-                # spotDL sanitizes filenames, so we need to be more flexible in matching
-                import re
-                def sanitize_for_match(s):
-                    # Remove common problematic characters that spotDL removes/changes
-                    return re.sub(r'["\':?*<>|/\\]', '', s).strip()
-                
-                sanitized_title = sanitize_for_match(title.lower())
-                potential_files = []
-                
-                # First try: exact match with sanitized title
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        break
+    reader.join(timeout=5)
+    return process.returncode, "\n".join(output), status
+
+
+def download_track_spotdl(url, artist, title, download_dir, abort=None):
+    """
+    Downloads a single track with a supervised spotDL CLI subprocess.
+    Returns (file_path, error); file_path is the standardized '<artist> - <title>.mp3' path or None.
+    A task killed for making no progress returns an error starting with STALL_ERROR;
+    one killed through the abort event returns CANCELLED_ERROR.
+    """
+    import re
+    import time
+    import shutil
+    from spotify_utils import get_spotify_track_id_from_url
+    from provider_scoreboard import get_provider_scoreboard
+    output_path = f"{download_dir}/{artist} - {title}.mp3"
+    # Check if file already exists to avoid redownload
+    if os.path.exists(output_path):
+        logger.info(f"[spotDL] ⏭️ Skipped (exists): {artist} - {title}")
+        return output_path, None
+    cmd = [
+        "spotdl",
+        "download",
+        url,
+        "--output", f"{download_dir}/{{title}}.{{output-ext}}",
+        "--format", "mp3",
+        "--bitrate", "320k",
+    ]
+    scoreboard = get_provider_scoreboard()
+    providers = scoreboard.rank(AUDIO_PROVIDERS)
+    if providers:
+        cmd += ["--audio", *providers]
+    # spotDL only reports the overall outcome, so it is credited to the provider it tries first
+    provider = providers[0] if providers else "default"
+    spotdl_home = get_spotdl_home(get_spotify_track_id_from_url(url) or re.sub(r'[^A-Za-z0-9]', '_', url)[-64:])
+    logger.info(f"[spotDL] [START] {artist} - {title} (providers: {', '.join(providers) or 'default'})")
+    started = time.monotonic()
+    try:
+        returncode, output, status = run_spotdl_supervised(cmd, spotdl_home, abort=abort)
+        elapsed = time.monotonic() - started
+        if status == "cancelled":
+            # Says nothing about the provider, so the scoreboard is left alone
+            shutil.rmtree(spotdl_home, ignore_errors=True)
+            DOWNLOAD_SECONDS.labels('cancelled').observe(elapsed)
+            logger.info(f"[spotDL] 🛑 Cancelled: {artist} - {title}")
+            return None, CANCELLED_ERROR
+        if status == "stalled":
+            scoreboard.record_stall(provider)
+            scoreboard.record_download(provider, elapsed, 0, ok=False)
+            DOWNLOAD_SECONDS.labels('stalled').observe(elapsed)
+            logger.error(f"[spotDL] ❌ Stalled (no progress): {artist} - {title} [{provider}]")
+            return None, f"{STALL_ERROR}: no progress from {provider}"
+        if status == "timeout":
+            scoreboard.record_download(provider, elapsed, 0, ok=False)
+            DOWNLOAD_SECONDS.labels('timeout').observe(elapsed)
+            logger.error(f"[spotDL] ❌ Timeout: {artist} - {title}")
+            return None, "Timeout"
+        if returncode == 0:
+            # The task finished, so its partial files are no longer needed
+            shutil.rmtree(spotdl_home, ignore_errors=True)
+            # Find the actual downloaded file in download_dir
+            # spotDL sanitizes filenames, so we need to be more flexible in matching
+            def sanitize_for_match(s):
+                # Remove common problematic characters that spotDL removes/changes
+                return re.sub(r'["\':?*<>|/\\]', '', s).strip()
+
+            sanitized_title = sanitize_for_match(title.lower())
+            potential_files = []
+
+            # First try: exact match with sanitized title
+            for f in os.listdir(download_dir):
+                if f.endswith('.mp3') and sanitized_title in sanitize_for_match(f.lower()):
+                    potential_files.append(f)
+
+            # Second try: partial match with artist name
+            if not potential_files:
+                sanitized_artist = sanitize_for_match(artist.lower())
                 for f in os.listdir(download_dir):
-                    if f.endswith('.mp3') and sanitized_title in sanitize_for_match(f.lower()):
+                    if f.endswith('.mp3') and sanitized_artist in sanitize_for_match(f.lower()):
                         potential_files.append(f)
-                
-                # Second try: partial match with artist name
-                if not potential_files:
-                    sanitized_artist = sanitize_for_match(artist.lower())
-                    for f in os.listdir(download_dir):
-                        if f.endswith('.mp3') and sanitized_artist in sanitize_for_match(f.lower()):
-                            potential_files.append(f)
-                
-                if potential_files:
-                    # Pick the most recently created file if multiple matches
-                    actual_file_name = max(potential_files, key=lambda f: os.path.getctime(os.path.join(download_dir, f)))
-                    actual_file = os.path.join(download_dir, actual_file_name)
-                    # Rename to standardized format
-                    if actual_file != output_path:
-                        os.rename(actual_file, output_path)
-                    logger.info(f"[spotDL] ✅ Downloaded: {artist} - {title}")
-                    return (track, output_path)
-                else:
-                    logger.error(f"[spotDL] ❌ Downloaded but file not found: {artist} - {title}")
-                    logger.debug(f"Available files: {[f for f in os.listdir(download_dir) if f.endswith('.mp3')]}")
-                    return (track, None)
+
+            if potential_files:
+                # Pick the most recently created file if multiple matches
+                actual_file_name = max(potential_files, key=lambda f: os.path.getctime(os.path.join(download_dir, f)))
+                actual_file = os.path.join(download_dir, actual_file_name)
+                # Rename to standardized format
+                if actual_file != output_path:
+                    os.rename(actual_file, output_path)
+                size = os.path.getsize(output_path)
+                scoreboard.record_download(provider, elapsed, size, ok=True)
+                DOWNLOAD_SECONDS.labels('ok').observe(elapsed)
+                DOWNLOAD_BYTES.inc(size)
+                logger.info(f"[spotDL] ✅ Downloaded: {artist} - {title}")
+                return output_path, None
             else:
-                logger.error(f"[spotDL] ❌ Failed: {artist} - {title} | {result.stderr}")
-                return (track, None)
-        except subprocess.TimeoutExpired:
-            logger.error(f"[spotDL] ❌ Timeout: {artist} - {title}")
-            return (track, None)
-        except Exception as e:
-            logger.error(f"[spotDL] Exception: {artist} - {title} | {e}")
-            return (track, None)
+                DOWNLOAD_SECONDS.labels('failed').observe(elapsed)
+                logger.error(f"[spotDL] ❌ Downloaded but file not found: {artist} - {title}")
+                logger.debug(f"Available files: {[f for f in os.listdir(download_dir) if f.endswith('.mp3')]}")
+                return None, "Downloaded but file not found"
+        else:
+            scoreboard.record_download(provider, elapsed, 0, ok=False)
+            DOWNLOAD_SECONDS.labels('failed').observe(elapsed)
+            logger.error(f"[spotDL] ❌ Failed: {artist} - {title} | {output}")
+            return None, (output or "spotDL exited with an error").strip()[-500:]
+    except Exception as e:
+        logger.error(f"[spotDL] Exception: {artist} - {title} | {e}")
+        return None, str(e)
+
+
+def is_congestion_error(error):
+    """
+    True for failures that suggest we are pushing the provider too hard (timeouts,
+    throttling, connection errors) as opposed to a track simply not being available.
+    """
+    if not error:
+        return False
+    error = error.lower()
+    return any(marker in error for marker in (
+        'timeout', 'timed out', 'stalled', '429', 'too many requests', 'rate limit',
+        'connection', 'temporarily unavailable', '503',
+    ))
+
+
+def download_queue_items(items, job_id=None):
+    """
+    Downloads queue items through the process-wide download scheduler, recording each
+    state transition in the durable queue. Tasks that stall are requeued behind the
+    job's other tracks up to SPOTDL_STALL_RETRIES times. Tracks already being downloaded
+    for another job share that job's result instead of starting a second download.
+    Returns a list of (item, file_path) tuples; file_path is None for failed items.
+    """
+    from concurrent.futures import wait, FIRST_COMPLETED
+    from download_queue import get_download_queue, QUEUED, FETCHING, DOWNLOADED, FAILED
+    from download_scheduler import get_download_scheduler, get_inflight_registry
+    from job_logging import set_job_progress, add_job_progress
+    queue = get_download_queue()
+    scheduler = get_download_scheduler()
+    inflight = get_inflight_registry()
+    token = current_token()
+    max_stall_retries = int(os.environ.get('SPOTDL_STALL_RETRIES', '1'))
+    stall_retries = {}
+
+    def track_key(item):
+        return item.get('track_id') or item['url']
+
+    def download_one(item):
+        artist = item.get('artist') or 'Unknown'
+        title = item.get('title') or 'Unknown'
+        if item['state'] == DOWNLOADED and item.get('file_path') and os.path.exists(item['file_path']):
+            logger.info(f"[spotDL] ⏭️ Already downloaded: {artist} - {title}")
+            return (item, item['file_path'], False)
+        os.makedirs(item['download_dir'], exist_ok=True)
+        queue.update(item['id'], FETCHING)
+        file_path, error = download_track_spotdl(item['url'], artist, title, item['download_dir'],
+                                                 abort=inflight.abort_event(track_key(item)))
+        if file_path:
+            queue.update(item['id'], DOWNLOADED, file_path=file_path)
+            scheduler.record_outcome(True, os.path.getsize(file_path))
+            return (item, file_path, False)
+        if error == CANCELLED_ERROR:
+            queue.update(item['id'], FAILED, error=error)
+            return (item, None, False)
+        if is_congestion_error(error):
+            scheduler.record_outcome(False)
+        if error and error.startswith(STALL_ERROR) and stall_retries.get(item['id'], 0) < max_stall_retries:
+            stall_retries[item['id']] = stall_retries.get(item['id'], 0) + 1
+            queue.update(item['id'], QUEUED, error=error)
+            logger.info(f"[spotDL] 🔁 Requeued after stall: {artist} - {title}")
+            return (item, None, True)
+        queue.update(item['id'], FAILED, error=error)
+        return (item, None, False)
+
+    def submit(item, position):
+        # A track another job is already downloading is attached to, not fetched twice
+        future, attached = inflight.submit(
+            track_key(item),
+            lambda: scheduler.submit(job_id, position, download_one, item),
+            requester=job_id,
+        )
+        if attached:
+            logger.info(f"[spotDL] 🔗 Already downloading in another job: {item.get('artist')} - {item.get('title')}")
+        return future
 
     results = []
-    logger.info(f"[spotDL] Launching ThreadPoolExecutor with {threads} threads...")
-    with ThreadPoolExecutor(max_workers=threads) as executor:
-        future_to_track = {executor.submit(download_one, t): t for t in song_objs}
-        for future in as_completed(future_to_track):
-            track = future_to_track[future]
+    set_job_progress(downloads_total=len(items), downloaded=0, download_failed=0)
+    logger.info(f"[spotDL] Submitting {len(items)} downloads to the shared scheduler "
+                f"(concurrency={scheduler.concurrency}, already queued={scheduler.queue_depth()})...")
+    last_position = max((item.get('position') or 0 for item in items), default=0)
+    future_to_item = {submit(item, item.get('position') or 0): item for item in items}
+    while future_to_item:
+        # Wakes every second so a cancelled job stops waiting promptly
+        done, _ = wait(future_to_item, timeout=1, return_when=FIRST_COMPLETED)
+        if token is not None and token.cancelled:
+            # Downloads other jobs also wait for keep running, and so does their shared
+            # queue row; the rest are dropped from the scheduler queue or have their
+            # spotDL process killed
+            for item in future_to_item.values():
+                if inflight.detach(track_key(item), job_id):
+                    queue.update(item['id'], FAILED, error=CANCELLED_ERROR)
+            logger.info(f"[spotDL] 🛑 Cancelled {len(future_to_item)} unfinished downloads")
+            raise JobCancelled("Job cancelled")
+        for future in done:
+            item = future_to_item.pop(future)
             try:
-                result = future.result()
-                results.append(result)
+                _, file_path, requeue = future.result()
             except Exception as e:
                 logger.error(f"[spotDL] Exception in thread: {e}")
-                results.append((track, None))
+                queue.update(item['id'], FAILED, error=str(e))
+                results.append((item, None))
+                add_job_progress(download_failed=1)
+                continue
+            if requeue:
+                # Put the stalled track behind the rest of this job's tracks
+                last_position += 1
+                future_to_item[submit(item, last_position)] = item
+            else:
+                results.append((item, file_path))
+                add_job_progress(**({'downloaded': 1} if file_path else {'download_failed': 1}))
     success_count = sum(1 for _, path in results if path)
     fail_count = sum(1 for _, path in results if not path)
     logger.info(f"[spotDL] Download summary: {success_count} succeeded, {fail_count} failed.")
-    # Move each downloaded file to the correct Plex artist folder and trigger Plex scan
-    logger.info("📁 Organizing downloaded files into Plex library...")
-    plex = setup_plex_client()
-    music_library = get_music_library(plex)
-    plex_music_path = "/app/Songs"
-    # Get all artist folders in Plex music path
-    import re
-    def normalize(s):
-        return re.sub(r'[^a-z0-9 ]', '', s.lower()) if s else ''
-    artist_folders = [d for d in os.listdir(plex_music_path) if os.path.isdir(os.path.join(plex_music_path, d))]
+    return results
+
+
+def get_staging_dir(download_dir, plex_music_path="/app/Songs"):
+    """
+    Picks the directory downloads are written to. DOWNLOAD_STAGING_DIR wins if set;
+    otherwise, when download_dir is on a different filesystem than the library root,
+    files are staged in '<library>/.staging' so organizing them is a rename.
+    A .plexignore keeps Plex from indexing half-finished files in the staging folder.
+    """
+    staging_dir = os.environ.get('DOWNLOAD_STAGING_DIR')
+    if not staging_dir:
+        try:
+            os.makedirs(download_dir, exist_ok=True)
+            if os.stat(download_dir).st_dev == os.stat(plex_music_path).st_dev:
+                return download_dir
+        except OSError as e:
+            logger.warning(f"⚠️  Could not compare filesystems of {download_dir} and {plex_music_path}: {e}")
+            return download_dir
+        staging_dir = os.path.join(plex_music_path, ".staging")
+    try:
+        os.makedirs(staging_dir, exist_ok=True)
+        plexignore = os.path.join(staging_dir, ".plexignore")
+        if not os.path.exists(plexignore):
+            with open(plexignore, 'w') as f:
+                f.write("*\n")
+    except OSError as e:
+        logger.warning(f"⚠️  Could not create staging folder {staging_dir}, using {download_dir}: {e}")
+        return download_dir
+    if staging_dir != download_dir:
+        logger.info(f"📦 Staging downloads in {staging_dir} (same filesystem as the library)")
+    return staging_dir
+
+
+def move_into_library(src, dest):
+    """
+    Moves src to dest, replacing any existing file. On the same filesystem this is an
+    atomic rename; across filesystems the file is streamed to a temp file next to dest,
+    renamed into place and then the source is removed.
+    Returns the number of bytes copied (0 for a rename).
+    """
+    import errno
     import time
-    scan_triggered = False
+    import shutil
+    started = time.perf_counter()
+    try:
+        os.replace(src, dest)
+        FILE_MOVE_SECONDS.labels('rename').observe(time.perf_counter() - started)
+        FILE_MOVE_BYTES.labels('rename').inc(os.path.getsize(dest))
+        return 0
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    tmp_path = f"{dest}.partial"
+    try:
+        with open(src, 'rb') as fsrc, open(tmp_path, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+        shutil.copystat(src, tmp_path)
+        os.replace(tmp_path, dest)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    copied = os.path.getsize(dest)
+    os.unlink(src)
+    FILE_MOVE_SECONDS.labels('copy').observe(time.perf_counter() - started)
+    FILE_MOVE_BYTES.labels('copy').inc(copied)
+    return copied
+
+
+def organize_downloaded_files(results, plex_music_path="/app/Songs"):
+    """
+    Moves downloaded files into the Plex library. Items with a dest_dir go there; the rest
+    are fuzzy-matched to an existing artist folder or get a new one.
+    Returns (successful_moves, failed_moves, bytes_copied, moved_paths); bytes_copied counts
+    data that had to be copied across filesystems instead of renamed, and moved_paths are
+    the library files this call organized or found organized, for a targeted Plex scan.
+    """
+    from download_queue import get_download_queue, MOVED, FAILED
+    from download_scheduler import get_inflight_registry
+    from library_index import get_library_index, get_artist_folder_index
+    from job_logging import set_job_progress, add_job_progress
+    queue = get_download_queue()
+    inflight = get_inflight_registry()
+    library_index = get_library_index(plex_music_path)
+
+    artist_folders = get_artist_folder_index(plex_music_path)
     successful_moves = 0
     failed_moves = 0
+    bytes_copied = 0
+    moved_paths = []
+    set_job_progress(stage="organizing")
     for result in results:
         # Unpack tuple safely
         if isinstance(result, tuple) and len(result) == 2:
-            track, file_path = result
+            item, file_path = result
         else:
-            logger.error(f"❌ Invalid result entry (expected (track, file_path)): {result}")
+            logger.error(f"❌ Invalid result entry (expected (item, file_path)): {result}")
             failed_moves += 1
             continue
         if not file_path:
             failed_moves += 1
             continue
-        
-        # Extract artist and title from track object
-        artist = getattr(track, 'artist', None) or (track.artists[0] if hasattr(track, 'artists') and track.artists else 'Unknown')
-        title = getattr(track, 'name', None) or getattr(track, 'title', None) or 'Unknown'
-        
+
+        artist = item.get('artist')
+        title = item.get('title')
         if not artist or not title:
             logger.warning(f"⚠️  Skipping move for {file_path}: missing artist or title.")
+            queue.update(item['id'], FAILED, error="Missing artist or title")
             failed_moves += 1
             continue
-        # Fuzzy match artist folder
-        best_artist, score = process.extractOne(normalize(artist), [normalize(a) for a in artist_folders]) if artist_folders else (None, 0)
-        # Map normalized best_artist back to original folder name
-        best_artist_folder = None
-        if best_artist:
-            for folder in artist_folders:
-                if normalize(folder) == best_artist:
-                    best_artist_folder = folder
-                    break
-        if score < 90 or not best_artist_folder:
-            # If no good match, create a new folder for the artist
-            dest_folder = os.path.join(plex_music_path, artist)
-            if not os.path.exists(dest_folder):
-                try:
-                    os.makedirs(dest_folder)
-                    logger.info(f"📂 Created new artist folder: {artist}")
-                except Exception as e:
-                    logger.error(f"❌ Failed to create artist folder {dest_folder}: {e}")
-                    failed_moves += 1
-                    continue
+
+        if item.get('dest_dir'):
+            dest_folder = item['dest_dir']
+            os.makedirs(dest_folder, exist_ok=True)
         else:
-            dest_folder = os.path.join(plex_music_path, best_artist_folder)
+            # Exact or blocked fuzzy lookup of an existing artist folder
+            best_artist_folder = artist_folders.find(artist)
+            if not best_artist_folder:
+                # If no good match, create a new folder for the artist
+                dest_folder = os.path.join(plex_music_path, artist)
+                if not os.path.exists(dest_folder):
+                    try:
+                        os.makedirs(dest_folder, exist_ok=True)
+                        artist_folders.add(artist)
+                        logger.info(f"📂 Created new artist folder: {artist}")
+                    except Exception as e:
+                        logger.error(f"❌ Failed to create artist folder {dest_folder}: {e}")
+                        failed_moves += 1
+                        continue
+            else:
+                dest_folder = os.path.join(plex_music_path, best_artist_folder)
         dest_path = os.path.join(dest_folder, f"{artist} - {title}.mp3")
-        # Move and overwrite if exists
-        try:
-            if os.path.exists(file_path):
-                shutil.move(file_path, dest_path)
-                logger.info(f"✅ Moved: {artist} - {title}")
+        # Jobs sharing a track wait here so only one of them moves the file
+        with inflight.lock(item.get('track_id') or item['url']):
+            current = queue.get(item['id'])
+            if current and current['state'] == MOVED and current.get('dest_path') and os.path.exists(current['dest_path']):
+                logger.info(f"⏭️ Already organized by another job: {artist} - {title}")
                 successful_moves += 1
-                scan_triggered = True
-            else:
-                logger.error(f"❌ Source file not found: {file_path}")
+                moved_paths.append(current['dest_path'])
+                continue
+            # Move and overwrite if exists
+            try:
+                if os.path.exists(file_path):
+                    bytes_copied += move_into_library(file_path, dest_path)
+                    queue.update(item['id'], MOVED, dest_path=dest_path)
+                    library_index.add_file(dest_path, item)
+                    logger.info(f"✅ Moved: {artist} - {title}")
+                    successful_moves += 1
+                    moved_paths.append(dest_path)
+                    add_job_progress(moved=1, bytes_moved=os.path.getsize(dest_path))
+                else:
+                    logger.error(f"❌ Source file not found: {file_path}")
+                    queue.update(item['id'], FAILED, error="Source file not found")
+                    failed_moves += 1
+            except Exception as e:
+                logger.error(f"❌ Failed to move {file_path} to {dest_path}: {e}")
                 failed_moves += 1
-        except Exception as e:
-            logger.error(f"❌ Failed to move {file_path} to {dest_path}: {e}")
-            failed_moves += 1
-            continue
-    
-    # After all moves, trigger and track Plex scan
-    logger.info(f"📊 Download Summary: {successful_moves} successful, {failed_moves} failed")
-    if scan_triggered:
-        try:
-            section = music_library
-            section.update()
-            logger.info("🔄 Triggered Plex library scan. Waiting for scan to complete...")
-            # Poll for scan completion
-            while getattr(section, 'refreshing', False):
-                logger.info("📡 Plex scan in progress...")
-                time.sleep(5)
-            logger.info("✅ Plex scan complete. Library updated successfully!")
-        except Exception as e:
-            logger.error(f"❌ Failed to trigger or track Plex scan: {e}")
+                continue
+    add_job_progress(bytes_copied=bytes_copied)
+    if bytes_copied:
+        logger.info(f"📦 Copied {bytes_copied / (1024 * 1024):.1f} MB across filesystems while organizing")
+    return successful_moves, failed_moves, bytes_copied, moved_paths
+
+
+def trigger_plex_scan(music_library, paths, plex_music_path="/app/Songs"):
+    """
+    Requests a Plex scan of the folders holding paths and waits for it to complete.
+    Requests from concurrent jobs are merged into one scan by the scan coordinator.
+    Returns True once Plex reports the scan finished, False on error or timeout.
+    """
+    from plex_scan import get_scan_coordinator
+    from job_logging import set_job_progress
+    set_job_progress(stage="scanning")
+    try:
+        return get_scan_coordinator().request(music_library, paths, plex_music_path)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Failed to trigger or track Plex scan: {e}")
+        return False
+
+
+def download_and_organize(tracks, download_dir, job_id=None, plex_music_path="/app/Songs", dest_dir=None):
+    """
+    Downloads tracks missing from Plex and moves them into the library. Tracks already
+    in the music folder are skipped, the rest go through the durable queue and the
+    download scheduler, and the folders that received files are scanned in Plex.
+    Items with dest_dir are moved there. Runs in the process that owns the download
+    scheduler; sync workers reach it through fetch_missing_tracks. Returns
+    (successful_moves, failed_moves, bytes_copied, moved_paths).
+    """
+    from download_queue import get_download_queue
+    from library_index import get_library_index
+    from plex_utils import setup_plex_client, get_music_library
+    # Files already in the music folder may just not be scanned by Plex yet, so
+    # their folders are scanned together with the downloads
+    tracks, on_disk = get_library_index(plex_music_path).split_missing(tracks)
+    if not tracks:
+        logger.info("✅ All missing tracks are already in the music folder, scanning them in Plex.")
+        trigger_plex_scan(get_music_library(setup_plex_client()), on_disk, plex_music_path)
+        return 0, 0, 0, []
+    download_dir = get_staging_dir(download_dir, plex_music_path)
+    items = get_download_queue().enqueue(tracks, download_dir, job_id=job_id, dest_dir=dest_dir)
+    logger.info(f"🗂️  Queued {len(items)} tracks for download")
+    logger.info(f"📥 Downloading {len(items)} tracks using spotDL CLI subprocesses...")
+    results = download_queue_items(items, job_id=job_id)
+    # Move each downloaded file to the correct Plex artist folder and trigger Plex scan
+    logger.info("📁 Organizing downloaded files into Plex library...")
+    successful_moves, failed_moves, bytes_copied, moved_paths = organize_downloaded_files(results, plex_music_path)
+
+    # After all moves, scan the folders that received files and wait for Plex
+    logger.info(f"📊 Download Summary: {successful_moves} successful, {failed_moves} failed, "
+                f"{bytes_copied} bytes copied across filesystems")
+    if moved_paths or on_disk:
+        trigger_plex_scan(get_music_library(setup_plex_client()), moved_paths + on_disk, plex_music_path)
     else:
         logger.info("ℹ️  No files were moved, skipping Plex scan.")
+    return successful_moves, failed_moves, bytes_copied, moved_paths
+
 
+def fetch_missing_tracks(tracks, download_dir, job_id=None, plex_music_path="/app/Songs", dest_dir=None):
+    """
+    Runs download_and_organize where downloads live: in the API process when called
+    from a sync worker, so all jobs share one download scheduler, otherwise here.
+    """
+    from download_service import get_download_client
+    client = get_download_client()
+    if client is None:
+        return download_and_organize(tracks, download_dir, job_id=job_id, plex_music_path=plex_music_path,
+                                     dest_dir=dest_dir)
+    return tuple(client.run(job_id, tracks=tracks, download_dir=download_dir, plex_music_path=plex_music_path,
+                            dest_dir=dest_dir))
 
-def download_missing_artist_tracks_spotdl(artist_url, download_dir):
+
+def resume_pending_downloads(items=None):
+    """
+    Picks up download queue items left queued or in flight by a previous process,
+    downloads and organizes them, then triggers a Plex scan. items, when given, are
+    the queue items to resume (already recovered by the caller).
+    """
+    from download_queue import get_download_queue
+    if items is None:
+        queue = get_download_queue()
+        recovered = queue.recover_interrupted()
+        items = queue.pending()
+        if recovered:
+            logger.info(f"♻️  {recovered} downloads were interrupted mid-fetch")
+    if not items:
+        return
+    logger.info(f"♻️  Resuming {len(items)} pending downloads...")
+    results = download_queue_items(items, job_id="resume")
+    successful_moves, failed_moves, bytes_copied, moved_paths = organize_downloaded_files(results)
+    logger.info(f"📊 Resume Summary: {successful_moves} successful, {failed_moves} failed, "
+                f"{bytes_copied} bytes copied across filesystems")
+    if moved_paths:
+        from plex_utils import setup_plex_client, get_music_library
+        trigger_plex_scan(get_music_library(setup_plex_client()), moved_paths)
+
+
+def download_missing_tracks_spotdl(tracks, download_dir, job_id=None):
+    # Initialize spotDL Spotify client
+    from credential import get_spotify_credentials
+    from spotdl.utils.spotify import SpotifyClient
+    client_id, client_secret = get_spotify_credentials()
+    
+    # Try to initialize SpotifyClient, but don't fail if already initialized
+    try:
+        SpotifyClient.init(client_id, client_secret, user_auth=False)
+    except Exception as e:
+        if "already been initialized" in str(e):
+            logger.info("🔄 SpotifyClient already initialized, reusing existing client")
+        else:
+            logger.warning(f"SpotifyClient initialization warning: {e}")
+    
+    """
+    Downloads missing tracks using spotDL, then organizes them into the Plex library.
+    Expects tracks as a list of dicts with at least 'title', 'artist', 'album', 'url'.
+    Every track is recorded in the durable download queue so an interrupted run can be resumed.
+    """
+    if not tracks:
+        logger.info("No missing tracks to download.")
+        return
+    
+    logger.info(f"🎵 Starting download of {len(tracks)} missing tracks...")
+    
+    # Prepare list of Spotify URLs for spotDL
+    track_urls = [t['url'] for t in tracks if t.get('url')]
+    if not track_urls:
+        logger.warning("No valid Spotify URLs to download.")
+        return
+    fetch_missing_tracks(tracks, download_dir, job_id=job_id)
+
+
+def download_missing_artist_tracks_spotdl(artist_url, download_dir, job_id=None):
     """
     Downloads missing tracks for a specific artist using spotDL, then organizes into Plex library.
     Expects artist_url as a Spotify artist URL.
@@ -318,7 +675,8 @@ def download_missing_artist_tracks_spotdl(artist_url, download_dir):
         limit = 50
         
         while True:
-            response = sp.artist_albums(artist_id, album_type='album,single', limit=limit, offset=offset)
+            with SPOTIFY_PAGE_SECONDS.labels('artist_albums').time():
+                response = sp.artist_albums(artist_id, album_type='album,single', limit=limit, offset=offset)
             if not response or not response.get('items'):
                 break
             albums.extend(response['items'])
@@ -331,12 +689,15 @@ def download_missing_artist_tracks_spotdl(artist_url, download_dir):
         # Get all tracks from all albums (filter by album artist)
         all_tracks = []
         for album in albums:
+            check_cancelled()
             try:
-                album_details = sp.album(album['id'])
+                with SPOTIFY_PAGE_SECONDS.labels('album').time():
+                    album_details = sp.album(album['id'])
                 # Only include tracks where the artist is the album artist
                 album_artists = [artist['name'] for artist in album_details.get('artists', [])]
                 if artist_name in album_artists:
-                    tracks = sp.album_tracks(album['id'])
+                    with SPOTIFY_PAGE_SECONDS.labels('album_tracks').time():
+                        tracks = sp.album_tracks(album['id'])
                     for track in tracks['items']:
                         track_info = {
                             'title': track['name'],
@@ -353,6 +714,8 @@ def download_missing_artist_tracks_spotdl(artist_url, download_dir):
                 continue
         
         logger.info(f"🎵 Found {len(all_tracks)} total tracks by {artist_name}")
+        from job_logging import set_job_progress, add_job_progress
+        set_job_progress(stage="matching", tracks_total=len(all_tracks), tracks_matched=0, tracks_missing=0)
         
         if not all_tracks:
             logger.warning("No tracks found for this artist")
@@ -393,6 +756,7 @@ def download_missing_artist_tracks_spotdl(artist_url, download_dir):
             
             # Use the same multi-stage search logic as playlist sync
             for i, track in enumerate(all_tracks, 1):
+                check_cancelled()
                 spotify_track = {
                     'title': track['title'],
                     'artist': track['artist'],
@@ -407,11 +771,15 @@ def download_missing_artist_tracks_spotdl(artist_url, download_dir):
                     # Track exists in Plex, add to existing tracks set
                     plex_track_titles.add(track['title'].lower().strip())
                     logger.info(f"  [{i}/{len(all_tracks)}] ✅ Found in Plex: {plex_match.title} by {getattr(plex_match, 'grandparentTitle', 'Unknown')}")
+                    add_job_progress(tracks_matched=1)
                 else:
                     logger.info(f"  [{i}/{len(all_tracks)}] ❌ Not found in Plex")
+                    add_job_progress(tracks_missing=1)
             
             logger.info(f"📊 Found {len(plex_track_titles)} existing tracks in Plex")
             
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error searching Plex: {e}")
             plex_track_titles = set()
@@ -429,120 +797,7 @@ def download_missing_artist_tracks_spotdl(artist_url, download_dir):
             logger.info("✅ All tracks already exist in Plex library")
             return
         
-        # Use the same download logic as the playlist function
-        from spotdl.types.song import Song
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-        import subprocess
-        
-        # Create Song objects for missing tracks
-        song_objs = []
-        logger.info("🔍 Creating download objects for missing tracks...")
-        for i, track in enumerate(missing_tracks, 1):
-            url = track.get('url')
-            if not url:
-                continue
-            try:
-                song = Song.from_url(url)
-                song_objs.append(song)
-                logger.info(f"  [{i}/{len(missing_tracks)}] ✅ {track['artist']} - {track['title']}")
-            except Exception as e:
-                logger.error(f"  [{i}/{len(missing_tracks)}] ❌ Failed to create Song object for {url}: {e}")
-        
-        if not song_objs:
-            logger.warning("No valid Song objects to download.")
-            return
-        
-        logger.info("🚀 Starting download process...")
-        threads = int(os.environ.get('SPOTDL_THREADS', '5'))
-        
-        def download_one_artist_track(track):
-            url = getattr(track, 'url', None)
-            artist = getattr(track, 'artist', None) or (track.artists[0] if hasattr(track, 'artists') and track.artists else 'Unknown')
-            title = getattr(track, 'name', None) or getattr(track, 'title', None) or 'Unknown'
-            if not url:
-                logger.error(f"No URL for track: {track}")
-                return (track, None)
-            output_path = f"{download_dir}/{artist} - {title}.mp3"
-            # Check if file already exists to avoid redownload
-            if os.path.exists(output_path):
-                logger.info(f"[spotDL] ⏭️ Skipped (exists): {artist} - {title}")
-                return (track, output_path)
-            cmd = [
-                "spotdl",
-                "download",
-                url,
-                "--output", f"{download_dir}/{{title}}.{{output-ext}}",
-                "--format", "mp3",
-                "--bitrate", "320k"
-            ]
-            logger.info(f"[spotDL] [START] {artist} - {title}")
-            try:
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
-                if result.returncode == 0:
-                    # Find the actual downloaded file in download_dir
-                    # spotDL sanitizes filenames, so we need to be more flexible in matching
-                    import re
-                    def sanitize_for_match(s):
-                        # Remove common problematic characters that spotDL removes/changes
-                        return re.sub(r'["\':?*<>|/\\]', '', s).strip()
-                    
-                    sanitized_title = sanitize_for_match(title.lower())
-                    potential_files = []
-                    
-                    # First try: exact match with sanitized title
-                    for f in os.listdir(download_dir):
-                        if f.endswith('.mp3') and sanitized_title in sanitize_for_match(f.lower()):
-                            potential_files.append(f)
-                    
-                    # Second try: partial match with artist name
-                    if not potential_files:
-                        sanitized_artist = sanitize_for_match(artist.lower())
-                        for f in os.listdir(download_dir):
-                            if f.endswith('.mp3') and sanitized_artist in sanitize_for_match(f.lower()):
-                                potential_files.append(f)
-                    
-                    if potential_files:
-                        # Pick the most recently created file if multiple matches
-                        actual_file_name = max(potential_files, key=lambda f: os.path.getctime(os.path.join(download_dir, f)))
-                        actual_file = os.path.join(download_dir, actual_file_name)
-                        # Rename to standardized format
-                        if actual_file != output_path:
-                            os.rename(actual_file, output_path)
-                        logger.info(f"[spotDL] ✅ Downloaded: {artist} - {title}")
-                        return (track, output_path)
-                    else:
-                        logger.error(f"[spotDL] ❌ Downloaded but file not found: {artist} - {title}")
-                        logger.debug(f"Available files: {[f for f in os.listdir(download_dir) if f.endswith('.mp3')]}")
-                        return (track, None)
-                else:
-                    logger.error(f"[spotDL] ❌ Failed: {artist} - {title} | {result.stderr}")
-                    return (track, None)
-            except subprocess.TimeoutExpired:
-                logger.error(f"[spotDL] ❌ Timeout: {artist} - {title}")
-                return (track, None)
-            except Exception as e:
-                logger.error(f"[spotDL] Exception: {artist} - {title} | {e}")
-                return (track, None)
-
-        results = []
-        logger.info(f"[spotDL] Launching ThreadPoolExecutor with {threads} threads...")
-        with ThreadPoolExecutor(max_workers=threads) as executor:
-            future_to_track = {executor.submit(download_one_artist_track, t): t for t in song_objs}
-            for future in as_completed(future_to_track):
-                track = future_to_track[future]
-                try:
-                    result = future.result()
-                    results.append(result)
-                except Exception as e:
-                    logger.error(f"[spotDL] Exception in thread: {e}")
-                    results.append((track, None))
-        
-        success_count = sum(1 for _, path in results if path)
-        fail_count = sum(1 for _, path in results if not path)
-        logger.info(f"[spotDL] Download summary: {success_count} succeeded, {fail_count} failed.")
-        
         # Organize downloaded files into artist folder in Plex library
-        logger.info(f"📁 Organizing downloaded files into Plex library for artist: {artist_name}")
         plex_music_path = "/app/Songs"
         artist_folder = os.path.join(plex_music_path, artist_name)
         
@@ -555,60 +810,11 @@ def download_missing_artist_tracks_spotdl(artist_url, download_dir):
                 logger.error(f"❌ Failed to create artist folder {artist_folder}: {e}")
                 return
         
-        successful_moves = 0
-        failed_moves = 0
-        scan_triggered = False
-        
-        for result in results:
-            # Unpack tuple safely
-            if isinstance(result, tuple) and len(result) == 2:
-                track, file_path = result
-            else:
-                logger.error(f"❌ Invalid result entry (expected (track, file_path)): {result}")
-                failed_moves += 1
-                continue
-            if not file_path:
-                failed_moves += 1
-                continue
-            
-            # Extract artist and title from track object
-            track_artist = getattr(track, 'artist', None) or (track.artists[0] if hasattr(track, 'artists') and track.artists else 'Unknown')
-            track_title = getattr(track, 'name', None) or getattr(track, 'title', None) or 'Unknown'
-            
-            dest_path = os.path.join(artist_folder, f"{track_artist} - {track_title}.mp3")
-            
-            # Move and overwrite if exists
-            try:
-                if os.path.exists(file_path):
-                    shutil.move(file_path, dest_path)
-                    logger.info(f"✅ Moved: {track_artist} - {track_title}")
-                    successful_moves += 1
-                    scan_triggered = True
-                else:
-                    logger.error(f"❌ Source file not found: {file_path}")
-                    failed_moves += 1
-            except Exception as e:
-                logger.error(f"❌ Failed to move {file_path} to {dest_path}: {e}")
-                failed_moves += 1
-                continue
-        
-        # After all moves, trigger and track Plex scan
-        logger.info(f"📊 Artist Download Summary: {successful_moves} successful, {failed_moves} failed")
-        if scan_triggered:
-            try:
-                import time
-                section = music_library
-                section.update()
-                logger.info("🔄 Triggered Plex library scan. Waiting for scan to complete...")
-                # Poll for scan completion
-                while getattr(section, 'refreshing', False):
-                    logger.info("📡 Plex scan in progress...")
-                    time.sleep(5)
-                logger.info(f"✅ Plex scan complete. Artist {artist_name} library updated successfully!")
-            except Exception as e:
-                logger.error(f"❌ Failed to trigger or track Plex scan: {e}")
-        else:
-            logger.info("ℹ️  No files were moved, skipping Plex scan.")
+        # Use the same queued download logic as the playlist function
+        fetch_missing_tracks(missing_tracks, download_dir, job_id=job_id, plex_music_path=plex_music_path,
+                             dest_dir=artist_folder)
             
+    except JobCancelled:
+        raise
     except Exception as e:
         logger.error(f"❌ Error during artist sync: {e}", exc_info=True)
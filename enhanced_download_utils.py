@@ -3,15 +3,17 @@ import logging
 import time
 import re
 from typing import List, Dict, Tuple, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 import musicbrainzngs
 from mutagen.easyid3 import EasyID3
 from mutagen.id3 import ID3, TXXX
 from spotdl.download.downloader import Downloader
 from spotdl.types.song import Song
-from ytmusicapi import YTMusic
+from ytmusic_cache import get_ytmusic, get_youtube_search_cache
 from thefuzz import fuzz, process
 import shutil
+from download_scheduler import get_download_scheduler
+from provider_scoreboard import get_provider_scoreboard
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -26,7 +28,11 @@ class EnhancedDownloader:
     def __init__(self, download_dir: str = "/app/downloads", max_workers: int = 3):
         self.download_dir = download_dir
         self.max_workers = max_workers
-        self.ytmusic = YTMusic()
+        # Shared with every other downloader in the process, so all downloads draw on
+        # one adaptive (AIMD) budget; max_workers no longer sizes it (see SPOTDL_THREADS)
+        self.scheduler = get_download_scheduler()
+        self.ytmusic = get_ytmusic()
+        self.search_cache = get_youtube_search_cache()
         
         # Initialize spotDL
         from credential import get_spotify_credentials
@@ -56,20 +62,32 @@ class EnhancedDownloader:
         temp_string = re.sub(r"\s+", " ", raw_string)
         return temp_string.strip()
 
+    def _remember_match(self, artist: str, title: str, item: Dict) -> str:
+        """Cache the chosen search result and return its watch URL"""
+        self.search_cache.put(artist, title, item['videoId'], item.get('title'))
+        return f"https://www.youtube.com/watch?v={item['videoId']}"
+
     def enhanced_youtube_search(self, artist: str, title: str) -> Optional[str]:
-        """Enhanced YouTube search with multiple fallback strategies"""
+        """Enhanced YouTube search with multiple fallback strategies, backed by the persistent search cache"""
         try:
+            cached = self.search_cache.get(artist, title)
+            if cached:
+                logger.info(f"💾 Cached YouTube match: {cached['video_title'] or cached['video_id']}")
+                return f"https://www.youtube.com/watch?v={cached['video_id']}"
+            
             cleaned_artist = self.string_cleaner(artist).lower()
             cleaned_title = self.string_cleaner(title).lower()
             
             logger.info(f"🔍 Searching YouTube for: {artist} - {title}")
             
             # Primary search
+            search_started = time.monotonic()
             search_results = self.ytmusic.search(
                 query=f"{artist} {title}", 
                 filter="songs", 
                 limit=10
             )
+            get_provider_scoreboard().record_search('youtube-music', time.monotonic() - search_started)
             
             if not search_results:
                 logger.warning(f"⚠️  No YouTube results found for: {artist} - {title}")
@@ -79,7 +97,7 @@ class EnhancedDownloader:
             for item in search_results:
                 cleaned_youtube_title = self.string_cleaner(item["title"]).lower()
                 if cleaned_title in cleaned_youtube_title:
-                    youtube_url = f"https://www.youtube.com/watch?v={item['videoId']}"
+                    youtube_url = self._remember_match(artist, title, item)
                     logger.info(f"✅ Exact match found: {item['title']}")
                     return youtube_url
             
@@ -106,7 +124,7 @@ class EnhancedDownloader:
                     best_match = item
             
             if best_match:
-                youtube_url = f"https://www.youtube.com/watch?v={best_match['videoId']}"
+                youtube_url = self._remember_match(artist, title, best_match)
                 logger.info(f"✅ Fuzzy match found (score: {best_score:.1f}): {best_match['title']}")
                 return youtube_url
             
@@ -116,7 +134,7 @@ class EnhancedDownloader:
                 if top_search_results:
                     top_result = top_search_results[0]
                     if top_result.get("category") == "Top result" or top_result.get("resultType") in ["song", "video"]:
-                        youtube_url = f"https://www.youtube.com/watch?v={top_result['videoId']}"
+                        youtube_url = self._remember_match(artist, title, top_result)
                         logger.info(f"📍 Using top result: {top_result['title']}")
                         return youtube_url
             except Exception as e:
@@ -125,7 +143,7 @@ class EnhancedDownloader:
             # Strategy 4: Best available fallback
             if search_results:
                 fallback = search_results[0]
-                youtube_url = f"https://www.youtube.com/watch?v={fallback['videoId']}"
+                youtube_url = self._remember_match(artist, title, fallback)
                 logger.warning(f"⚠️  Using fallback result: {fallback['title']}")
                 return youtube_url
             
@@ -174,13 +192,14 @@ class EnhancedDownloader:
                 song.download_url = youtube_url
                 
                 downloader = Downloader(self.spotdl_settings)
-                result_path = downloader.download_song(song)
+                _, result_path = downloader.download_song(song)
                 
                 if result_path:
+                    self.scheduler.record_outcome(True, os.path.getsize(result_path))
                     msg = f"✅ [{track_index}/{total_tracks}] Downloaded: {artist} - {title}"
                     logger.info(msg)
                     print(msg)
-                    return True, f"Successfully downloaded: {filename}", result_path
+                    return True, f"Successfully downloaded: {filename}", str(result_path)
                 else:
                     msg = f"❌ [{track_index}/{total_tracks}] Download failed: {artist} - {title}"
                     logger.error(msg)
@@ -188,6 +207,9 @@ class EnhancedDownloader:
                     return False, f"SpotDL download failed for: {artist} - {title}", None
                     
             except Exception as e:
+                from download_utils import is_congestion_error
+                if is_congestion_error(str(e)):
+                    self.scheduler.record_outcome(False)
                 msg = f"❌ [{track_index}/{total_tracks}] SpotDL error for {artist} - {title}: {e}"
                 logger.error(msg)
                 print(msg)
@@ -207,7 +229,7 @@ class EnhancedDownloader:
         
         total_tracks = len(tracks)
         logger.info(f"🚀 Starting enhanced download of {total_tracks} missing tracks...")
-        logger.info(f"⚙️  Using {self.max_workers} parallel workers")
+        logger.info(f"⚙️  Using {self.scheduler.concurrency} parallel workers (adaptive)")
         
         results = {
             "total": total_tracks,
@@ -217,47 +239,45 @@ class EnhancedDownloader:
             "downloaded_files": []
         }
         
-        # Process tracks with ThreadPoolExecutor for controlled parallelism
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Submit all download tasks
-            future_to_track = {
-                executor.submit(self.download_single_track, track, i+1, total_tracks): (track, i+1)
-                for i, track in enumerate(tracks)
-            }
-            
-            # Process completed downloads
-            for future in as_completed(future_to_track):
-                track, track_index = future_to_track[future]
-                try:
-                    success, message, file_path = future.result()
-                    
-                    result_entry = {
-                        "track": f"{track.get('artist', 'Unknown')} - {track.get('title', 'Unknown')}",
-                        "success": success,
-                        "message": message,
-                        "file_path": file_path
-                    }
-                    results["results"].append(result_entry)
-                    
-                    if success:
-                        results["successful"] += 1
-                        if file_path:
-                            results["downloaded_files"].append(file_path)
-                    else:
-                        results["failed"] += 1
-                        
-                except Exception as e:
-                    msg = f"❌ Task execution failed for track {track_index}: {e}"
-                    logger.error(msg)
-                    print(msg)
-                    results["failed"] += 1
-                    results["results"].append({
-                        "track": f"{track.get('artist', 'Unknown')} - {track.get('title', 'Unknown')}",
-                        "success": False,
-                        "message": f"Task execution error: {str(e)}",
-                        "file_path": None
-                    })
+        # Submit all download tasks to the adaptive scheduler for controlled parallelism
+        future_to_track = {
+            self.scheduler.submit(None, i, self.download_single_track, track, i+1, total_tracks): (track, i+1)
+            for i, track in enumerate(tracks)
+        }
         
+        # Process completed downloads
+        for future in as_completed(future_to_track):
+            track, track_index = future_to_track[future]
+            try:
+                success, message, file_path = future.result()
+                
+                result_entry = {
+                    "track": f"{track.get('artist', 'Unknown')} - {track.get('title', 'Unknown')}",
+                    "success": success,
+                    "message": message,
+                    "file_path": file_path
+                }
+                results["results"].append(result_entry)
+                
+                if success:
+                    results["successful"] += 1
+                    if file_path:
+                        results["downloaded_files"].append(file_path)
+                else:
+                    results["failed"] += 1
+                    
+            except Exception as e:
+                msg = f"❌ Task execution failed for track {track_index}: {e}"
+                logger.error(msg)
+                print(msg)
+                results["failed"] += 1
+                results["results"].append({
+                    "track": f"{track.get('artist', 'Unknown')} - {track.get('title', 'Unknown')}",
+                    "success": False,
+                    "message": f"Task execution error: {str(e)}",
+                    "file_path": None
+                })
+    
         # Summary
         summary_msgs = [
             f"📊 Download Summary:",
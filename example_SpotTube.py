@@ -7,7 +7,7 @@ import threading
 import concurrent.futures
 import yt_dlp
 from thefuzz import fuzz
-from ytmusicapi import YTMusic
+from ytmusic_cache import get_ytmusic, get_youtube_search_cache
 from flask import Flask, render_template
 from flask_socketio import SocketIO
 import spotipy
@@ -196,7 +196,7 @@ class DataHandler:
 
     def find_youtube_link_and_download(self, song):
         try:
-            self.ytmusic = YTMusic()
+            self.ytmusic = get_ytmusic()
             artist = song["Artist"]
             title = song["Title"]
             cleaned_artist = self.string_cleaner(artist).lower()
@@ -204,38 +204,45 @@ class DataHandler:
             folder = song["Folder"]
 
             found_link = None
-            search_results = self.ytmusic.search(query=artist + " " + title, filter="songs", limit=5)
-
-            for item in search_results:
-                cleaned_youtube_title = self.string_cleaner(item["title"]).lower()
-                if cleaned_title in cleaned_youtube_title:
-                    found_link = "https://www.youtube.com/watch?v=" + item["videoId"]
-                    break
+            search_cache = get_youtube_search_cache()
+            cached = search_cache.get(artist, title)
+            if cached:
+                found_link = "https://www.youtube.com/watch?v=" + cached["video_id"]
             else:
-                # Try again but check for a partial match
+                search_results = self.ytmusic.search(query=artist + " " + title, filter="songs", limit=5)
+
                 for item in search_results:
                     cleaned_youtube_title = self.string_cleaner(item["title"]).lower()
-                    cleaned_youtube_artists = ", ".join(self.string_cleaner(x["name"]).lower() for x in item["artists"])
-
-                    title_ratio = 100 if all(word in cleaned_title for word in cleaned_youtube_title.split()) else fuzz.ratio(cleaned_title, cleaned_youtube_title)
-                    artist_ratio = 100 if cleaned_artist in cleaned_youtube_artists else fuzz.ratio(cleaned_artist, cleaned_youtube_artists)
-
-                    if title_ratio >= 90 and artist_ratio >= 90:
+                    if cleaned_title in cleaned_youtube_title:
                         found_link = "https://www.youtube.com/watch?v=" + item["videoId"]
                         break
                 else:
-                    # Default to first result if Top result is not found
-                    found_link = "https://www.youtube.com/watch?v=" + search_results[0]["videoId"]
-
-                    # Search for Top result specifically
-                    top_search_results = self.ytmusic.search(query=cleaned_title, limit=5)
-                    cleaned_youtube_title = self.string_cleaner(top_search_results[0]["title"]).lower()
-                    if "Top result" in top_search_results[0]["category"] and top_search_results[0]["resultType"] == "song" or top_search_results[0]["resultType"] == "video":
-                        cleaned_youtube_artists = ", ".join(self.string_cleaner(x["name"]).lower() for x in top_search_results[0]["artists"])
-                        title_ratio = 100 if cleaned_title in cleaned_youtube_title else fuzz.ratio(cleaned_title, cleaned_youtube_title)
+                    # Try again but check for a partial match
+                    for item in search_results:
+                        cleaned_youtube_title = self.string_cleaner(item["title"]).lower()
+                        cleaned_youtube_artists = ", ".join(self.string_cleaner(x["name"]).lower() for x in item["artists"])
+
+                        title_ratio = 100 if all(word in cleaned_title for word in cleaned_youtube_title.split()) else fuzz.ratio(cleaned_title, cleaned_youtube_title)
                         artist_ratio = 100 if cleaned_artist in cleaned_youtube_artists else fuzz.ratio(cleaned_artist, cleaned_youtube_artists)
-                        if (title_ratio >= 90 and artist_ratio >= 40) or (title_ratio >= 40 and artist_ratio >= 90):
-                            found_link = "https://www.youtube.com/watch?v=" + top_search_results[0]["videoId"]
+
+                        if title_ratio >= 90 and artist_ratio >= 90:
+                            found_link = "https://www.youtube.com/watch?v=" + item["videoId"]
+                            break
+                    else:
+                        # Default to first result if Top result is not found
+                        found_link = "https://www.youtube.com/watch?v=" + search_results[0]["videoId"]
+
+                        # Search for Top result specifically
+                        top_search_results = self.ytmusic.search(query=cleaned_title, limit=5)
+                        cleaned_youtube_title = self.string_cleaner(top_search_results[0]["title"]).lower()
+                        if "Top result" in top_search_results[0]["category"] and top_search_results[0]["resultType"] == "song" or top_search_results[0]["resultType"] == "video":
+                            cleaned_youtube_artists = ", ".join(self.string_cleaner(x["name"]).lower() for x in top_search_results[0]["artists"])
+                            title_ratio = 100 if cleaned_title in cleaned_youtube_title else fuzz.ratio(cleaned_title, cleaned_youtube_title)
+                            artist_ratio = 100 if cleaned_artist in cleaned_youtube_artists else fuzz.ratio(cleaned_artist, cleaned_youtube_artists)
+                            if (title_ratio >= 90 and artist_ratio >= 40) or (title_ratio >= 40 and artist_ratio >= 90):
+                                found_link = "https://www.youtube.com/watch?v=" + top_search_results[0]["videoId"]
+                if found_link:
+                    search_cache.put(artist, title, found_link.split("v=", 1)[1])
 
         except Exception as e:
             self.logger.error(f"Error downloading song: {title}. Error message: {e}")
@@ -0,0 +1,75 @@
+import threading
+from typing import Dict, Optional
+from job_logging import current_job_id
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been cancelled."""
+
+
+class CancellationToken:
+    """Cooperative cancellation flag for one job; long waits should use wait() so they wake on cancel."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: float) -> bool:
+        """Sleeps up to timeout seconds; returns True as soon as the job is cancelled."""
+        return self._event.wait(timeout)
+
+
+_tokens: Dict[str, CancellationToken] = {}
+_tokens_lock = threading.Lock()
+
+
+def register_job(job_id: str) -> CancellationToken:
+    """Creates the token for a job that is about to run in this process."""
+    with _tokens_lock:
+        return _tokens.setdefault(job_id, CancellationToken())
+
+
+def release_job(job_id: str) -> None:
+    with _tokens_lock:
+        _tokens.pop(job_id, None)
+
+
+def cancel_job(job_id: str) -> bool:
+    """Cancels a job running in this process; False if it is not running here."""
+    with _tokens_lock:
+        token = _tokens.get(job_id)
+    if token is None:
+        return False
+    token.cancel()
+    return True
+
+
+def current_token() -> Optional[CancellationToken]:
+    """Token of the job in current_job_id, or None outside a job."""
+    job_id = current_job_id.get()
+    if job_id is None:
+        return None
+    with _tokens_lock:
+        return _tokens.get(job_id)
+
+
+def check_cancelled() -> None:
+    """Raises JobCancelled if the current job has been cancelled."""
+    token = current_token()
+    if token is not None and token.cancelled:
+        raise JobCancelled("Job cancelled")
+
+
+def sleep_or_cancel(seconds: float) -> None:
+    """Sleeps like time.sleep, but raises JobCancelled as soon as the current job is cancelled."""
+    token = current_token()
+    if token is None:
+        threading.Event().wait(seconds)
+    elif token.wait(seconds):
+        raise JobCancelled("Job cancelled")
@@ -0,0 +1,80 @@
+import logging
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+# Job that owns the code currently running; copied into scheduler worker threads
+current_job_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('job_id', default=None)
+
+_sink: Optional[Callable[[str, str], None]] = None
+_progress_sink: Optional[Callable[[str, Optional[Dict], Optional[Dict]], None]] = None
+_install_lock = threading.Lock()
+_router = None
+
+
+def set_log_sink(sink: Callable[[str, str], None]) -> None:
+    """Sets the callable that receives (job_id, message) for every job-scoped log record."""
+    global _sink
+    _sink = sink
+
+
+def set_progress_sink(sink: Callable[[str, Optional[Dict], Optional[Dict]], None]) -> None:
+    """Sets the callable that receives (job_id, values, increments) for progress counter updates."""
+    global _progress_sink
+    _progress_sink = sink
+
+
+def set_job_progress(**values) -> None:
+    """Sets progress counters of the current job; a no-op outside a job."""
+    job_id = current_job_id.get()
+    if job_id is not None and _progress_sink is not None:
+        _progress_sink(job_id, values, None)
+
+
+def add_job_progress(**increments) -> None:
+    """Increments progress counters of the current job; a no-op outside a job."""
+    job_id = current_job_id.get()
+    if job_id is not None and _progress_sink is not None:
+        _progress_sink(job_id, None, increments)
+
+
+class JobLogRouter(logging.Handler):
+    """
+    One root-logger handler for all jobs. Each record is formatted once and handed to
+    the sink for the job in current_job_id; records outside a job are ignored.
+    """
+
+    def emit(self, record):
+        job_id = current_job_id.get()
+        if job_id is None or _sink is None:
+            return
+        try:
+            _sink(job_id, self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+def install_job_log_router(level: int = logging.INFO) -> JobLogRouter:
+    """Adds the router to the root logger once and returns it."""
+    global _router
+    with _install_lock:
+        if _router is None:
+            _router = JobLogRouter()
+            _router.setLevel(level)
+            _router.setFormatter(logging.Formatter('%(message)s'))
+            root_logger = logging.getLogger()
+            root_logger.addHandler(_router)
+            if root_logger.level > level or root_logger.level == logging.NOTSET:
+                root_logger.setLevel(level)
+        return _router
+
+
+@contextmanager
+def job_context(job_id: str):
+    """Routes log records emitted inside the block (and in work it schedules) to job_id."""
+    token = current_job_id.set(job_id)
+    try:
+        yield
+    finally:
+        current_job_id.reset(token)
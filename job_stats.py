@@ -0,0 +1,69 @@
+import threading
+from typing import Dict, Optional
+
+# Job counters that are summed across jobs
+TRACKED_COUNTERS = ('tracks_matched', 'tracks_missing', 'downloaded', 'download_failed', 'moved',
+                    'bytes_moved', 'bytes_copied')
+
+
+class JobStats:
+    """
+    Aggregate dashboard numbers, kept up to date as jobs change instead of being
+    recomputed from the job history on each request. Every update is O(1).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status_counts: Dict[str, int] = {}
+        self._totals: Dict[str, int] = {name: 0 for name in TRACKED_COUNTERS}
+        self._stage_seconds: Dict[str, float] = {}
+        self._stage_runs: Dict[str, int] = {}
+
+    def job_status_changed(self, old_status: Optional[str], new_status: Optional[str]) -> None:
+        """Moves a job between status buckets; None means the job did not exist / was removed."""
+        if old_status == new_status:
+            return
+        with self._lock:
+            if old_status is not None:
+                self._status_counts[old_status] = self._status_counts.get(old_status, 0) - 1
+            if new_status is not None:
+                self._status_counts[new_status] = self._status_counts.get(new_status, 0) + 1
+
+    def counters_changed(self, old: Dict, new: Dict) -> None:
+        """Adds the difference between a job's old and new counters to the totals."""
+        with self._lock:
+            for name in TRACKED_COUNTERS:
+                delta = (new.get(name) or 0) - (old.get(name) or 0)
+                if delta:
+                    self._totals[name] += delta
+
+    def stage_finished(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._stage_seconds[stage] = self._stage_seconds.get(stage, 0.0) + seconds
+            self._stage_runs[stage] = self._stage_runs.get(stage, 0) + 1
+
+    def snapshot(self) -> Dict:
+        from job_store import QUEUED, RUNNING, DONE, ERROR, CANCELLED
+        with self._lock:
+            counts = dict(self._status_counts)
+            return {
+                "jobs": {
+                    "total": sum(counts.values()),
+                    "active": counts.get(QUEUED, 0) + counts.get(RUNNING, 0),
+                    "done": counts.get(DONE, 0),
+                    "error": counts.get(ERROR, 0),
+                    "cancelled": counts.get(CANCELLED, 0),
+                },
+                "tracks": {
+                    "matched": self._totals['tracks_matched'],
+                    "missing": self._totals['tracks_missing'],
+                    "downloaded": self._totals['downloaded'],
+                    "download_failed": self._totals['download_failed'],
+                    "moved": self._totals['moved'],
+                },
+                "bytes_moved": self._totals['bytes_moved'],
+                "bytes_copied": self._totals['bytes_copied'],
+                "average_stage_seconds": {
+                    stage: self._stage_seconds[stage] / self._stage_runs[stage] for stage in self._stage_runs
+                },
+            }
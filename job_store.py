@@ -0,0 +1,354 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from credential import get_state_dir
+from job_stats import JobStats
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+CANCELLED = "cancelled"
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    url TEXT,
+    resource TEXT,
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    last_seq INTEGER NOT NULL DEFAULT 0,
+    counters TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+CREATE TABLE IF NOT EXISTS job_logs (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class _LiveJob:
+    def __init__(self, max_lines: int, last_seq: int = 0, counters: Optional[Dict] = None):
+        self.lines = deque(maxlen=max_lines)
+        self.last_seq = last_seq
+        self.flushed_seq = last_seq
+        self.last_flush = time.monotonic()
+        self.counters = dict(counters or {})
+        self.counters_dirty = False
+        self.stage = None
+        self.stage_started = time.monotonic()
+        # Bumped on every change so streaming readers can wait for the next one
+        self.version = 0
+
+
+class JobStore:
+    """
+    SQLite-backed job history. Each job keeps only its last max_log_lines log lines, both
+    in memory while it runs and on disk. Every line has a per-job sequence number so
+    clients can ask for what they have not seen yet, and version() lets a stream poll
+    whether a running job logged, reported progress counters or changed status.
+    Finished jobs older than retention_seconds, and the oldest beyond max_jobs, are pruned.
+    Aggregate numbers for the dashboard are kept in self.stats as changes happen.
+    """
+
+    def __init__(self, db_path: str, max_log_lines: int = 2000, retention_seconds: float = 7 * 86400,
+                 max_jobs: int = 500, flush_interval: float = 2.0):
+        self.max_log_lines = max_log_lines
+        self.retention_seconds = retention_seconds
+        self.max_jobs = max_jobs
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._live: Dict[str, _LiveJob] = {}
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if 'counters' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN counters TEXT")
+        if 'resource' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN resource TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_resource ON jobs(resource, status)")
+        self._conn.commit()
+        self._load_stats()
+
+    def _load_stats(self):
+        # One pass over the (bounded) history; afterwards stats are updated incrementally
+        stats = JobStats()
+        with self._lock:
+            for row in self._conn.execute("SELECT status, counters FROM jobs"):
+                stats.job_status_changed(None, row['status'])
+                stats.counters_changed({}, json.loads(row['counters'] or '{}'))
+        self.stats = stats
+
+    def _live_job(self, job_id: str) -> Optional[_LiveJob]:
+        live = self._live.get(job_id)
+        if live is None:
+            row = self._conn.execute("SELECT status, last_seq, counters FROM jobs WHERE job_id = ?",
+                                     (job_id,)).fetchone()
+            if row is None:
+                return None
+            live = _LiveJob(self.max_log_lines, row['last_seq'], json.loads(row['counters'] or '{}'))
+            if row['status'] in ACTIVE_STATES:
+                self._live[job_id] = live
+        return live
+
+    def _touch(self, live: _LiveJob):
+        live.version += 1
+
+    def create(self, job_id: str, url: Optional[str] = None, resource: Optional[str] = None) -> Dict:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, url, resource, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, url, resource, QUEUED, now, now),
+            )
+            self._conn.commit()
+            self._live[job_id] = _LiveJob(self.max_log_lines)
+            self.stats.job_status_changed(None, QUEUED)
+        return self.get(job_id)
+
+    def find_active(self, resource: str) -> Optional[str]:
+        """ID of the oldest queued or running job for resource, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT job_id FROM jobs WHERE resource = ? AND status IN ({','.join('?' * len(ACTIVE_STATES))}) "
+                "ORDER BY created_at LIMIT 1", (resource, *ACTIVE_STATES),
+            ).fetchone()
+        return row['job_id'] if row else None
+
+    def create_unless_active(self, job_id: str, url: str, resource: Optional[str]) -> Tuple[str, bool]:
+        """
+        Creates job_id unless a job for the same resource is queued or running; returns
+        (job_id, created) where job_id is the existing job's when created is False.
+        Check and insert happen under one lock, so concurrent submits cannot both create.
+        """
+        with self._lock:
+            existing = self.find_active(resource) if resource else None
+            if existing:
+                return existing, False
+            self.create(job_id, url, resource)
+            return job_id, True
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None,
+                   progress: Optional[int] = None) -> None:
+        now = time.time()
+        finished = status not in ACTIVE_STATES
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            self.stats.job_status_changed(row['status'], status)
+            self._flush(job_id)
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = COALESCE(?, error), progress = COALESCE(?, progress), "
+                "updated_at = ?, finished_at = ? WHERE job_id = ?",
+                (status, error, progress, now, now if finished else None, job_id),
+            )
+            self._conn.commit()
+            live = self._live.pop(job_id, None) if finished else self._live.get(job_id)
+            if live is not None:
+                if finished and live.stage:
+                    self.stats.stage_finished(live.stage, time.monotonic() - live.stage_started)
+                self._touch(live)
+
+    def append_log(self, job_id: str, message: str) -> int:
+        """Adds a log line and returns its sequence number."""
+        with self._lock:
+            live = self._live_job(job_id)
+            if live is None:
+                return 0
+            live.last_seq += 1
+            live.lines.append((live.last_seq, time.time(), message))
+            if job_id not in self._live or time.monotonic() - live.last_flush >= self.flush_interval:
+                self._flush(job_id, live)
+            self._touch(live)
+            return live.last_seq
+
+    def update_progress(self, job_id: str, values: Optional[Dict] = None,
+                        increments: Optional[Dict] = None) -> None:
+        """Sets and/or increments the job's progress counters (e.g. tracks_total, downloaded)."""
+        with self._lock:
+            live = self._live_job(job_id)
+            if live is None:
+                return
+            old_counters = dict(live.counters)
+            live.counters.update(values or {})
+            for name, delta in (increments or {}).items():
+                live.counters[name] = live.counters.get(name, 0) + delta
+            live.counters_dirty = True
+            self.stats.counters_changed(old_counters, live.counters)
+            stage = live.counters.get('stage')
+            if stage != live.stage:
+                now = time.monotonic()
+                if live.stage:
+                    self.stats.stage_finished(live.stage, now - live.stage_started)
+                live.stage, live.stage_started = stage, now
+            if job_id not in self._live:
+                self._flush(job_id, live)
+            self._touch(live)
+
+    def version(self, job_id: str) -> Optional[int]:
+        """
+        Current version of a running job; None once it is no longer running. Reads the
+        live job without taking the lock (a dict lookup and an int are read atomically),
+        so it never waits behind a SQLite commit and is safe to call on the event loop.
+        """
+        live = self._live.get(job_id)
+        return live.version if live is not None else None
+
+    def _flush(self, job_id: str, live: Optional[_LiveJob] = None):
+        live = live or self._live.get(job_id)
+        if live is None or (live.flushed_seq == live.last_seq and not live.counters_dirty):
+            return
+        new_lines = [line for line in live.lines if line[0] > live.flushed_seq]
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO job_logs (job_id, seq, created_at, message) VALUES (?, ?, ?, ?)",
+            [(job_id, seq, created_at, message) for seq, created_at, message in new_lines],
+        )
+        # Keep the on-disk log bounded like the in-memory one
+        self._conn.execute("DELETE FROM job_logs WHERE job_id = ? AND seq <= ?",
+                           (job_id, live.last_seq - self.max_log_lines))
+        self._conn.execute("UPDATE jobs SET last_seq = ?, counters = ?, updated_at = ? WHERE job_id = ?",
+                           (live.last_seq, json.dumps(live.counters), time.time(), job_id))
+        self._conn.commit()
+        live.flushed_seq = live.last_seq
+        live.counters_dirty = False
+        live.last_flush = time.monotonic()
+
+    def flush_all(self) -> None:
+        with self._lock:
+            for job_id in list(self._live):
+                self._flush(job_id)
+
+    def log_lines(self, job_id: str, since: int = 0) -> List[Dict]:
+        """Log lines with seq greater than since, oldest first."""
+        with self._lock:
+            live = self._live.get(job_id)
+            if live is not None:
+                return [{"seq": seq, "time": created_at, "message": message}
+                        for seq, created_at, message in live.lines if seq > since]
+            rows = self._conn.execute(
+                "SELECT seq, created_at, message FROM job_logs WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, since),
+            ).fetchall()
+        return [{"seq": row['seq'], "time": row['created_at'], "message": row['message']} for row in rows]
+
+    def get(self, job_id: str, since: Optional[int] = None) -> Optional[Dict]:
+        """
+        Job status with its log. Without since the whole retained log is returned as a
+        list of strings; with since only newer lines are returned, as {'seq', 'time',
+        'message'} dicts.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            lines = self.log_lines(job_id, since or 0)
+            live = self._live.get(job_id)
+            last_seq = live.last_seq if live is not None else row['last_seq']
+            counters = dict(live.counters) if live is not None else json.loads(row['counters'] or '{}')
+            version = live.version if live is not None else None
+        job = {
+            "job_id": job_id,
+            "url": row['url'],
+            "status": row['status'],
+            "progress": row['progress'],
+            "error": row['error'],
+            "created_at": row['created_at'],
+            "finished_at": row['finished_at'],
+            "seq": last_seq,
+            "version": version,
+            "counters": counters,
+        }
+        job["log"] = lines if since is not None else [line["message"] for line in lines]
+        return job
+
+    def status(self, job_id: str) -> Optional[str]:
+        """Status of a job without its log; None if unknown or pruned."""
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row['status'] if row else None
+
+    def list_jobs(self, limit: int = 50) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, url, resource, status, progress, error, created_at, finished_at FROM jobs "
+                "ORDER BY created_at DESC LIMIT ?", (limit,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def mark_interrupted(self) -> int:
+        """Fails jobs that were queued or running when the previous process stopped."""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                f"UPDATE jobs SET status = ?, error = ?, updated_at = ?, finished_at = ? "
+                f"WHERE status IN ({','.join('?' * len(ACTIVE_STATES))})",
+                (ERROR, "Interrupted by a restart", now, now, *ACTIVE_STATES),
+            )
+            self._conn.commit()
+            if cur.rowcount:
+                self._load_stats()
+            return cur.rowcount
+
+    def prune(self) -> int:
+        """Deletes finished jobs past the retention period or beyond max_jobs, with their logs."""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT job_id, status, counters FROM jobs WHERE status NOT IN ({','.join('?' * len(ACTIVE_STATES))}) "
+                "AND (finished_at < ? OR job_id NOT IN (SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?))",
+                (*ACTIVE_STATES, cutoff, self.max_jobs),
+            ).fetchall()
+            job_ids = [(row['job_id'],) for row in rows]
+            for row in rows:
+                self.stats.job_status_changed(row['status'], None)
+                self.stats.counters_changed(json.loads(row['counters'] or '{}'), {})
+            self._conn.executemany("DELETE FROM job_logs WHERE job_id = ?", job_ids)
+            self._conn.executemany("DELETE FROM jobs WHERE job_id = ?", job_ids)
+            self._conn.commit()
+            return len(job_ids)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """
+    Returns the process-wide job store under STATE_DIR. JOB_LOG_MAX_LINES bounds each
+    job's log, JOB_RETENTION_DAYS and JOB_MAX_HISTORY bound the history. Jobs left active
+    by a previous process are marked as errors on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobStore(
+                os.path.join(get_state_dir(), "jobs.db"),
+                max_log_lines=int(os.environ.get('JOB_LOG_MAX_LINES', '2000')),
+                retention_seconds=float(os.environ.get('JOB_RETENTION_DAYS', '7')) * 86400,
+                max_jobs=int(os.environ.get('JOB_MAX_HISTORY', '500')),
+            )
+            interrupted = _store.mark_interrupted()
+            if interrupted:
+                logger.info(f"Marked {interrupted} jobs interrupted by a restart as failed")
+            _store.prune()
+        return _store
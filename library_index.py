@@ -0,0 +1,364 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from credential import get_state_dir
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = ('.mp3', '.flac', '.m4a', '.ogg', '.opus', '.wav')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS library_files (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    artist TEXT,
+    title TEXT,
+    album TEXT,
+    spotify_url TEXT,
+    track_id TEXT,
+    match_key TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_library_files_track ON library_files(track_id);
+CREATE INDEX IF NOT EXISTS idx_library_files_key ON library_files(match_key);
+"""
+
+
+def _normalize(s: Optional[str]) -> str:
+    s = re.sub(r'[^\w\s]', ' ', (s or '').lower())
+    return re.sub(r'\s+', ' ', s).strip()
+
+
+def make_match_key(artist: Optional[str], title: Optional[str]) -> Optional[str]:
+    """Normalized 'artist|title' key; only the first of several tagged artists is used."""
+    primary_artist = re.split(r'[/;,]', artist or '')[0]
+    if not primary_artist.strip() or not title:
+        return None
+    return f"{_normalize(primary_artist)}|{_normalize(title)}"
+
+
+def read_tags(path: str) -> Dict:
+    """
+    Reads artist, title, album and the Spotify URL spotDL embeds (WOAS frame on MP3)
+    from an audio file. Runs in worker processes, so it must stay a module-level function.
+    """
+    import mutagen
+    tags = {'artist': None, 'title': None, 'album': None, 'spotify_url': None}
+    try:
+        if path.lower().endswith('.mp3'):
+            # Only the ID3 header is parsed; no need to sync to the MPEG stream
+            from mutagen.id3 import ID3
+            id3 = ID3(path)
+            for field, frame in (('artist', 'TPE1'), ('title', 'TIT2'), ('album', 'TALB')):
+                if frame in id3 and id3[frame].text:
+                    tags[field] = str(id3[frame].text[0])
+            woas = id3.getall('WOAS')
+            if woas:
+                tags['spotify_url'] = woas[0].url
+            return tags
+        audio = mutagen.File(path, easy=True)
+        if audio is not None and audio.tags is not None:
+            for field in ('artist', 'title', 'album'):
+                values = audio.tags.get(field)
+                if values:
+                    tags[field] = values[0]
+            for field in ('website', 'woas'):
+                values = audio.tags.get(field)
+                if values and 'spotify' in values[0]:
+                    tags['spotify_url'] = values[0]
+                    break
+    except Exception as e:
+        logger.debug(f"Could not read tags from {path}: {e}")
+    return tags
+
+
+class LibraryIndex:
+    """
+    SQLite index of the audio files under the music folder, built from their tags.
+    Lets a sync tell that a track is already on disk before Plex has scanned it.
+    Rescans only re-read files whose mtime or size changed.
+    """
+
+    def __init__(self, db_path: str, root: str, workers: Optional[int] = None, max_age_seconds: float = 3600.0):
+        self.root = root
+        self.workers = workers
+        self.max_age_seconds = max_age_seconds
+        self.last_refresh = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.RLock()
+        self._refreshing_in_background = False
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def _walk(self) -> Dict[str, tuple]:
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            # Skip hidden folders such as the download staging area
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for name in filenames:
+                if not name.lower().endswith(AUDIO_EXTENSIONS):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = (st.st_mtime, st.st_size)
+        return files
+
+    def refresh(self) -> Dict:
+        """Rescans the music folder, reading tags of new or changed files only."""
+        from spotify_utils import get_spotify_track_id_from_url
+        with self._refresh_lock:
+            started = time.monotonic()
+            on_disk = self._walk()
+            with self._lock:
+                known = {row[0]: (row[1], row[2]) for row in
+                         self._conn.execute("SELECT path, mtime, size FROM library_files")}
+            changed = [path for path, stat in on_disk.items() if known.get(path) != stat]
+            removed = [path for path in known if path not in on_disk]
+            if len(changed) > 50 and not multiprocessing.current_process().daemon:
+                # Tag parsing is CPU-bound, so large (initial) scans are spread over processes.
+                # Spawned, not forked: the API process runs threads whose held locks a
+                # forked child would inherit
+                with ProcessPoolExecutor(max_workers=self.workers,
+                                         mp_context=multiprocessing.get_context('spawn')) as pool:
+                    tags = list(pool.map(read_tags, changed, chunksize=64))
+            elif len(changed) > 50:
+                # Daemonic processes (e.g. sync workers) may not start children; threads
+                # still overlap the file reads
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="library-index") as pool:
+                    tags = list(pool.map(read_tags, changed))
+            else:
+                tags = [read_tags(path) for path in changed]
+            with self._lock:
+                for path, tag in zip(changed, tags):
+                    mtime, size = on_disk[path]
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO library_files "
+                        "(path, mtime, size, artist, title, album, spotify_url, track_id, match_key) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (path, mtime, size, tag['artist'], tag['title'], tag['album'], tag['spotify_url'],
+                         get_spotify_track_id_from_url(tag['spotify_url']) if tag['spotify_url'] else None,
+                         make_match_key(tag['artist'], tag['title'])),
+                    )
+                self._conn.executemany("DELETE FROM library_files WHERE path = ?", [(p,) for p in removed])
+                self._conn.commit()
+            self.last_refresh = time.time()
+            summary = {"files": len(on_disk), "read": len(changed), "removed": len(removed),
+                       "seconds": round(time.monotonic() - started, 1)}
+            logger.info(f"🗃️  Library index refreshed: {summary['files']} files, {summary['read']} read, "
+                        f"{summary['removed']} removed in {summary['seconds']}s")
+            return summary
+
+    def ensure_fresh(self) -> None:
+        """
+        Rescans when the index is older than max_age_seconds. Only the first build of
+        an empty index blocks; otherwise the rescan runs in the background and the
+        index as stored by the last scan is used meanwhile.
+        """
+        if time.time() - self.last_refresh <= self.max_age_seconds:
+            return
+        with self._lock:
+            empty = self._conn.execute("SELECT 1 FROM library_files LIMIT 1").fetchone() is None
+        if empty:
+            self._refresh_if_stale()
+        else:
+            self.refresh_in_background()
+
+    def _refresh_if_stale(self) -> None:
+        # Checked again under the lock so a caller that waited for a running scan
+        # does not start another one right after it
+        with self._refresh_lock:
+            if time.time() - self.last_refresh > self.max_age_seconds:
+                self.refresh()
+
+    def refresh_in_background(self) -> None:
+        """Starts a rescan in a thread if the index is stale and none is running yet."""
+        with self._lock:
+            if self._refreshing_in_background:
+                return
+            self._refreshing_in_background = True
+
+        def run():
+            try:
+                self._refresh_if_stale()
+            except Exception as e:
+                logger.error(f"❌ Library index refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing_in_background = False
+        threading.Thread(target=run, name="library-index-refresh", daemon=True).start()
+
+    def add_file(self, path: str, track: Optional[Dict] = None) -> None:
+        """Indexes one file right after it was moved into the library."""
+        from spotify_utils import get_spotify_track_id_from_url
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        tag = read_tags(path)
+        track = track or {}
+        artist = tag['artist'] or track.get('artist')
+        title = tag['title'] or track.get('title')
+        spotify_url = tag['spotify_url'] or track.get('url')
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO library_files "
+                "(path, mtime, size, artist, title, album, spotify_url, track_id, match_key) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, st.st_mtime, st.st_size, artist, title, tag['album'] or track.get('album'), spotify_url,
+                 get_spotify_track_id_from_url(spotify_url) if spotify_url else None,
+                 make_match_key(artist, title)),
+            )
+            self._conn.commit()
+
+    def find(self, track: Dict) -> Optional[str]:
+        """Path of a file for the track, matched by Spotify track ID, then by artist and title."""
+        from spotify_utils import get_spotify_track_id_from_url
+        track_id = get_spotify_track_id_from_url(track['url']) if track.get('url') else None
+        key = make_match_key(track.get('artist'), track.get('title'))
+        with self._lock:
+            row = None
+            if track_id:
+                row = self._conn.execute("SELECT path FROM library_files WHERE track_id = ?", (track_id,)).fetchone()
+            if row is None and key:
+                row = self._conn.execute("SELECT path FROM library_files WHERE match_key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def split_missing(self, tracks: List[Dict]) -> Tuple[List[Dict], List[str]]:
+        """(tracks without a file in the music folder, paths of the files found for the others)."""
+        self.ensure_fresh()
+        missing = []
+        on_disk = []
+        for track in tracks:
+            path = self.find(track)
+            if path and os.path.exists(path):
+                logger.info(f"💽 Already on disk (not yet in Plex): {track.get('artist')} - {track.get('title')}")
+                on_disk.append(path)
+            else:
+                missing.append(track)
+        if on_disk:
+            logger.info(f"💽 Skipping {len(on_disk)} tracks already in the music folder")
+        return missing, on_disk
+
+    def stats(self) -> Dict:
+        with self._lock:
+            files = self._conn.execute("SELECT COUNT(*) FROM library_files").fetchone()[0]
+            with_spotify = self._conn.execute(
+                "SELECT COUNT(*) FROM library_files WHERE track_id IS NOT NULL").fetchone()[0]
+        return {"files": files, "with_spotify_id": with_spotify, "last_refresh": self.last_refresh}
+
+
+def normalize_artist_folder(name: Optional[str]) -> str:
+    return re.sub(r'[^a-z0-9 ]', '', name.lower()).strip() if name else ''
+
+
+class ArtistFolderIndex:
+    """
+    Normalized artist name -> folder name for the top level of the music folder.
+    Exact keys resolve with one dict lookup; otherwise only folders sharing a word prefix
+    with the artist are fuzzy-scored. The listing is reloaded when the root folder's mtime
+    changes; folders created by the organizer are also added right away.
+    """
+
+    def __init__(self, root: str, threshold: int = 90):
+        self.root = root
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._folders: Dict[str, str] = {}
+        self._blocks: Dict[str, set] = {}
+        self._root_mtime = None
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.root).st_mtime
+        except OSError:
+            return
+        if mtime == self._root_mtime:
+            return
+        self._folders = {}
+        self._blocks = {}
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_dir() and not entry.name.startswith('.'):
+                    self._add(entry.name)
+        self._root_mtime = mtime
+
+    def _add(self, folder: str):
+        key = normalize_artist_folder(folder)
+        if not key:
+            return
+        self._folders.setdefault(key, folder)
+        for block in self._block_keys(key):
+            self._blocks.setdefault(block, set()).add(key)
+
+    @staticmethod
+    def _block_keys(key: str):
+        # Word prefixes, so spelling differences at the end of a word still share a block
+        return {token[:3] for token in key.split()}
+
+    def find(self, artist: str) -> Optional[str]:
+        """Existing folder name for the artist, or None if nothing scores above the threshold."""
+        from thefuzz import process
+        key = normalize_artist_folder(artist)
+        if not key:
+            return None
+        with self._lock:
+            self._load()
+            if key in self._folders:
+                return self._folders[key]
+            candidates = set()
+            for block in self._block_keys(key):
+                candidates |= self._blocks.get(block, set())
+            if not candidates:
+                return None
+            best_key, score = process.extractOne(key, candidates)
+            return self._folders[best_key] if score >= self.threshold else None
+
+    def add(self, folder: str) -> None:
+        """
+        Records a folder the organizer just created. The recorded root mtime is left
+        alone, so folders created at the same time by other code still cause a reload.
+        """
+        with self._lock:
+            self._add(folder)
+
+
+_index = None
+_index_lock = threading.Lock()
+_artist_folders: Dict[str, ArtistFolderIndex] = {}
+
+
+def get_library_index(root: str = "/app/Songs") -> LibraryIndex:
+    """
+    Returns the process-wide index of the music folder. It is rescanned when older than
+    LIBRARY_INDEX_MAX_AGE_SECONDS; LIBRARY_INDEX_WORKERS caps the scan processes.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            workers = os.environ.get('LIBRARY_INDEX_WORKERS')
+            _index = LibraryIndex(
+                os.path.join(get_state_dir(), "library_index.db"),
+                root,
+                workers=int(workers) if workers else None,
+                max_age_seconds=float(os.environ.get('LIBRARY_INDEX_MAX_AGE_SECONDS', '3600')),
+            )
+        return _index
+
+
+def get_artist_folder_index(root: str = "/app/Songs") -> ArtistFolderIndex:
+    """Returns the process-wide artist folder index for a music folder."""
+    with _index_lock:
+        if root not in _artist_folders:
+            _artist_folders[root] = ArtistFolderIndex(root)
+        return _artist_folders[root]
@@ -1,7 +1,11 @@
 import os
-from spotify_utils import setup_spotify_client, get_spotify_playlist_id_from_url, get_spotify_playlist_tracks, parse_spotify_tracks
-from plex_utils import setup_plex_client, get_music_library, create_or_update_plex_playlist, find_plex_match
+from spotify_utils import (setup_spotify_client, get_spotify_playlist_id_from_url, get_spotify_playlist_tracks,
+                           get_spotify_playlist_snapshot, parse_spotify_tracks)
+from plex_utils import (setup_plex_client, get_music_library, create_or_update_plex_playlist, find_plex_match,
+                        get_plex_playlist, apply_plex_playlist_changes)
 from download_utils import download_missing_tracks_spotdl
+from job_logging import set_job_progress, add_job_progress
+from job_cancellation import check_cancelled
 
 import os
 import logging
@@ -12,8 +16,88 @@ def log_status(msg):
     logger.info(msg)
     print(msg)
 
-def sync_playlist(playlist_url):
+def sync_playlist_delta(plex, playlist_id, playlist_name, snapshot_id, spotify_tracks, previous_tracks,
+                        plex_playlist, job_id=None):
+    """
+    Syncs only what changed since the last sync: tracks added to the Spotify playlist,
+    and tracks that were still missing last time, are matched and downloaded; tracks
+    removed from it are removed from the Plex playlist. previous_tracks is the
+    track_key -> ratingKey map stored by the last sync.
+    """
+    from playlist_state import get_playlist_state, track_key
+    from plex_scan import wait_for_scan
+
+    tracks_by_key = {}
+    for spotify_track in spotify_tracks:
+        tracks_by_key.setdefault(track_key(spotify_track), spotify_track)
+    rating_keys = {key: previous_tracks.get(key) for key in tracks_by_key}
+    pending = [key for key, rating_key in rating_keys.items() if rating_key is None]
+    removed = [key for key in previous_tracks if key not in tracks_by_key]
+    added = sum(1 for key in tracks_by_key if key not in previous_tracks)
+    log_status(f"🔀 Delta sync: {added} tracks added, {len(removed)} removed, "
+               f"{len(pending) - added} still missing since the last sync")
+    set_job_progress(stage="matching", tracks_total=len(pending), tracks_matched=0, tracks_missing=0)
+
+    music_library = get_music_library(plex)
+    matches = {}
+    missing = []
+    for i, key in enumerate(pending, 1):
+        check_cancelled()
+        spotify_track = tracks_by_key[key]
+        log_status(f"[{i}/{len(pending)}] Searching: {spotify_track['artist']} - {spotify_track['title']}")
+        plex_match = find_plex_match(music_library, spotify_track)
+        if plex_match:
+            matches[key] = plex_match
+            add_job_progress(tracks_matched=1)
+        else:
+            missing.append(key)
+            add_job_progress(tracks_missing=1)
+
+    if missing:
+        log_status(f"📥 Need to download: {len(missing)}")
+        set_job_progress(stage="downloading")
+        download_missing_tracks_spotdl([tracks_by_key[key] for key in missing], "/app/downloads", job_id=job_id)
+        music_library = get_music_library(plex)
+        wait_for_scan(music_library, grace=0)
+        log_status("🔄 Re-matching downloaded tracks...")
+        set_job_progress(stage="rematching")
+        for key in missing:
+            check_cancelled()
+            plex_match = find_plex_match(music_library, tracks_by_key[key])
+            if plex_match:
+                matches[key] = plex_match
+
+    set_job_progress(stage="updating_playlist")
+    in_playlist = {rating_key for rating_key in previous_tracks.values() if rating_key is not None}
+    tracks_to_add = []
+    for key, plex_match in matches.items():
+        rating_keys[key] = plex_match.ratingKey
+        if plex_match.ratingKey not in in_playlist:
+            in_playlist.add(plex_match.ratingKey)
+            tracks_to_add.append(plex_match)
+    # A Plex track stays if a remaining Spotify track matched it as well
+    kept = {rating_key for rating_key in rating_keys.values() if rating_key is not None}
+    rating_keys_to_remove = {previous_tracks[key] for key in removed if previous_tracks[key] is not None} - kept
+    apply_plex_playlist_changes(plex_playlist, tracks_to_add, rating_keys_to_remove)
+
+    still_missing = sum(1 for rating_key in rating_keys.values() if rating_key is None)
+    log_status(f"📊 Playlist now contains {len(kept)} tracks "
+               f"({len(tracks_to_add)} added, {len(rating_keys_to_remove)} removed)")
+    set_job_progress(tracks_in_playlist=len(kept))
+    if still_missing:
+        log_status(f"⚠️  {still_missing} tracks still missing after download attempt")
+    get_playlist_state().record(playlist_id, playlist_name, snapshot_id, len(spotify_tracks), len(kept),
+                                still_missing, tracks=list(rating_keys.items()))
+
+def sync_playlist(playlist_url, job_id=None, force=False):
+    """
+    Syncs one Spotify playlist into Plex. Unless force is set, a playlist whose
+    snapshot_id matches the last completed sync, with nothing left missing, is
+    skipped after a single metadata request, and a playlist synced before only
+    has its changes processed (see sync_playlist_delta).
+    """
     import uuid
+    from playlist_state import get_playlist_state, track_key
     run_id = uuid.uuid4()
     log_status(f"[SYNC-START] sync_playlist called. Run ID: {run_id}")
     try:
@@ -25,6 +109,21 @@ def sync_playlist(playlist_url):
         log_status("Setting up Spotify client...")
         sp_authenticated, sp_anonymous = setup_spotify_client()
 
+        playlist_state = get_playlist_state()
+        try:
+            _, snapshot_id = get_spotify_playlist_snapshot(sp_authenticated, sp_anonymous, playlist_id)
+        except Exception as e:
+            # The full fetch below reports access problems with a proper message
+            log_status(f"⚠️  Could not read playlist snapshot: {e}")
+            snapshot_id = None
+        previous = None if force else playlist_state.is_unchanged(playlist_id, snapshot_id)
+        if previous:
+            log_status(f"⏭️  Playlist '{previous['name']}' is unchanged since the last sync "
+                       f"({previous['tracks_found']} tracks in Plex), nothing to do.")
+            set_job_progress(stage="unchanged", tracks_total=previous['tracks_total'],
+                             tracks_in_playlist=previous['tracks_found'])
+            return
+
         log_status("Setting up Plex client...")
         plex = setup_plex_client()
         music_library = get_music_library(plex)
@@ -35,6 +134,17 @@ def sync_playlist(playlist_url):
         log_status(f"Found playlist: '{playlist_name}'")
         spotify_tracks = parse_spotify_tracks(raw_spotify_tracks)
 
+        previous_tracks = {} if force else playlist_state.get_tracks(playlist_id)
+        if previous_tracks:
+            plex_playlist = get_plex_playlist(plex, playlist_name)
+            if plex_playlist is not None:
+                sync_playlist_delta(plex, playlist_id, playlist_name, snapshot_id, spotify_tracks,
+                                    previous_tracks, plex_playlist, job_id=job_id)
+                return
+            log_status(f"Plex playlist '{playlist_name}' not found, running a full sync")
+
+        set_job_progress(stage="matching", tracks_total=len(spotify_tracks), tracks_matched=0, tracks_missing=0)
+
         log_status(f"🔍 Matching {len(spotify_tracks)} tracks with Plex library...")
 
         # Original Plex matching logic
@@ -42,14 +152,17 @@ def sync_playlist(playlist_url):
         missing_spotify_tracks = []
 
         for i, spotify_track in enumerate(spotify_tracks, 1):
+            check_cancelled()
             log_status(f"[{i}/{len(spotify_tracks)}] Searching: {spotify_track['artist']} - {spotify_track['title']}")
             plex_match = find_plex_match(music_library, spotify_track)
             if plex_match:
                 found_plex_tracks.append(plex_match)
                 log_status(f"  ✅ Found in Plex")
+                add_job_progress(tracks_matched=1)
             else:
                 missing_spotify_tracks.append(spotify_track)
                 log_status(f"  ❌ Not found in Plex")
+                add_job_progress(tracks_missing=1)
 
         log_status("---")
         log_status("Matching complete.")
@@ -62,47 +175,46 @@ def sync_playlist(playlist_url):
         # Original download with spotDL
         if missing_spotify_tracks:
             log_status(f"📥 Need to download: {len(missing_spotify_tracks)}")
+            set_job_progress(stage="downloading")
             download_dir = "/app/downloads"
-            download_missing_tracks_spotdl(missing_spotify_tracks, download_dir)
+            download_missing_tracks_spotdl(missing_spotify_tracks, download_dir, job_id=job_id)
         else:
             log_status("✅ All tracks already available in Plex library!")
 
-        # Wait for Plex scan to complete before updating playlist again
-        import time
+        # download_missing_tracks_spotdl scans the folders it filled and waits for Plex;
+        # this only waits out a scan that is still running (e.g. one started elsewhere)
+        from plex_scan import wait_for_scan
         music_library = get_music_library(plex)
         log_status("Waiting for Plex scan to complete before updating playlist...")
-        while True:
-            try:
-                # Re-fetch the music library section to get updated 'refreshing' state
-                music_library = get_music_library(plex)
-                if not getattr(music_library, 'refreshing', False):
-                    break
-                log_status("Plex scan in progress...")
-            except Exception as e:
-                log_status(f"Error checking Plex scan state: {e}")
-                break
-            time.sleep(5)
+        wait_for_scan(music_library, grace=0)
         log_status("Plex scan complete. Updating playlist with new tracks...")
 
         # Re-scan for newly downloaded tracks and update playlist
         log_status("🔄 Re-scanning for newly downloaded tracks...")
+        set_job_progress(stage="updating_playlist")
         music_library = get_music_library(plex)
 
         final_found_tracks = []
         still_missing = []
+        rating_keys = {}
 
         for spotify_track in spotify_tracks:
+            check_cancelled()
             plex_match = find_plex_match(music_library, spotify_track)
             if plex_match:
                 final_found_tracks.append(plex_match)
             else:
                 still_missing.append(spotify_track)
+            rating_keys.setdefault(track_key(spotify_track), plex_match.ratingKey if plex_match else None)
 
         log_status(f"📊 Final playlist will contain {len(final_found_tracks)} tracks")
+        set_job_progress(tracks_in_playlist=len(final_found_tracks))
         if still_missing:
             log_status(f"⚠️  {len(still_missing)} tracks still missing after download attempt")
 
         create_or_update_plex_playlist(plex, playlist_name, final_found_tracks)
+        playlist_state.record(playlist_id, playlist_name, snapshot_id, len(spotify_tracks),
+                              len(final_found_tracks), len(still_missing), tracks=list(rating_keys.items()))
         
     except ValueError as e:
         log_status(f"Error: {e}")
@@ -0,0 +1,266 @@
+import time
+import bisect
+import threading
+from functools import wraps
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Seconds; covers Plex searches (milliseconds) up to downloads and scan waits (minutes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class _Timer:
+    """Observes elapsed seconds into a histogram child; usable as a context manager or decorator."""
+
+    def __init__(self, child):
+        self._child = child
+        self._started = 0.0
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._started)
+
+    def __call__(self, fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Timer(self._child):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def sample(self):
+        return self.value
+
+
+class _GaugeChild(_CounterChild):
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        # One slot per bucket plus +Inf; made cumulative only when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def sample(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+        (registry or REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Returns the child for these label values; hot paths should keep the result."""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def describe(self) -> Dict:
+        return {"type": self.type, "help": self.documentation, "labelnames": self.labelnames}
+
+    def samples(self) -> Dict[Tuple[str, ...], object]:
+        with self._lock:
+            children = list(self._children.items())
+        return {key: child.sample() for key, child in children}
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return _Timer(self.labels())
+
+    def describe(self) -> Dict:
+        return dict(super().describe(), buckets=self.buckets)
+
+
+class Registry:
+    """
+    Metrics of one process. snapshot() returns plain data that can be sent between
+    processes; merge() adds snapshots from several processes together and render()
+    formats the result in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collect_hooks: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def add_collect_hook(self, hook: Callable[[], None]) -> None:
+        """Runs hook before each snapshot, e.g. to set gauges from current state."""
+        with self._lock:
+            self._collect_hooks.append(hook)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            hooks = list(self._collect_hooks)
+            metrics = list(self._metrics.values())
+        for hook in hooks:
+            try:
+                hook()
+            except Exception:
+                pass
+        return {metric.name: dict(metric.describe(), samples=metric.samples()) for metric in metrics}
+
+
+def merge(snapshots: Sequence[Dict]) -> Dict:
+    """Sums samples with the same name and labels across process snapshots."""
+    merged: Dict[str, Dict] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for key, value in metric["samples"].items():
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = value
+                elif metric["type"] == "histogram":
+                    target["samples"][key] = ([a + b for a, b in zip(current[0], value[0])], current[1] + value[1])
+                else:
+                    target["samples"][key] = current + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render(snapshot: Dict) -> str:
+    lines = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric["labelnames"]
+        for key in sorted(metric["samples"]):
+            value = metric["samples"][key]
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_labels(labelnames, key)} {_number(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + [float('inf')], counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labelnames, key, ('le', _number(bound)))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labelnames, key)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labelnames, key)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Metrics of the sync and download hot paths. Worker processes send snapshots of
+# their registry to the API process, which merges them for /metrics.
+SPOTIFY_PAGE_SECONDS = Histogram(
+    "plexsync_spotify_page_fetch_seconds", "Time of one Spotify API page or object fetch.", ["endpoint"])
+PLEX_SEARCH_SECONDS = Histogram(
+    "plexsync_plex_search_seconds", "Plex searches made while matching a track, by match stage.", ["stage"])
+MATCH_SECONDS = Histogram(
+    "plexsync_track_match_seconds", "Time to match one Spotify track against Plex.", ["result"])
+DOWNLOAD_SECONDS = Histogram(
+    "plexsync_download_seconds", "spotDL run per track, including conversion to MP3.", ["outcome"])
+DOWNLOAD_BYTES = Counter("plexsync_download_bytes_total", "Bytes of successfully downloaded tracks.")
+FILE_MOVE_SECONDS = Histogram(
+    "plexsync_file_move_seconds", "Time to move a downloaded file into the library.", ["method"])
+FILE_MOVE_BYTES = Counter("plexsync_file_move_bytes_total", "Bytes moved into the library.", ["method"])
+PLEX_SCANS = Counter("plexsync_plex_scans_total", "Plex scans requested.", ["kind"])
+PLEX_SCAN_WAIT_SECONDS = Histogram(
+    "plexsync_plex_scan_wait_seconds", "Time spent waiting for a Plex scan to finish.", ["result"])
+DOWNLOADS_QUEUED = Gauge("plexsync_downloads_queued", "Downloads waiting in the download scheduler.")
+DOWNLOADS_ACTIVE = Gauge("plexsync_downloads_active", "Downloads currently running.")
+DOWNLOAD_CONCURRENCY = Gauge("plexsync_download_concurrency", "Current adaptive download concurrency limit.")
+DOWNLOAD_QUEUE_ITEMS = Gauge("plexsync_download_queue_items", "Items in the durable download queue.", ["state"])
+SYNC_JOBS_QUEUED = Gauge("plexsync_sync_jobs_queued", "Sync jobs waiting for a free worker slot.")
+SYNC_JOBS_RUNNING = Gauge("plexsync_sync_jobs_running", "Sync jobs running in worker processes.")
+SYNC_WORKERS_ALIVE = Gauge("plexsync_sync_workers_alive", "Sync worker processes that are running.")
+WATCHLIST_CHECKS = Counter("plexsync_watchlist_checks_total", "Watchlist entries checked for changes.", ["result"])
@@ -0,0 +1,203 @@
+import os
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional
+from credential import get_state_dir
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recording_mbid (
+    key TEXT PRIMARY KEY,
+    mbid TEXT,
+    created_at REAL NOT NULL
+);
+"""
+
+MBID_TAG = 'MusicBrainz Track Id'
+
+
+class MBIDCache:
+    """
+    Persistent lookup key -> MusicBrainz recording ID. Keys are 'isrc:<ISRC>' or
+    'text:<artist>|<title>'. Misses are cached too, but expire after negative_ttl_seconds
+    so recordings added to MusicBrainz later are picked up.
+    """
+
+    def __init__(self, db_path: str, negative_ttl_seconds: float):
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def get(self, key: str):
+        """Returns (found, mbid); mbid is None for a cached miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT mbid, created_at FROM recording_mbid WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return False, None
+        if row[0] is None and time.time() - row[1] > self.negative_ttl_seconds:
+            return False, None
+        return True, row[0]
+
+    def put(self, key: str, mbid: Optional[str]) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO recording_mbid (key, mbid, created_at) VALUES (?, ?, ?)",
+                               (key, mbid, time.time()))
+            self._conn.commit()
+
+
+class MusicBrainzTagger:
+    """
+    Background queue that embeds MusicBrainz recording IDs into downloaded files.
+    A single worker thread spaces requests at least min_interval seconds apart (the
+    MusicBrainz limit is one per second), looks recordings up by ISRC before falling back
+    to a text search, and reads and writes each file's ID3 tags in one pass.
+    """
+
+    def __init__(self, cache: MBIDCache, min_interval: float = 1.0):
+        import musicbrainzngs
+        musicbrainzngs.set_useragent("plexplaylist-sync", "1.0", "https://github.com/yourrepo")
+        self.cache = cache
+        self.min_interval = min_interval
+        self.tagged = 0
+        self.not_found = 0
+        self.lookups = 0
+        self.cache_hits = 0
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._last_request = 0.0
+        self._worker = threading.Thread(target=self._run, name="musicbrainz-tagger", daemon=True)
+        self._worker.start()
+
+    def enqueue(self, file_path: str, track: Optional[Dict] = None) -> None:
+        """Queues a file for tagging; track may supply 'isrc', 'artist' and 'title'."""
+        with self._lock:
+            if file_path in self._pending:
+                return
+            self._pending.add(file_path)
+        self._queue.put((file_path, track or {}))
+
+    def drain(self, timeout: float = 600.0) -> bool:
+        """Blocks until every queued file has been processed; returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    def _throttle(self):
+        wait = self._last_request + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request = time.monotonic()
+
+    def _cached_lookup(self, key: str, lookup):
+        found, mbid = self.cache.get(key)
+        if found:
+            self.cache_hits += 1
+            return mbid
+        import musicbrainzngs
+        self._throttle()
+        self.lookups += 1
+        try:
+            mbid = lookup()
+        except musicbrainzngs.ResponseError as e:
+            # MusicBrainz answers an unknown ISRC with a 404: a miss like an empty result
+            if getattr(e.cause, 'code', None) != 404:
+                raise
+            mbid = None
+        # Other errors (network, rate limit) say nothing about the recording and are not cached
+        self.cache.put(key, mbid)
+        return mbid
+
+    def lookup_mbid(self, isrc: Optional[str], artist: Optional[str], title: Optional[str]) -> Optional[str]:
+        import musicbrainzngs
+        from library_index import make_match_key
+
+        def by_isrc():
+            recordings = musicbrainzngs.get_recordings_by_isrc(isrc).get('isrc', {}).get('recording-list', [])
+            return recordings[0]['id'] if recordings else None
+
+        def by_text():
+            recordings = musicbrainzngs.search_recordings(artist=artist, recording=title, limit=1).get('recording-list', [])
+            return recordings[0]['id'] if recordings else None
+
+        mbid = None
+        if isrc:
+            mbid = self._cached_lookup(f"isrc:{isrc.upper()}", by_isrc)
+        if not mbid and artist and title:
+            mbid = self._cached_lookup(f"text:{make_match_key(artist, title)}", by_text)
+        return mbid
+
+    def tag_file(self, file_path: str, track: Dict) -> Optional[str]:
+        from mutagen.id3 import ID3, TXXX, ID3NoHeaderError
+        try:
+            id3 = ID3(file_path)
+        except ID3NoHeaderError:
+            id3 = ID3()
+        if id3.getall(f'TXXX:{MBID_TAG}'):
+            return None
+
+        def frame_text(frame):
+            return str(id3[frame].text[0]) if frame in id3 and id3[frame].text else None
+
+        isrc = track.get('isrc') or frame_text('TSRC')
+        artist = track.get('artist') or frame_text('TPE1')
+        title = track.get('title') or frame_text('TIT2')
+        mbid = self.lookup_mbid(isrc, artist, title)
+        if not mbid:
+            self.not_found += 1
+            logger.info(f"No MusicBrainz Track ID found for {file_path}")
+            return None
+        id3.add(TXXX(encoding=3, desc=MBID_TAG, text=mbid))
+        id3.save(file_path)
+        self.tagged += 1
+        logger.info(f"Embedded MusicBrainz Track ID: {mbid} in {file_path}")
+        return mbid
+
+    def _run(self):
+        while True:
+            file_path, track = self._queue.get()
+            try:
+                if os.path.exists(file_path):
+                    self.tag_file(file_path, track)
+            except Exception as e:
+                logger.error(f"MusicBrainz tagging failed for {file_path}: {e}")
+            finally:
+                with self._idle:
+                    self._pending.discard(file_path)
+                    if not self._pending:
+                        self._idle.notify_all()
+                self._queue.task_done()
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queue.qsize(),
+            "tagged": self.tagged,
+            "not_found": self.not_found,
+            "lookups": self.lookups,
+            "cache_hits": self.cache_hits,
+        }
+
+
+_tagger = None
+_tagger_lock = threading.Lock()
+
+
+def get_musicbrainz_tagger() -> MusicBrainzTagger:
+    """
+    Returns the process-wide tagger. MUSICBRAINZ_MIN_INTERVAL_SECONDS spaces requests and
+    MUSICBRAINZ_NEGATIVE_TTL_DAYS controls how long a miss stays cached.
+    """
+    global _tagger
+    with _tagger_lock:
+        if _tagger is None:
+            negative_ttl_days = float(os.environ.get('MUSICBRAINZ_NEGATIVE_TTL_DAYS', '7'))
+            cache = MBIDCache(os.path.join(get_state_dir(), "musicbrainz_cache.db"), negative_ttl_days * 86400)
+            _tagger = MusicBrainzTagger(cache, float(os.environ.get('MUSICBRAINZ_MIN_INTERVAL_SECONDS', '1.0')))
+        return _tagger
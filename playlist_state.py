@@ -0,0 +1,110 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+from credential import get_state_dir
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlist_state (
+    playlist_id TEXT PRIMARY KEY,
+    name TEXT,
+    snapshot_id TEXT,
+    tracks_total INTEGER NOT NULL DEFAULT 0,
+    tracks_found INTEGER NOT NULL DEFAULT 0,
+    tracks_missing INTEGER NOT NULL DEFAULT 0,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS playlist_tracks (
+    playlist_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    track_key TEXT NOT NULL,
+    rating_key INTEGER,
+    PRIMARY KEY (playlist_id, track_key)
+);
+"""
+
+
+def track_key(track: Dict) -> str:
+    """Identity of a parsed Spotify track: its Spotify ID, or artist and title for local files."""
+    from spotify_utils import get_spotify_track_id_from_url
+    from library_index import make_match_key
+    return get_spotify_track_id_from_url(track.get('url') or '') or make_match_key(track['artist'], track['title'])
+
+
+class PlaylistState:
+    """
+    Outcome of the last completed sync of each playlist: the Spotify snapshot_id it
+    saw, how many tracks ended up in Plex and which Plex track each Spotify track
+    matched. A playlist whose snapshot_id has not changed and had no missing tracks
+    needs no work on the next sync; otherwise only the tracks added since (and the
+    ones still missing) need matching.
+    """
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def get(self, playlist_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM playlist_state WHERE playlist_id = ?", (playlist_id,)).fetchone()
+        return dict(row) if row else None
+
+    def is_unchanged(self, playlist_id: str, snapshot_id: Optional[str]) -> Optional[Dict]:
+        """The previous result if the playlist is at snapshot_id and nothing was left missing."""
+        if not snapshot_id:
+            return None
+        previous = self.get(playlist_id)
+        if previous and previous['snapshot_id'] == snapshot_id and not previous['tracks_missing']:
+            return previous
+        return None
+
+    def get_tracks(self, playlist_id: str) -> Dict[str, Optional[int]]:
+        """track_key -> Plex ratingKey (None if it was missing) as of the last sync, in playlist order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT track_key, rating_key FROM playlist_tracks WHERE playlist_id = ? ORDER BY position",
+                (playlist_id,),
+            ).fetchall()
+        return {row['track_key']: row['rating_key'] for row in rows}
+
+    def record(self, playlist_id: str, name: str, snapshot_id: Optional[str], tracks_total: int,
+               tracks_found: int, tracks_missing: int,
+               tracks: Optional[List[Tuple[str, Optional[int]]]] = None) -> None:
+        """
+        Stores the result of a completed sync; snapshot_id is the one seen before
+        fetching the tracks. tracks, if given, replaces the stored (track_key,
+        ratingKey) list used for the next delta sync.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO playlist_state "
+                "(playlist_id, name, snapshot_id, tracks_total, tracks_found, tracks_missing, synced_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (playlist_id, name, snapshot_id, tracks_total, tracks_found, tracks_missing, time.time()),
+            )
+            if tracks is not None:
+                self._conn.execute("DELETE FROM playlist_tracks WHERE playlist_id = ?", (playlist_id,))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO playlist_tracks (playlist_id, position, track_key, rating_key) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(playlist_id, position, key, rating_key) for position, (key, rating_key) in enumerate(tracks)],
+                )
+            self._conn.commit()
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def get_playlist_state() -> PlaylistState:
+    """Returns the process-wide playlist state stored under STATE_DIR."""
+    global _state
+    with _state_lock:
+        if _state is None:
+            _state = PlaylistState(os.path.join(get_state_dir(), "playlist_state.db"))
+        return _state
@@ -0,0 +1,211 @@
+import os
+import time
+import logging
+import threading
+from typing import Iterable, Optional
+from metrics import PLEX_SCANS, PLEX_SCAN_WAIT_SECONDS
+from job_cancellation import check_cancelled, sleep_or_cancel
+
+logger = logging.getLogger(__name__)
+
+LOCAL_MUSIC_ROOT = "/app/Songs"
+
+
+def get_plex_music_root(section) -> Optional[str]:
+    """
+    Path of the music folder as Plex sees it. PLEX_MUSIC_PATH wins; otherwise the
+    section's location is used when it has exactly one.
+    """
+    plex_root = os.environ.get('PLEX_MUSIC_PATH')
+    if plex_root:
+        return plex_root.rstrip('/')
+    locations = getattr(section, 'locations', None) or []
+    return locations[0].rstrip('/') if len(locations) == 1 else None
+
+
+def to_plex_path(local_path: str, section, local_root: str = LOCAL_MUSIC_ROOT) -> Optional[str]:
+    """Maps a folder under the local music root to the same folder on the Plex server."""
+    plex_root = get_plex_music_root(section)
+    if not plex_root:
+        return None
+    relative = os.path.relpath(local_path, local_root)
+    if relative.startswith('..'):
+        return None
+    return plex_root if relative == '.' else f"{plex_root}/{relative}"
+
+
+def _is_section_update(activity, section) -> bool:
+    """True for a library update activity of this section; scans of other libraries are ignored."""
+    if not (activity.type or '').startswith('library.update'):
+        return False
+    section_id = getattr(activity, 'librarySectionID', None)
+    if section_id is None:
+        # plexapi keeps the activity's <Context librarySectionID=...> only in the raw XML
+        data = getattr(activity, '_data', None)
+        context = data.find('Context') if data is not None else None
+        if context is not None:
+            section_id = context.attrib.get('librarySectionID')
+    if section_id is not None:
+        return str(section_id) == str(section.key)
+    # Without a section id, match the title Plex gives scans ("Scanning <section>")
+    return bool(section.title) and section.title in (activity.title or '')
+
+
+def is_scanning(section) -> bool:
+    """True while Plex reports a library update activity of the section or the section is refreshing."""
+    try:
+        activities = section._server.activities
+    except Exception as e:
+        logger.debug(f"Could not read Plex activities: {e}")
+        activities = []
+    if any(_is_section_update(activity, section) for activity in activities):
+        return True
+    section.reload()
+    return bool(getattr(section, 'refreshing', False))
+
+
+def wait_for_scan(section, timeout: Optional[float] = None, grace: Optional[float] = None,
+                  poll_interval: float = 1.0) -> bool:
+    """
+    Waits until Plex has finished scanning. A scan that was just requested may take a
+    moment to show up, so an idle server only counts as done once a scan has been seen
+    or the grace period has passed. Returns False on timeout; raises JobCancelled if
+    the calling job is cancelled while waiting.
+    """
+    timeout = timeout if timeout is not None else float(os.environ.get('PLEX_SCAN_TIMEOUT_SECONDS', '600'))
+    grace = grace if grace is not None else float(os.environ.get('PLEX_SCAN_GRACE_SECONDS', '5'))
+    started = time.monotonic()
+    seen_scan = False
+    while True:
+        elapsed = time.monotonic() - started
+        try:
+            scanning = is_scanning(section)
+        except Exception as e:
+            logger.warning(f"⚠️  Could not check Plex scan state: {e}")
+            return False
+        if scanning:
+            seen_scan = True
+        elif seen_scan or elapsed >= grace:
+            PLEX_SCAN_WAIT_SECONDS.labels('done').observe(time.monotonic() - started)
+            return True
+        if elapsed >= timeout:
+            PLEX_SCAN_WAIT_SECONDS.labels('timeout').observe(elapsed)
+            logger.warning(f"⚠️  Plex scan still running after {timeout:.0f}s, continuing without it")
+            return False
+        sleep_or_cancel(poll_interval)
+
+
+def scan_paths(section, local_paths: Iterable[str], local_root: str = LOCAL_MUSIC_ROOT,
+               timeout: Optional[float] = None) -> bool:
+    """
+    Asks Plex to scan only the folders that received files, then waits for the scan to
+    finish. Falls back to a full section scan when a folder cannot be mapped to a Plex
+    path or more than PLEX_SCAN_MAX_PATHS folders changed.
+    """
+    folders = sorted({path if os.path.isdir(path) else os.path.dirname(path) for path in local_paths})
+    if not folders:
+        return True
+    max_paths = int(os.environ.get('PLEX_SCAN_MAX_PATHS', '25'))
+    plex_paths = [to_plex_path(folder, section, local_root) for folder in folders]
+    started = time.monotonic()
+    if len(plex_paths) > max_paths or any(p is None for p in plex_paths):
+        logger.info("🔄 Triggered full Plex library scan...")
+        PLEX_SCANS.labels('full').inc()
+        section.update()
+    else:
+        logger.info(f"🔄 Triggered Plex scan of {len(plex_paths)} folder(s)...")
+        PLEX_SCANS.labels('partial').inc()
+        for plex_path in plex_paths:
+            section.update(path=plex_path)
+    done = wait_for_scan(section, timeout)
+    if done:
+        logger.info(f"✅ Plex scan complete in {time.monotonic() - started:.0f}s. Library updated successfully!")
+    return done
+
+
+class _ScanBatch:
+    def __init__(self):
+        self.paths = set()
+        self.section = None
+        self.local_root = LOCAL_MUSIC_ROOT
+        self.waiters = 0
+        self.done = threading.Event()
+        self.result = False
+
+
+class ScanCoordinator:
+    """
+    Coalesces scan requests from concurrent jobs. Requests arriving within
+    debounce_seconds of each other are merged into one batch whose folders are scanned
+    together; every job waiting on the batch is released when that scan completes.
+    Requests made while a scan runs go into the next batch.
+    """
+
+    def __init__(self, debounce_seconds: float = 5.0):
+        self.debounce_seconds = debounce_seconds
+        self.scans = 0
+        self.requests = 0
+        self._cond = threading.Condition()
+        self._pending: Optional[_ScanBatch] = None
+        self._worker = None
+
+    def request(self, section, paths: Iterable[str], local_root: str = LOCAL_MUSIC_ROOT) -> bool:
+        """
+        Adds paths to the next scan and blocks until it finishes; returns the scan result.
+        A cancelled job stops waiting, but the scan still runs for the other jobs.
+        """
+        with self._cond:
+            self.requests += 1
+            if self._pending is None:
+                self._pending = _ScanBatch()
+            batch = self._pending
+            batch.paths.update(paths)
+            batch.section = section
+            batch.local_root = local_root
+            batch.waiters += 1
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="plex-scan", daemon=True)
+                self._worker.start()
+            self._cond.notify_all()
+        while not batch.done.wait(1):
+            check_cancelled()
+        return batch.result
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._pending is None:
+                    self._worker = None
+                    return
+                # Debounce: keep collecting until no new request arrived for a full window,
+                # but never hold the first request back longer than four windows
+                deadline = time.monotonic() + self.debounce_seconds * 4
+                while True:
+                    requests = self.requests
+                    self._cond.wait(self.debounce_seconds)
+                    if self.requests == requests or time.monotonic() >= deadline:
+                        break
+                batch, self._pending = self._pending, None
+            if batch.waiters > 1:
+                logger.info(f"🔗 Merged scan requests from {batch.waiters} jobs into one Plex scan")
+            try:
+                batch.result = scan_paths(batch.section, batch.paths, batch.local_root)
+            except Exception as e:
+                logger.error(f"❌ Failed to trigger or track Plex scan: {e}")
+                batch.result = False
+            finally:
+                self.scans += 1
+                batch.done.set()
+
+
+_coordinator = None
+_coordinator_lock = threading.Lock()
+
+
+def get_scan_coordinator() -> ScanCoordinator:
+    """Returns the process-wide scan coordinator; PLEX_SCAN_DEBOUNCE_SECONDS sets the merge window."""
+    global _coordinator
+    with _coordinator_lock:
+        if _coordinator is None:
+            _coordinator = ScanCoordinator(float(os.environ.get('PLEX_SCAN_DEBOUNCE_SECONDS', '5')))
+        return _coordinator
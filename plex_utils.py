@@ -1,3 +1,20 @@
+import time
+from functools import wraps
+from metrics import PLEX_SEARCH_SECONDS, MATCH_SECONDS
+
+
+def _timed_match(fn):
+    """Records how long a match function took, labelled by whether it found a track."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        match = fn(*args, **kwargs)
+        MATCH_SECONDS.labels('found' if match is not None else 'missing').observe(time.perf_counter() - started)
+        return match
+    return wrapper
+
+
+@_timed_match
 def find_plex_match_robust(music_library, spotify_track, threshold=85, logger=None):
     """
     Multi-stage search for a Plex track matching the given Spotify track dict.
@@ -22,7 +39,8 @@ def find_plex_match_robust(music_library, spotify_track, threshold=85, logger=No
 
     # 1. Exact match (all fields)
     try:
-        candidates = music_library.searchTracks(title=spotify_track['title'])
+        with PLEX_SEARCH_SECONDS.labels('exact').time():
+            candidates = music_library.searchTracks(title=spotify_track['title'])
         for plex_track in candidates:
             if not (plex_track.parentTitle and plex_track.grandparentTitle):
                 continue
@@ -36,7 +54,8 @@ def find_plex_match_robust(music_library, spotify_track, threshold=85, logger=No
 
     # 2. Fuzzy match (weighted)
     try:
-        candidates = music_library.searchTracks(title=spotify_track['title'])
+        with PLEX_SEARCH_SECONDS.labels('fuzzy').time():
+            candidates = music_library.searchTracks(title=spotify_track['title'])
         best_match = None
         highest_score = 0
         for plex_track in candidates:
@@ -57,7 +76,8 @@ def find_plex_match_robust(music_library, spotify_track, threshold=85, logger=No
 
     # 3. Title-only search, filter by artist
     try:
-        candidates = music_library.searchTracks(title=spotify_track['title'])
+        with PLEX_SEARCH_SECONDS.labels('title_only').time():
+            candidates = music_library.searchTracks(title=spotify_track['title'])
         for plex_track in candidates:
             if not plex_track.grandparentTitle:
                 continue
@@ -69,7 +89,8 @@ def find_plex_match_robust(music_library, spotify_track, threshold=85, logger=No
 
     # 4. Artist-only search, filter by title
     try:
-        candidates = music_library.searchTracks(artist=spotify_track['artist'])
+        with PLEX_SEARCH_SECONDS.labels('artist_only').time():
+            candidates = music_library.searchTracks(artist=spotify_track['artist'])
         for plex_track in candidates:
             if not plex_track.title:
                 continue
@@ -81,7 +102,8 @@ def find_plex_match_robust(music_library, spotify_track, threshold=85, logger=No
 
     # 5. Album search, filter by title/artist
     try:
-        candidates = music_library.searchTracks(album=spotify_track['album'])
+        with PLEX_SEARCH_SECONDS.labels('album').time():
+            candidates = music_library.searchTracks(album=spotify_track['album'])
         for plex_track in candidates:
             if not (plex_track.title and plex_track.grandparentTitle):
                 continue
@@ -94,7 +116,8 @@ def find_plex_match_robust(music_library, spotify_track, threshold=85, logger=No
     # 6. Fuzzy filename search (final fallback)
     try:
         # Get all tracks in the library (may be slow for huge libraries)
-        all_tracks = music_library.all()
+        with PLEX_SEARCH_SECONDS.labels('filename').time():
+            all_tracks = music_library.all()
         best_match = None
         highest_score = 0
         # Build expected filename (normalize as in download)
@@ -136,6 +159,7 @@ def get_music_library(plex):
     return plex.library.section(music_library_name)
 
 
+@_timed_match
 def find_plex_match(music_library, spotify_track, threshold=60):
     import re
     from thefuzz import fuzz
@@ -145,7 +169,8 @@ def find_plex_match(music_library, spotify_track, threshold=60):
     print(f"    🔍 Plex search for: '{spotify_track['title']}' by '{spotify_track['artist']}'")
     
     try:
-        candidates = music_library.searchTracks(title=spotify_track['title'])
+        with PLEX_SEARCH_SECONDS.labels('title').time():
+            candidates = music_library.searchTracks(title=spotify_track['title'])
         if not candidates:
             print(f"    ❌ No tracks found with title: '{spotify_track['title']}'")
             return None
@@ -199,3 +224,26 @@ def create_or_update_plex_playlist(plex, playlist_title, found_plex_tracks):
         print(f"Playlist '{playlist_title}' not found. Creating a new playlist...")
         plex.createPlaylist(title=playlist_title, items=found_plex_tracks)
         print(f"Successfully created playlist '{playlist_title}' with {len(found_plex_tracks)} tracks.")
+
+
+def get_plex_playlist(plex, playlist_title):
+    """The Plex playlist with this title, or None if it does not exist."""
+    try:
+        return plex.playlist(playlist_title)
+    except NotFound:
+        return None
+
+
+def apply_plex_playlist_changes(playlist, tracks_to_add, rating_keys_to_remove):
+    """
+    Adds and removes items of an existing Plex playlist in place. Only lists the
+    playlist's items when something has to be removed.
+    """
+    if rating_keys_to_remove:
+        items_to_remove = [item for item in playlist.items() if item.ratingKey in rating_keys_to_remove]
+        if items_to_remove:
+            playlist.removeItems(items_to_remove)
+            print(f"Removed {len(items_to_remove)} tracks from the playlist.")
+    if tracks_to_add:
+        playlist.addItems(tracks_to_add)
+        print(f"Added {len(tracks_to_add)} new tracks to the playlist.")
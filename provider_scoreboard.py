@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from typing import Dict, List, Optional
+from credential import get_state_dir
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderStats:
+    """Exponentially weighted averages for one audio provider."""
+
+    def __init__(self, data: Optional[Dict] = None):
+        data = data or {}
+        self.search_latency = data.get('search_latency')
+        self.throughput = data.get('throughput')
+        self.failure_rate = data.get('failure_rate', 0.0)
+        self.samples = data.get('samples', 0)
+        self.stalls = data.get('stalls', 0)
+
+    def to_dict(self) -> Dict:
+        return {
+            'search_latency': self.search_latency,
+            'throughput': self.throughput,
+            'failure_rate': self.failure_rate,
+            'samples': self.samples,
+            'stalls': self.stalls,
+        }
+
+
+def _ewma(current, value, alpha):
+    return value if current is None else (alpha * value + (1 - alpha) * current)
+
+
+class ProviderScoreboard:
+    """
+    Records search latency, download throughput and failure rate per audio provider
+    and orders providers by recent score, so slow or blocked providers are demoted.
+    A small share of tracks gets a shuffled order so demoted providers are still
+    sampled and can recover.
+    """
+
+    def __init__(self, path: Optional[str] = None, alpha: float = 0.2, explore_rate: float = 0.05,
+                 save_interval: float = 30.0):
+        self.path = path
+        self.alpha = alpha
+        self.explore_rate = explore_rate
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._providers: Dict[str, ProviderStats] = {}
+        self._last_save = 0.0
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._providers = {name: ProviderStats(data) for name, data in json.load(f).items()}
+            except Exception as e:
+                logger.warning(f"Could not load provider scoreboard from {path}: {e}")
+
+    def _stats(self, provider: str) -> ProviderStats:
+        if provider not in self._providers:
+            self._providers[provider] = ProviderStats()
+        return self._providers[provider]
+
+    def record_search(self, provider: str, seconds: float) -> None:
+        with self._lock:
+            stats = self._stats(provider)
+            stats.search_latency = _ewma(stats.search_latency, seconds, self.alpha)
+            self._maybe_save()
+
+    def record_download(self, provider: str, seconds: float, nbytes: int, ok: bool) -> None:
+        with self._lock:
+            stats = self._stats(provider)
+            stats.samples += 1
+            stats.failure_rate = _ewma(stats.failure_rate, 0.0 if ok else 1.0, self.alpha)
+            if ok and seconds > 0:
+                stats.throughput = _ewma(stats.throughput, nbytes / seconds, self.alpha)
+            self._maybe_save()
+
+    def record_stall(self, provider: str) -> None:
+        with self._lock:
+            self._stats(provider).stalls += 1
+
+    def score(self, provider: str, default_throughput: float = 1.0) -> Optional[float]:
+        """
+        Higher is better; None until a download through the provider is on record.
+        Failures and stalls lower the score even before any download succeeded, in
+        which case the throughput is taken as default_throughput.
+        """
+        with self._lock:
+            stats = self._providers.get(provider)
+            if not stats or not stats.samples:
+                return None
+            throughput = stats.throughput if stats.throughput is not None else default_throughput
+            latency_penalty = 1.0 + (stats.search_latency or 0.0)
+            stall_penalty = 1.0 + stats.stalls / stats.samples
+            return throughput * (1.0 - stats.failure_rate) / (latency_penalty * stall_penalty)
+
+    def rank(self, providers: List[str]) -> List[str]:
+        """
+        Orders providers best first. Providers without data are scored as a provider
+        with the best known throughput and no failures, so each gets tried; ties keep
+        the configured order.
+        """
+        providers = list(providers)
+        if len(providers) < 2:
+            return providers
+        if random.random() < self.explore_rate:
+            random.shuffle(providers)
+            return providers
+        with self._lock:
+            known_throughputs = [self._providers[p].throughput for p in providers
+                                 if p in self._providers and self._providers[p].throughput is not None]
+        default_throughput = max(known_throughputs) if known_throughputs else 1.0
+        scores = {p: self.score(p, default_throughput) for p in providers}
+        return sorted(providers, key=lambda p: -(scores[p] if scores[p] is not None else default_throughput))
+
+    def stall_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {name: stats.stalls for name, stats in self._providers.items() if stats.stalls}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in self._providers.items()}
+
+    def _maybe_save(self):
+        now = time.monotonic()
+        if not self.path or now - self._last_save < self.save_interval:
+            return
+        self._last_save = now
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({name: stats.to_dict() for name, stats in self._providers.items()}, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Could not save provider scoreboard: {e}")
+
+
+_scoreboard = None
+_scoreboard_lock = threading.Lock()
+
+
+def get_provider_scoreboard() -> ProviderScoreboard:
+    """Returns the process-wide provider scoreboard persisted under STATE_DIR."""
+    global _scoreboard
+    with _scoreboard_lock:
+        if _scoreboard is None:
+            _scoreboard = ProviderScoreboard(
+                os.path.join(get_state_dir(), "provider_scores.json"),
+                explore_rate=float(os.environ.get('PROVIDER_EXPLORE_RATE', '0.05')),
+            )
+        return _scoreboard
@@ -24,7 +24,40 @@ Instructions:
 4. A report of missing tracks will be saved in the current directory.
 '''
 
+def parse_args():
+    import argparse
+    parser = argparse.ArgumentParser(description="Sync Spotify playlists to Plex. Without arguments, asks for one playlist URL.")
+    parser.add_argument('urls', nargs='*', help="Spotify playlist URLs to sync as one batch")
+    parser.add_argument('--file', help="File with one playlist URL per line ('#' starts a comment)")
+    parser.add_argument('--force', action='store_true', help="Sync playlists even if unchanged since their last sync")
+    return parser.parse_args()
+
+
+def batch_urls(args):
+    urls = list(args.urls)
+    if args.file:
+        with open(args.file) as f:
+            urls += [line.split('#', 1)[0].strip() for line in f]
+    return [url for url in urls if url]
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    urls = batch_urls(args)
+    if urls:
+        # Batch mode: shared tracks are matched and downloaded once for all playlists
+        from batch_sync import sync_playlists
+        try:
+            results = sync_playlists(urls, force=args.force)
+        except KeyboardInterrupt:
+            print("\nOperation cancelled by user.")
+            sys.exit(0)
+        except Exception as e:
+            print(f"\nAn error occurred: {e}")
+            sys.exit(1)
+        for name, count in results.items():
+            print(f"{name}: {count} tracks")
+        sys.exit(0)
     print(WELCOME)
     print(INSTRUCTIONS)
     try:
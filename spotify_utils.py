@@ -3,6 +3,7 @@ from spotipy.oauth2 import SpotifyClientCredentials
 from spotipy_anon import SpotifyAnon
 from urllib.parse import urlparse
 from credential import get_spotify_credentials
+from metrics import SPOTIFY_PAGE_SECONDS
 
 
 def get_spotify_playlist_id_from_url(url):
@@ -26,6 +27,40 @@ def get_spotify_playlist_id_from_url(url):
     return None
 
 
+def get_spotify_resource_key(url):
+    """
+    Canonical '<type>:<id>' key for a Spotify playlist, artist, album or track URL or
+    URI, ignoring locale prefixes and query strings (e.g. ?si=...). None if unrecognized.
+    """
+    url = (url or '').strip()
+    if url.startswith('spotify:'):
+        parts = url.split(':')
+    else:
+        parsed_url = urlparse(url)
+        if parsed_url.netloc != "open.spotify.com":
+            return None
+        parts = [part for part in parsed_url.path.split('/') if part]
+    for kind in ('playlist', 'artist', 'album', 'track'):
+        if kind in parts and parts.index(kind) + 1 < len(parts):
+            return f"{kind}:{parts[parts.index(kind) + 1]}"
+    return None
+
+
+def get_spotify_url_from_resource_key(resource):
+    """open.spotify.com URL for a '<type>:<id>' key from get_spotify_resource_key."""
+    kind, spotify_id = resource.split(':', 1)
+    return f"https://open.spotify.com/{kind}/{spotify_id}"
+
+
+def get_spotify_track_id_from_url(url):
+    parsed_url = urlparse(url)
+    if parsed_url.netloc == "open.spotify.com":
+        path_parts = parsed_url.path.split('/')
+        if 'track' in path_parts and path_parts.index('track') + 1 < len(path_parts):
+            return path_parts[path_parts.index('track') + 1]
+    return None
+
+
 def setup_spotify_client():
     client_id, client_secret = get_spotify_credentials()
     
@@ -37,17 +72,35 @@ def setup_spotify_client():
     return sp_authenticated, sp_anonymous
 
 
+def get_spotify_playlist_snapshot(sp_authenticated, sp_anonymous, playlist_id):
+    """
+    (name, snapshot_id) of a playlist from one small metadata request. Falls back to
+    the anonymous client on 404, like get_spotify_playlist_tracks.
+    """
+    with SPOTIFY_PAGE_SECONDS.labels('playlist_snapshot').time():
+        try:
+            info = sp_authenticated.playlist(playlist_id, fields='name,snapshot_id')
+        except spotipy.SpotifyException as e:
+            if e.http_status != 404:
+                raise
+            info = sp_anonymous.playlist(playlist_id, fields='name,snapshot_id')
+    return info['name'], info.get('snapshot_id')
+
+
 def get_spotify_playlist_tracks(sp_authenticated, sp_anonymous, playlist_id):
     try:
         # First attempt with authenticated client
         all_tracks = []
         playlist_info = sp_authenticated.playlist(playlist_id, fields='name,tracks.total')
         playlist_name = playlist_info['name']
-        results = sp_authenticated.playlist_items(playlist_id)
+        page_timer = SPOTIFY_PAGE_SECONDS.labels('playlist_items')
+        with page_timer.time():
+            results = sp_authenticated.playlist_items(playlist_id)
         if results and 'items' in results:
             all_tracks.extend(results['items'])
             while results['next']:
-                results = sp_authenticated.next(results)
+                with page_timer.time():
+                    results = sp_authenticated.next(results)
                 all_tracks.extend(results['items'])
         print(f"✅ Successfully accessed playlist '{playlist_name}' with authenticated client")
         return playlist_name, all_tracks
@@ -62,11 +115,14 @@ def get_spotify_playlist_tracks(sp_authenticated, sp_anonymous, playlist_id):
                 all_tracks = []
                 playlist_info = sp_anonymous.playlist(playlist_id, fields='name,tracks.total')
                 playlist_name = playlist_info['name']
-                results = sp_anonymous.playlist_items(playlist_id)
+                page_timer = SPOTIFY_PAGE_SECONDS.labels('playlist_items')
+                with page_timer.time():
+                    results = sp_anonymous.playlist_items(playlist_id)
                 if results and 'items' in results:
                     all_tracks.extend(results['items'])
                     while results['next']:
-                        results = sp_anonymous.next(results)
+                        with page_timer.time():
+                            results = sp_anonymous.next(results)
                         all_tracks.extend(results['items'])
                 print(f"✅ Successfully accessed playlist '{playlist_name}' with anonymous client")
                 return playlist_name, all_tracks
@@ -117,6 +173,7 @@ def parse_spotify_tracks(raw_tracks):
         track_number = track_data.get('track_number')
         disc_number = track_data.get('disc_number')
         year = track_data.get('album', {}).get('release_date', '')[:4]
+        isrc = track_data.get('external_ids', {}).get('isrc')
         genre = None  # Spotify API does not provide genre per track by default
         if track_name and primary_artist and album_name:
             parsed_tracks.append({
@@ -127,6 +184,7 @@ def parse_spotify_tracks(raw_tracks):
                 'track_number': track_number,
                 'disc_number': disc_number,
                 'year': year,
-                'genre': genre
+                'genre': genre,
+                'isrc': isrc
             })
     return parsed_tracks
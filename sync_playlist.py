@@ -1,9 +1,6 @@
 import os
 import sys
 import glob
-import musicbrainzngs
-from mutagen.easyid3 import EasyID3
-from mutagen.id3 import ID3, TXXX
 from urllib.parse import urlparse
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
@@ -96,12 +93,14 @@ def parse_spotify_tracks(raw_tracks):
         artists = track_data.get('artists', [])
         primary_artist = artists[0]['name'] if artists else None
         spotify_url = track_data.get('external_urls', {}).get('spotify')
+        isrc = track_data.get('external_ids', {}).get('isrc')
         if track_name and primary_artist and album_name:
             parsed_tracks.append({
                 'title': track_name,
                 'artist': primary_artist,
                 'album': album_name,
-                'url': spotify_url
+                'url': spotify_url,
+                'isrc': isrc
             })
     return parsed_tracks
 
@@ -163,18 +162,25 @@ def create_or_update_plex_playlist(plex, playlist_title, found_plex_tracks):
 
 
 
-def download_missing_tracks_spotdl(missing_tracks_urls, download_dir):
-    # Setup MusicBrainz client
-    musicbrainzngs.set_useragent("plexplaylist-sync", "1.0", "https://github.com/yourrepo")
-    """Downloads missing tracks using spotDL to the specified directory."""
-    if not missing_tracks_urls:
+def download_missing_tracks_spotdl(missing_tracks, download_dir):
+    """
+    Downloads missing tracks using spotDL to the specified directory.
+    missing_tracks holds parsed track dicts (or plain Spotify URLs). MusicBrainz IDs are
+    embedded by the background tagger, which prefers the track's ISRC over a text search.
+    """
+    from musicbrainz_tagger import get_musicbrainz_tagger
+    if not missing_tracks:
         print("No missing tracks to download.")
         return
+    tagger = get_musicbrainz_tagger()
     os.makedirs(download_dir, exist_ok=True)
     # Required Metadata Tags for Plex:
     # Artist, Album Artist, Album, Track Title, Track Number, Disc Number, Year, Genre, MusicBrainz IDs
     # spotDL embeds most tags by default if available from Spotify/YouTube
-    for url in missing_tracks_urls:
+    for track in missing_tracks:
+        if not isinstance(track, dict):
+            track = {'url': track}
+        url = track['url']
         print(f"Downloading: {url}")
         output_template = f"{download_dir}/{{artist}}/{{album}}/{{track_number}} - {{title}}.{{output-ext}}"
         fallback_template = f"{download_dir}/{{artist}} - {{title}}.{{output-ext}}"
@@ -194,37 +200,20 @@ def download_missing_tracks_spotdl(missing_tracks_urls, download_dir):
                 continue
             else:
                 print(f"Downloaded (fallback): {url}")
-                downloaded_path = fallback_template.replace("{{artist}}", "*").replace("{{title}}", "*").replace("{{output-ext}}", "mp3")
+                downloaded_path = fallback_template.replace("{artist}", "*").replace("{title}", "*").replace("{output-ext}", "mp3")
         else:
             print(f"Downloaded: {url}")
-            downloaded_path = output_template.replace("{{artist}}", "*").replace("{{album}}", "*").replace("{{track_number}}", "*").replace("{{title}}", "*").replace("{{output-ext}}", "mp3")
+            downloaded_path = output_template.replace("{artist}", "*").replace("{album}", "*").replace("{track_number}", "*").replace("{title}", "*").replace("{output-ext}", "mp3")
 
-        # MusicBrainz tagging: try to find and embed MBIDs
+        # MusicBrainz tagging runs in the background so downloads are not held up by its rate limit
         if downloaded_path:
-            for file_path in glob.glob(downloaded_path):
-                try:
-                    audio = EasyID3(file_path)
-                    artist = audio.get('artist', [None])[0]
-                    album = audio.get('album', [None])[0]
-                    title = audio.get('title', [None])[0]
-                    mbid = None
-                    if artist and title:
-                        try:
-                            result = musicbrainzngs.search_recordings(artist=artist, recording=title, limit=1)
-                            recordings = result.get('recording-list', [])
-                            if recordings:
-                                mbid = recordings[0]['id']
-                        except Exception as e:
-                            print(f"MusicBrainz search error: {e}")
-                    if mbid:
-                        id3 = ID3(file_path)
-                        id3.add(TXXX(encoding=3, desc='MusicBrainz Track Id', text=mbid))
-                        id3.save()
-                        print(f"Embedded MusicBrainz Track ID: {mbid} in {file_path}")
-                    else:
-                        print(f"No MusicBrainz Track ID found for {file_path}")
-                except Exception as e:
-                    print(f"MusicBrainz tagging failed for {file_path}: {e}")
+            for file_path in sorted(glob.glob(downloaded_path), key=os.path.getmtime, reverse=True)[:1]:
+                tagger.enqueue(file_path, {'isrc': track.get('isrc')})
+
+    print("Waiting for MusicBrainz tagging to finish...")
+    if not tagger.drain():
+        print("MusicBrainz tagging did not finish in time; the remaining files stay untagged.")
+    print(f"MusicBrainz tagging: {tagger.stats()}")
 
 
 def main():
@@ -252,7 +241,7 @@ def main():
         if match:
             found_plex_tracks.append(match)
         else:
-            missing_spotify_tracks.append(track['url'])
+            missing_spotify_tracks.append(track)
         # Simple progress bar
         progress = i + 1
         bar_length = 40
@@ -267,9 +256,8 @@ def main():
 
     # Wait for Plex scan to complete (if needed)
     print("Waiting for Plex scan to complete before updating playlist...")
-    import time
-    sleep_time = int(os.environ.get('PLEX_SCAN_SLEEP_SECONDS', '300'))
-    time.sleep(sleep_time)
+    from plex_scan import wait_for_scan
+    wait_for_scan(music_library, grace=0)
     print("Plex scan complete. Updating playlist with new tracks...")
 
     # Download Spotify playlist cover image
@@ -0,0 +1,360 @@
+import os
+import time
+import queue
+import signal
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds between metrics snapshots sent by each worker
+STATS_INTERVAL_SECONDS = 5.0
+
+
+def sync_spotify_url(spotify_url, job_id=None, force=False):
+    """
+    Auto-detects URL type and routes to appropriate sync function. A list of
+    playlist URLs is synced as one batch. job_id identifies the job to the shared
+    download scheduler; force syncs playlists even if they are unchanged.
+    """
+    if isinstance(spotify_url, (list, tuple)):
+        from batch_sync import sync_playlists
+        logging.info(f"📚 Starting batch sync of {len(spotify_url)} playlists...")
+        sync_playlists(list(spotify_url), job_id=job_id, force=force)
+    elif '/artist/' in spotify_url:
+        # Artist sync
+        from download_utils import download_missing_artist_tracks_spotdl
+        download_dir = "/app/downloads"
+        logging.info(f"🎤 Detected artist URL, starting artist sync...")
+        download_missing_artist_tracks_spotdl(spotify_url, download_dir, job_id=job_id)
+    elif '/playlist/' in spotify_url:
+        # Playlist sync (existing functionality)
+        from main import sync_playlist
+        logging.info(f"📋 Detected playlist URL, starting playlist sync...")
+        sync_playlist(spotify_url, job_id=job_id, force=force)
+    else:
+        raise ValueError("Unsupported Spotify URL. Please provide a playlist or artist URL.")
+
+
+def _run_task(index, task, events):
+    from job_logging import job_context
+    from job_cancellation import JobCancelled, release_job
+    from job_store import RUNNING, DONE, ERROR, CANCELLED
+    job_id, url, options = task[1]
+    events.put(('status', job_id, RUNNING, None))
+    # Log records are routed to this job by the context variable, including
+    # records from download worker threads, which inherit the context
+    with job_context(job_id):
+        try:
+            sync_spotify_url(url, job_id=job_id, **options)
+            events.put(('status', job_id, DONE, None))
+        except JobCancelled:
+            events.put(('log', job_id, "🛑 Job cancelled"))
+            events.put(('status', job_id, CANCELLED, None))
+        except Exception as e:
+            events.put(('log', job_id, f"❌ Error: {str(e)}"))
+            events.put(('status', job_id, ERROR, str(e)))
+        finally:
+            release_job(job_id)
+            events.put(('finished', index, job_id))
+
+
+def _worker_main(index: int, inbox, events):
+    """
+    Entry point of a worker process: runs each task from its inbox in a thread (the
+    pool never sends more than the worker's concurrency) and sends logs, progress,
+    status changes and periodic metrics back over the event queue. Downloads are
+    requested from the API process and their results come back through the inbox.
+    ('cancel', job_id) cancels a running job; None stops the worker once its running
+    tasks are done.
+    """
+    from metrics import REGISTRY
+    from job_logging import install_job_log_router, set_log_sink, set_progress_sink
+    from job_cancellation import register_job, cancel_job
+    from download_service import DownloadClient, set_download_client
+    # Shutdown is driven by the API process; a Ctrl+C sent to the process group must
+    # not abort jobs that are still finishing
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    set_log_sink(lambda job_id, message: events.put(('log', job_id, message)))
+    set_progress_sink(lambda job_id, values, increments: events.put(('progress', job_id, values, increments)))
+    install_job_log_router()
+    client = DownloadClient(index, events)
+    set_download_client(client)
+    threads = []
+    last_stats = 0.0
+    while True:
+        if time.monotonic() - last_stats >= STATS_INTERVAL_SECONDS:
+            try:
+                events.put(('metrics', index, os.getpid(), REGISTRY.snapshot()))
+            except Exception as e:
+                logger.debug(f"Could not collect worker metrics: {e}")
+            last_stats = time.monotonic()
+        try:
+            task = inbox.get(timeout=STATS_INTERVAL_SECONDS)
+        except queue.Empty:
+            continue
+        if task is None:
+            break
+        if task[0] == 'cancel':
+            cancel_job(task[1])
+            continue
+        if task[0] == 'download_result':
+            client.resolve(*task[1:])
+            continue
+        # Registered before the thread starts, so a cancel that follows is never missed
+        register_job(task[1][0])
+        thread = threading.Thread(target=_run_task, args=(index, task, events), name="sync-job", daemon=True)
+        thread.start()
+        threads = [t for t in threads if t.is_alive()] + [thread]
+    for thread in threads:
+        thread.join()
+
+
+class _Worker:
+    def __init__(self, process, inbox):
+        self.process = process
+        self.inbox = inbox
+        self.tasks = set()
+
+
+class SyncWorkerPool:
+    """
+    Runs sync jobs in worker processes so matching and Plex waits neither share the API
+    process's GIL nor its request threadpool. Jobs wait in the API process and are handed
+    to the least busy worker with a free slot; each worker runs at most concurrency jobs
+    at once. The job store and the download service stay in the API process: a relay
+    thread applies the events workers send back and passes their download requests to
+    the service. A worker that dies is replaced and its jobs are failed.
+    """
+
+    def __init__(self, processes: int = 2, concurrency: int = 2):
+        self.processes = processes
+        self.concurrency = concurrency
+        self.worker_metrics: Dict[int, Dict] = {}
+        # Counters and histograms of workers that exited, so merged totals never go down
+        self.retired_metrics: Dict = {}
+        self._context = multiprocessing.get_context('spawn')
+        self._events = self._context.Queue()
+        self._workers: Dict[int, _Worker] = {}
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._relay = None
+
+    def start(self) -> None:
+        from metrics import REGISTRY
+        REGISTRY.add_collect_hook(self._set_gauges)
+        with self._lock:
+            for index in range(self.processes):
+                self._start_worker(index)
+            self._dispatch()
+        self._relay = threading.Thread(target=self._run_relay, name="sync-worker-events", daemon=True)
+        self._relay.start()
+        logger.info(f"🧵 Started {self.processes} sync worker(s) with {self.concurrency} job(s) each")
+
+    def _start_worker(self, index: int) -> None:
+        # Each worker has its own inbox: a worker killed while reading a shared queue
+        # would leave that queue's lock held and stall every other worker
+        inbox = self._context.Queue()
+        process = self._context.Process(target=_worker_main, args=(index, inbox, self._events),
+                                        name=f"sync-worker-{index}", daemon=True)
+        process.start()
+        self._workers[index] = _Worker(process, inbox)
+
+    def _dispatch(self) -> None:
+        # Caller holds self._lock
+        while self._pending and not self._stopping:
+            index, worker = min(self._workers.items(), key=lambda entry: len(entry[1].tasks))
+            if len(worker.tasks) >= self.concurrency:
+                return
+            task = self._pending.popleft()
+            worker.tasks.add(task[1][0])
+            worker.inbox.put(task)
+
+    def submit(self, job_id: str, url, **options) -> None:
+        """
+        Queues a job; url is a Spotify URL or a list of playlist URLs for a batch.
+        options are passed to sync_spotify_url (e.g. force=True).
+        """
+        with self._lock:
+            self._pending.append(('sync', (job_id, url, options)))
+            self._dispatch()
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancels a job: a waiting job is dropped right away, a running one is told to
+        stop by its worker. Returns False if the pool does not know the job.
+        """
+        from job_store import get_job_store, CANCELLED
+        with self._lock:
+            for task in self._pending:
+                if task[1][0] == job_id:
+                    self._pending.remove(task)
+                    break
+            else:
+                for worker in self._workers.values():
+                    if job_id in worker.tasks:
+                        worker.inbox.put(('cancel', job_id))
+                        return True
+                return False
+        get_job_store().set_status(job_id, CANCELLED)
+        return True
+
+    def queued(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _set_gauges(self) -> None:
+        from metrics import SYNC_JOBS_QUEUED, SYNC_JOBS_RUNNING, SYNC_WORKERS_ALIVE, DOWNLOAD_QUEUE_ITEMS
+        from download_queue import get_download_queue, STATES
+        with self._lock:
+            SYNC_JOBS_QUEUED.set(len(self._pending))
+            SYNC_JOBS_RUNNING.set(sum(len(worker.tasks) for worker in self._workers.values()))
+            SYNC_WORKERS_ALIVE.set(sum(1 for worker in self._workers.values() if worker.process.is_alive()))
+        # Every state is set, so one that emptied drops to 0 instead of keeping its last count
+        counts = get_download_queue().counts()
+        for state in STATES:
+            DOWNLOAD_QUEUE_ITEMS.labels(state).set(counts.get(state, 0))
+
+    def _apply(self, store, event) -> None:
+        kind = event[0]
+        if kind == 'log':
+            store.append_log(event[1], event[2])
+        elif kind == 'progress':
+            store.update_progress(event[1], event[2], event[3])
+        elif kind == 'status':
+            store.set_status(event[1], event[2], error=event[3])
+        elif kind == 'finished':
+            index, job_id = event[1], event[2]
+            with self._lock:
+                worker = self._workers.get(index)
+                if worker is not None:
+                    worker.tasks.discard(job_id)
+                self._dispatch()
+            store.prune()
+        elif kind == 'metrics':
+            index, pid, snapshot = event[1:]
+            with self._lock:
+                worker = self._workers.get(index)
+                # A late snapshot from a replaced worker is already in retired_metrics
+                if worker is not None and worker.process.pid == pid:
+                    self.worker_metrics[index] = snapshot
+        elif kind == 'download':
+            from download_service import get_download_service
+            index, request_id, job_id, request = event[1:]
+            get_download_service().handle(
+                job_id, request,
+                reply=lambda status, value: self._reply(index, ('download_result', request_id, status, value)))
+        elif kind == 'download_cancel':
+            from download_service import get_download_service
+            get_download_service().cancel(event[1])
+
+    def _reply(self, index: int, message) -> None:
+        # A worker restarted since the request gets a reply it does not wait for and drops it
+        with self._lock:
+            worker = self._workers.get(index)
+        if worker is not None:
+            worker.inbox.put(message)
+
+    def _run_relay(self):
+        from job_store import get_job_store
+        store = get_job_store()
+        last_check = time.monotonic()
+        while True:
+            if time.monotonic() - last_check >= STATS_INTERVAL_SECONDS:
+                self._check_workers(store)
+                last_check = time.monotonic()
+            try:
+                event = self._events.get(timeout=STATS_INTERVAL_SECONDS)
+            except queue.Empty:
+                continue
+            if event is None:
+                return
+            try:
+                self._apply(store, event)
+            except Exception as e:
+                logger.error(f"❌ Failed to apply worker event {event[0]}: {e}")
+
+    def metrics_snapshots(self):
+        """Latest metrics of each worker plus the retained totals of workers that exited."""
+        with self._lock:
+            return list(self.worker_metrics.values()) + [self.retired_metrics]
+
+    def _retire_metrics(self, index: int) -> None:
+        # Caller holds self._lock. Gauges describe the dead process's state and are dropped.
+        from metrics import merge
+        snapshot = self.worker_metrics.pop(index, None)
+        if snapshot:
+            cumulative = {name: metric for name, metric in snapshot.items() if metric["type"] != "gauge"}
+            self.retired_metrics = merge([self.retired_metrics, cumulative])
+
+    def _check_workers(self, store) -> None:
+        from job_store import ERROR
+        from download_service import get_download_service
+        orphaned = []
+        with self._lock:
+            if self._stopping:
+                return
+            for index, worker in list(self._workers.items()):
+                if worker.process.is_alive():
+                    continue
+                logger.error(f"❌ Sync worker {index} exited with code {worker.process.exitcode}, restarting it")
+                self._retire_metrics(index)
+                orphaned.extend(worker.tasks)
+                self._start_worker(index)
+            self._dispatch()
+        for job_id in orphaned:
+            # Downloads only this job wanted are dropped; tracks others wait for continue
+            get_download_service().cancel(job_id)
+            store.set_status(job_id, ERROR, error="Sync worker exited")
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops taking jobs, lets running jobs finish for up to timeout seconds, then
+        terminates the workers. Jobs still queued or running are marked as failed.
+        """
+        from job_store import get_job_store, ERROR
+        timeout = timeout if timeout is not None else float(os.environ.get('SYNC_WORKER_SHUTDOWN_SECONDS', '30'))
+        store = get_job_store()
+        with self._lock:
+            self._stopping = True
+            pending, self._pending = list(self._pending), deque()
+            for worker in self._workers.values():
+                worker.inbox.put(None)
+        for _, payload in pending:
+            store.set_status(payload[0], ERROR, error="Server shut down before the job started")
+        deadline = time.monotonic() + timeout
+        for worker in self._workers.values():
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+        for index, worker in self._workers.items():
+            if worker.process.is_alive():
+                logger.warning(f"⚠️  Sync worker {index} did not finish within {timeout:.0f}s, terminating it")
+                worker.process.terminate()
+                worker.process.join(5)
+        self._events.put(None)
+        if self._relay is not None:
+            self._relay.join(10)
+        for worker in self._workers.values():
+            for job_id in worker.tasks:
+                store.set_status(job_id, ERROR, error="Server shut down before the job finished")
+        logger.info("🛑 Sync workers stopped")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sync_worker_pool() -> SyncWorkerPool:
+    """
+    Returns the API process's worker pool. SYNC_WORKER_PROCESSES sets the number of
+    worker processes and SYNC_WORKER_CONCURRENCY the number of jobs each runs at once.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SyncWorkerPool(int(os.environ.get('SYNC_WORKER_PROCESSES', '2')),
+                                   int(os.environ.get('SYNC_WORKER_CONCURRENCY', '2')))
+        return _pool
@@ -0,0 +1,125 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import download_scheduler
+from download_scheduler import AIMDController, DownloadScheduler, InflightRegistry
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(download_scheduler.time, "monotonic", lambda: now[0])
+    return now
+
+
+def run_windows(controller, clock, byte_counts):
+    for nbytes in byte_counts:
+        clock[0] += controller.window_seconds
+        controller.record(True, nbytes)
+
+
+def test_aimd_holds_on_flat_throughput(clock):
+    controller = AIMDController(2, 1, 10, window_seconds=10)
+    run_windows(controller, clock, [1000] * 6)
+    assert controller.current == 2
+    assert controller.increases == 0
+
+
+def test_aimd_grows_while_throughput_improves(clock):
+    controller = AIMDController(2, 1, 10, window_seconds=10)
+    run_windows(controller, clock, [1000, 1200, 1500, 1520, 1400])
+    # 1520 is within the growth margin of 1500 and 1400 is a drop: both hold
+    assert controller.current == 4
+
+
+def test_aimd_growth_stops_at_maximum(clock):
+    controller = AIMDController(2, 1, 3, window_seconds=10)
+    run_windows(controller, clock, [1000, 2000, 4000, 8000])
+    assert controller.current == 3
+
+
+def test_aimd_backs_off_once_per_window(clock):
+    controller = AIMDController(8, 1, 10, window_seconds=10)
+    controller.record(False)
+    controller.record(False)
+    assert controller.current == 4
+    assert controller.decreases == 1
+    clock[0] += 10
+    controller.record(False)
+    assert controller.current == 2
+
+
+def test_aimd_never_drops_below_minimum(clock):
+    controller = AIMDController(2, 2, 10, window_seconds=10)
+    controller.record(False)
+    assert controller.current == 2
+
+
+def test_scheduler_serves_jobs_round_robin():
+    scheduler = DownloadScheduler(1)
+    started = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    first = scheduler.submit("a", 0, block)
+    assert started.wait(5)
+    # Queued while the only slot is busy; within a job the lowest position goes first
+    futures = [scheduler.submit("a", position, order.append, f"a{position}") for position in (2, 1, 3)]
+    futures += [scheduler.submit("b", position, order.append, f"b{position}") for position in (1, 2)]
+    release.set()
+    for future in [first] + futures:
+        future.result(5)
+    assert order == ["a1", "b1", "a2", "b2", "a3"]
+
+
+def test_inflight_dedupes_concurrent_requests():
+    registry = InflightRegistry()
+    future = Future()
+    calls = []
+
+    def submit():
+        calls.append(1)
+        return future
+
+    assert registry.submit("track", submit, "job-1") == (future, False)
+    assert registry.submit("track", submit, "job-2") == (future, True)
+    assert len(calls) == 1
+    future.set_result("done")
+    assert len(registry) == 0
+
+
+def test_inflight_aborts_only_when_last_requester_detaches():
+    registry = InflightRegistry()
+    future = Future()
+    registry.submit("track", lambda: future, "job-1")
+    registry.submit("track", lambda: future, "job-2")
+    abort = registry.abort_event("track")
+
+    assert registry.detach("track", "job-1") is False
+    assert not abort.is_set()
+    assert not future.cancelled()
+
+    assert registry.detach("track", "job-2") is True
+    assert abort.is_set()
+    assert future.cancelled()
+    assert len(registry) == 0
+
+
+def test_inflight_failed_submit_leaves_nothing_behind():
+    registry = InflightRegistry()
+
+    def fail():
+        raise RuntimeError("scheduler is gone")
+
+    with pytest.raises(RuntimeError):
+        registry.submit("track", fail, "job-1")
+    assert registry.detach("track", "job-1") is False
+
+    future = Future()
+    assert registry.submit("track", lambda: future, "job-2") == (future, False)
@@ -0,0 +1,66 @@
+import pytest
+
+from job_store import JobStore, DONE, RUNNING
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+def messages(lines):
+    return [line["message"] for line in lines]
+
+
+def test_since_returns_only_newer_lines(store):
+    store.create("job-1", "https://open.spotify.com/playlist/a")
+    seqs = [store.append_log("job-1", f"line {i}") for i in range(3)]
+    assert seqs == [1, 2, 3]
+
+    job = store.get("job-1", since=1)
+    assert messages(job["log"]) == ["line 1", "line 2"]
+    assert job["seq"] == 3
+    assert store.get("job-1", since=3)["log"] == []
+
+
+def test_since_cursor_survives_the_job_finishing(store):
+    store.create("job-1")
+    for i in range(3):
+        store.append_log("job-1", f"line {i}")
+    store.set_status("job-1", DONE)
+
+    job = store.get("job-1", since=2)
+    assert job["status"] == DONE
+    assert messages(job["log"]) == ["line 2"]
+    assert store.version("job-1") is None
+
+
+def test_log_is_bounded_and_cursor_keeps_counting(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), max_log_lines=2)
+    store.create("job-1")
+    for i in range(5):
+        store.append_log("job-1", f"line {i}")
+    assert messages(store.get("job-1", since=0)["log"]) == ["line 3", "line 4"]
+    assert store.get("job-1", since=0)["seq"] == 5
+
+
+def test_create_unless_active_attaches_to_running_job(store):
+    assert store.create_unless_active("job-1", "url", "playlist:a") == ("job-1", True)
+    store.set_status("job-1", RUNNING)
+    assert store.create_unless_active("job-2", "url", "playlist:a") == ("job-1", False)
+    assert store.get("job-2") is None
+    # Another resource is independent
+    assert store.create_unless_active("job-3", "url", "playlist:b") == ("job-3", True)
+
+
+def test_create_unless_active_creates_after_job_finished(store):
+    store.create_unless_active("job-1", "url", "playlist:a")
+    store.set_status("job-1", DONE)
+    assert store.create_unless_active("job-2", "url", "playlist:a") == ("job-2", True)
+
+
+def test_version_moves_on_changes(store):
+    store.create("job-1")
+    version = store.version("job-1")
+    store.append_log("job-1", "hello")
+    assert store.version("job-1") > version
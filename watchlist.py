@@ -0,0 +1,252 @@
+import os
+import time
+import random
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from credential import get_state_dir
+from metrics import SPOTIFY_PAGE_SECONDS, WATCHLIST_CHECKS
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watchlist (
+    resource TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    name TEXT,
+    marker TEXT,
+    pending_marker TEXT,
+    added_at REAL NOT NULL,
+    checked_at REAL,
+    changed_at REAL,
+    last_job_id TEXT,
+    error TEXT
+);
+"""
+
+
+class Watchlist:
+    """
+    Playlists and artists that are synced automatically when they change. marker is
+    the change marker (the playlist snapshot_id, or the artist's number of albums and
+    singles) as of the last successful sync; pending_marker is the one the last
+    started job is syncing, confirmed once that job is done.
+    """
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(watchlist)")}
+        if 'pending_marker' not in columns:
+            self._conn.execute("ALTER TABLE watchlist ADD COLUMN pending_marker TEXT")
+        self._conn.commit()
+
+    def add(self, resource: str, url: str) -> bool:
+        """Watches a 'playlist:<id>' or 'artist:<id>' resource; False if it was already watched."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO watchlist (resource, url, added_at) VALUES (?, ?, ?)",
+                (resource, url, time.time()),
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def remove(self, resource: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM watchlist WHERE resource = ?", (resource,))
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM watchlist ORDER BY added_at").fetchall()
+        return [dict(row) for row in rows]
+
+    def record_check(self, resource: str, name: Optional[str] = None, marker: Optional[str] = None,
+                     job_id: Optional[str] = None, error: Optional[str] = None) -> None:
+        """
+        Stores the outcome of one check. When the resource changed, marker becomes the
+        pending marker of job_id; confirm() makes it the synced marker.
+        """
+        now = time.time()
+        with self._lock:
+            if error is not None:
+                self._conn.execute("UPDATE watchlist SET checked_at = ?, error = ? WHERE resource = ?",
+                                   (now, error, resource))
+            elif job_id is not None:
+                self._conn.execute(
+                    "UPDATE watchlist SET checked_at = ?, changed_at = ?, name = COALESCE(?, name), "
+                    "pending_marker = ?, last_job_id = ?, error = NULL WHERE resource = ?",
+                    (now, now, name, marker, job_id, resource),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE watchlist SET checked_at = ?, name = COALESCE(?, name), error = NULL WHERE resource = ?",
+                    (now, name, resource),
+                )
+            self._conn.commit()
+
+    def confirm(self, resource: str) -> None:
+        """Marks the pending marker as synced, once the job that synced it is done."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE watchlist SET marker = pending_marker, pending_marker = NULL "
+                "WHERE resource = ? AND pending_marker IS NOT NULL",
+                (resource,),
+            )
+            self._conn.commit()
+
+
+def _artist_marker(sp, artist_id: str) -> str:
+    """Change marker of an artist: a one-item album page carries the total album count."""
+    with SPOTIFY_PAGE_SECONDS.labels('artist_albums').time():
+        response = sp.artist_albums(artist_id, album_type='album,single', limit=1)
+    return f"albums:{response['total']}"
+
+
+class WatchlistScheduler:
+    """
+    Polls the watchlist every WATCHLIST_INTERVAL_SECONDS (plus or minus
+    WATCHLIST_JITTER_SECONDS) with one metadata request per entry, at most
+    WATCHLIST_REQUESTS_PER_SECOND. Playlists whose snapshot_id differs from the one
+    of their last completed sync, and artists with a new album count, are handed to
+    enqueue(url, resource) -> (job_id, attached).
+    """
+
+    def __init__(self, watchlist: Watchlist, interval: float, jitter: float, requests_per_second: float):
+        self.watchlist = watchlist
+        self.interval = interval
+        self.jitter = jitter
+        self._min_gap = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next_request = 0.0
+        self._enqueue: Optional[Callable[[str, str], Tuple[str, bool]]] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, enqueue: Callable[[str, str], Tuple[str, bool]]) -> None:
+        if self._thread is not None:
+            return
+        self._enqueue = enqueue
+        self._thread = threading.Thread(target=self._run, name="watchlist", daemon=True)
+        self._thread.start()
+        logger.info(f"👀 Watchlist scheduler started (every {self.interval:.0f}s ± {self.jitter:.0f}s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def check_now(self) -> None:
+        """Starts a check of all entries without waiting for the interval."""
+        self._wake.set()
+
+    def _run(self) -> None:
+        # Spread the first check so restarts of several instances do not poll together
+        self._wake.wait(random.uniform(0, self.jitter))
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                self.check_all()
+            except Exception as e:
+                logger.error(f"❌ Watchlist check failed: {e}")
+            self._wake.wait(max(1.0, self.interval + random.uniform(-self.jitter, self.jitter)))
+
+    def _throttle(self) -> bool:
+        """Waits for the next request slot; False if the scheduler is stopping."""
+        delay = self._next_request - time.monotonic()
+        if delay > 0 and self._stop.wait(delay):
+            return False
+        self._next_request = time.monotonic() + self._min_gap
+        return not self._stop.is_set()
+
+    def check_all(self) -> Dict[str, int]:
+        """Checks every entry once; returns how many were unchanged, changed or failed."""
+        from spotify_utils import setup_spotify_client
+        entries = self.watchlist.list()
+        results = {"unchanged": 0, "changed": 0, "error": 0}
+        if not entries:
+            return results
+        clients = setup_spotify_client()
+        for entry in entries:
+            if not self._throttle():
+                break
+            try:
+                result = self._check(clients, entry)
+            except Exception as e:
+                logger.warning(f"⚠️  Watchlist check of {entry['resource']} failed: {e}")
+                self.watchlist.record_check(entry['resource'], error=str(e))
+                result = "error"
+            WATCHLIST_CHECKS.labels(result).inc()
+            results[result] += 1
+        if results["changed"] or results["error"]:
+            logger.info(f"👀 Watchlist: {results['changed']} changed, {results['unchanged']} unchanged, "
+                        f"{results['error']} failed")
+        return results
+
+    def _check(self, clients, entry: Dict) -> str:
+        from spotify_utils import get_spotify_playlist_snapshot, get_spotify_url_from_resource_key
+        from playlist_state import get_playlist_state
+        from job_store import get_job_store, DONE
+        kind, spotify_id = entry['resource'].split(':', 1)
+        if entry['pending_marker'] and entry['last_job_id'] and get_job_store().status(entry['last_job_id']) == DONE:
+            self.watchlist.confirm(entry['resource'])
+            entry['marker'] = entry['pending_marker']
+        if kind == 'playlist':
+            name, marker = get_spotify_playlist_snapshot(*clients, spotify_id)
+            synced = get_playlist_state().get(spotify_id)
+            # Compared with the last completed sync, so a failed run is retried on the next check
+            changed = not synced or not marker or synced['snapshot_id'] != marker
+        elif kind == 'artist':
+            name, marker = None, _artist_marker(clients[0], spotify_id)
+            # Only a successful sync confirms a marker, so a failed run is retried; while
+            # the job still runs, enqueueing attaches to it
+            changed = entry['marker'] != marker
+        else:
+            raise ValueError(f"Cannot watch {kind} resources")
+        if not changed:
+            self.watchlist.record_check(entry['resource'], name=name)
+            return "unchanged"
+        # Built from the key: workers only route open.spotify.com URLs, not spotify: URIs
+        job_id, attached = self._enqueue(get_spotify_url_from_resource_key(entry['resource']), entry['resource'])
+        logger.info(f"👀 {name or entry['resource']} changed, "
+                    + (f"already syncing in job {job_id}" if attached else f"started job {job_id}"))
+        self.watchlist.record_check(entry['resource'], name=name, marker=marker, job_id=job_id)
+        return "changed"
+
+
+_watchlist = None
+_scheduler = None
+_watchlist_lock = threading.Lock()
+
+
+def get_watchlist() -> Watchlist:
+    """Returns the process-wide watchlist stored under STATE_DIR."""
+    global _watchlist
+    with _watchlist_lock:
+        if _watchlist is None:
+            _watchlist = Watchlist(os.path.join(get_state_dir(), "watchlist.db"))
+        return _watchlist
+
+
+def get_watchlist_scheduler() -> WatchlistScheduler:
+    global _scheduler
+    watchlist = get_watchlist()
+    with _watchlist_lock:
+        if _scheduler is None:
+            _scheduler = WatchlistScheduler(
+                watchlist,
+                interval=float(os.environ.get('WATCHLIST_INTERVAL_SECONDS', '1800')),
+                jitter=float(os.environ.get('WATCHLIST_JITTER_SECONDS', '120')),
+                requests_per_second=float(os.environ.get('WATCHLIST_REQUESTS_PER_SECOND', '2')),
+            )
+        return _scheduler
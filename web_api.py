@@ -1,36 +1,35 @@
-from fastapi.responses import RedirectResponse
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi.responses import RedirectResponse, StreamingResponse, PlainTextResponse
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict
+from typing import List, Optional
 import uuid
+import json
+import asyncio
+import anyio
 import threading
 import time
 import os
 import sys
 import io
 import logging
-from main import sync_playlist
+from sync_workers import get_sync_worker_pool
 
 app = FastAPI()
 
-def sync_spotify_url(spotify_url):
-    """
-    Auto-detects URL type and routes to appropriate sync function
-    """
-    if '/artist/' in spotify_url:
-        # Artist sync
-        from download_utils import download_missing_artist_tracks_spotdl
-        download_dir = "/app/downloads"
-        logging.info(f"🎤 Detected artist URL, starting artist sync...")
-        download_missing_artist_tracks_spotdl(spotify_url, download_dir)
-    elif '/playlist/' in spotify_url:
-        # Playlist sync (existing functionality)
-        logging.info(f"📋 Detected playlist URL, starting playlist sync...")
-        sync_playlist(spotify_url)
-    else:
-        raise ValueError("Unsupported Spotify URL. Please provide a playlist or artist URL.")
+@app.on_event("startup")
+def start_sync_workers():
+    """Start the download service (resuming downloads left by a previous container run) and the sync workers."""
+    from download_service import get_download_service
+    from job_store import get_job_store
+    # Opening the store marks jobs interrupted by the restart as failed
+    get_job_store()
+    get_download_service().start()
+    get_sync_worker_pool().start()
+    if float(os.environ.get('WATCHLIST_INTERVAL_SECONDS', '1800')) > 0:
+        from watchlist import get_watchlist_scheduler
+        get_watchlist_scheduler().start(enqueue=_start_sync)
 
 # Redirect root URL to web UI (must be after app is defined)
 @app.get("/")
@@ -47,53 +46,233 @@ static_dir = os.path.join(os.path.dirname(__file__), "static")
 if os.path.exists(static_dir):
     app.mount("/static", StaticFiles(directory=static_dir, html=True), name="static")
 
-# In-memory job store (for demo; use Redis/DB for production)
-jobs: Dict[str, Dict] = {}
-
 class SpotifyRequest(BaseModel):
     url: str
+    # Start a new run even if one for the same playlist/artist is queued or running,
+    # and sync playlists even if unchanged since the last sync
+    force: bool = False
+
+def _start_sync(url, resource, force=False):
+    """
+    Creates a sync job and queues it on the sync workers. Returns (job_id, attached):
+    unless force is set, an active job for the same resource is returned instead.
+    """
+    from job_store import get_job_store
+    store = get_job_store()
+    job_id = str(uuid.uuid4())
+    if force:
+        store.create(job_id, url, resource)
+    else:
+        job_id, created = store.create_unless_active(job_id, url, resource)
+        if not created:
+            return job_id, True
+    # Runs in a sync worker process; logs and status come back through the job store
+    get_sync_worker_pool().submit(job_id, url, force=force)
+    return job_id, False
 
 @app.post("/submit")
-def submit_spotify_sync(req: SpotifyRequest, background_tasks: BackgroundTasks):
+def submit_spotify_sync(req: SpotifyRequest):
+    """
+    Starts a sync job. If a job for the same Spotify playlist or artist is already
+    queued or running, its ID is returned instead (attached=true) unless force is set.
+    """
+    from spotify_utils import get_spotify_resource_key, get_spotify_url_from_resource_key
+    resource = get_spotify_resource_key(req.url)
+    # Workers route and parse open.spotify.com URLs, so URIs are passed on in that form
+    url = get_spotify_url_from_resource_key(resource) if resource else req.url
+    job_id, attached = _start_sync(url, resource, force=req.force)
+    return {"job_id": job_id, "attached": attached}
+
+class BatchRequest(BaseModel):
+    urls: List[str]
+    force: bool = False
+
+@app.post("/submit/batch")
+def submit_batch_sync(req: BatchRequest):
+    """
+    Syncs many playlists as one job: tracks shared between them are matched and
+    downloaded once. Resubmitting the same set of playlists while it runs attaches
+    to the running job unless force is set.
+    """
+    import hashlib
+    from job_store import get_job_store
+    from spotify_utils import get_spotify_resource_key, get_spotify_url_from_resource_key
+    urls, keys = [], []
+    for url in req.urls:
+        key = get_spotify_resource_key(url)
+        if not key or not key.startswith('playlist:'):
+            raise HTTPException(status_code=400, detail=f"Not a Spotify playlist URL: {url}")
+        if key not in keys:
+            keys.append(key)
+            # Canonical form, so spotify:playlist: URIs parse in the worker as well
+            urls.append(get_spotify_url_from_resource_key(key))
+    if not urls:
+        raise HTTPException(status_code=400, detail="No playlist URLs given")
+    store = get_job_store()
     job_id = str(uuid.uuid4())
-    jobs[job_id] = {"status": "queued", "progress": 0, "log": []}
-    
-    def run_job():
-        jobs[job_id]["status"] = "running"
-        
-        # Custom log handler to capture all logging
-        class JobLogHandler(logging.Handler):
-            def emit(self, record):
-                log_message = self.format(record)
-                jobs[job_id]["log"].append(log_message)
-        
-        # Create log handler and add to root logger
-        job_handler = JobLogHandler()
-        job_handler.setLevel(logging.INFO)
-        formatter = logging.Formatter('%(message)s')
-        job_handler.setFormatter(formatter)
-        
-        # Get root logger and add our handler
-        root_logger = logging.getLogger()
-        root_logger.addHandler(job_handler)
-        root_logger.setLevel(logging.INFO)
-        
-        try:
-            sync_spotify_url(req.url)
-            jobs[job_id]["status"] = "done"
-        except Exception as e:
-            jobs[job_id]["status"] = "error"
-            jobs[job_id]["log"].append(f"❌ Error: {str(e)}")
-        finally:
-            # Remove our log handler
-            root_logger.removeHandler(job_handler)
-    
-    background_tasks.add_task(run_job)
-    return {"job_id": job_id}
+    resource = "batch:" + hashlib.sha1("\n".join(sorted(keys)).encode()).hexdigest()[:16]
+    if req.force:
+        store.create(job_id, "\n".join(urls), resource)
+    else:
+        job_id, created = store.create_unless_active(job_id, "\n".join(urls), resource)
+        if not created:
+            return {"job_id": job_id, "attached": True, "playlists": len(urls)}
+    get_sync_worker_pool().submit(job_id, urls, force=req.force)
+    return {"job_id": job_id, "attached": False, "playlists": len(urls)}
+
+class WatchRequest(BaseModel):
+    url: str
+
+@app.get("/watchlist")
+def list_watchlist():
+    """Watched playlists and artists with their last check, change and job."""
+    from watchlist import get_watchlist
+    return {"watchlist": get_watchlist().list()}
+
+@app.post("/watchlist")
+def add_to_watchlist(req: WatchRequest):
+    """Watches a playlist or artist; it is synced on the next check and whenever it changes."""
+    from watchlist import get_watchlist
+    from spotify_utils import get_spotify_resource_key, get_spotify_url_from_resource_key
+    resource = get_spotify_resource_key(req.url)
+    if not resource or resource.split(':', 1)[0] not in ('playlist', 'artist'):
+        raise HTTPException(status_code=400, detail="Only Spotify playlist and artist URLs can be watched")
+    added = get_watchlist().add(resource, get_spotify_url_from_resource_key(resource))
+    return {"resource": resource, "added": added}
+
+@app.delete("/watchlist/{resource}")
+def remove_from_watchlist(resource: str):
+    from watchlist import get_watchlist
+    if not get_watchlist().remove(resource):
+        raise HTTPException(status_code=404, detail="Not in the watchlist")
+    return {"resource": resource, "removed": True}
+
+@app.post("/watchlist/check")
+def check_watchlist():
+    """Checks all watched playlists and artists now instead of at the next interval."""
+    from watchlist import get_watchlist_scheduler
+    scheduler = get_watchlist_scheduler()
+    if not scheduler.running:
+        raise HTTPException(status_code=409, detail="The watchlist scheduler is disabled (WATCHLIST_INTERVAL_SECONDS=0)")
+    scheduler.check_now()
+    return {"status": "checking"}
+
+@app.post("/cancel/{job_id}")
+def cancel_job(job_id: str):
+    """
+    Cancels a queued or running job. A running job stops at its next check: its
+    matching loop, download wait or Plex scan wait ends, and spotDL processes no
+    other job is waiting for are killed.
+    """
+    from job_store import get_job_store, ACTIVE_STATES
+    store = get_job_store()
+    job = store.get(job_id, since=0)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] not in ACTIVE_STATES:
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    store.append_log(job_id, "🛑 Cancellation requested")
+    if not get_sync_worker_pool().cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job is no longer running")
+    return {"job_id": job_id, "status": "cancelling"}
 
 @app.get("/status/{job_id}")
-def get_status(job_id: str):
-    job = jobs.get(job_id)
+def get_status(job_id: str, since: Optional[int] = None):
+    """
+    Job status, progress counters and log. With since=<seq> only log lines after that
+    sequence number are returned, so polling clients fetch each line once.
+    """
+    from job_store import get_job_store
+    job = get_job_store().get(job_id, since=since)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     return job
+
+def _sse(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+@app.get("/events/{job_id}")
+def stream_job_events(job_id: str, since: int = 0, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-Sent Events stream of a job: 'log' events for new log lines (the event id is
+    the line's seq, so a reconnecting EventSource resumes where it left off), 'progress'
+    events when status or counters change, and a final 'end' event. Between changes the
+    stream polls the job's lock-free version with asyncio.sleep; only reading new lines
+    briefly uses a threadpool thread.
+    """
+    from job_store import get_job_store, ACTIVE_STATES
+    store = get_job_store()
+    if store.get(job_id, since=0) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    async def events():
+        seq = since
+        last_progress = None
+        while True:
+            job = await anyio.to_thread.run_sync(lambda: store.get(job_id, since=seq))
+            for line in job["log"]:
+                seq = line["seq"]
+                yield _sse("log", line, seq)
+            progress = {"status": job["status"], "counters": job["counters"], "error": job["error"]}
+            if progress != last_progress:
+                last_progress = progress
+                yield _sse("progress", progress)
+            if job["status"] not in ACTIVE_STATES:
+                yield _sse("end", progress)
+                return
+            idle_until = time.monotonic() + 15
+            while store.version(job_id) == job["version"]:
+                if time.monotonic() >= idle_until:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    break
+                await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/stats")
+def get_stats():
+    """Dashboard totals: jobs by status, tracks matched/downloaded, bytes moved, average stage durations."""
+    from job_store import get_job_store
+    return get_job_store().stats.snapshot()
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Prometheus metrics: this process's plus the latest snapshot from each sync worker,
+    summed. Worker snapshots are at most a few seconds old.
+    """
+    from metrics import REGISTRY, merge, render
+    pool = get_sync_worker_pool()
+    snapshot = merge([REGISTRY.snapshot()] + pool.metrics_snapshots())
+    return PlainTextResponse(render(snapshot), media_type="text/plain; version=0.0.4")
+
+@app.get("/jobs")
+def list_jobs(limit: int = 50):
+    """Most recent jobs, newest first, without their logs."""
+    from job_store import get_job_store
+    return get_job_store().list_jobs(limit)
+
+@app.get("/downloads/queue")
+def get_download_queue_status():
+    """Durable queue state counts plus the download scheduler and provider state."""
+    from download_queue import get_download_queue
+    from download_service import download_snapshot, get_download_service
+    return dict(download_snapshot(), queue=get_download_queue().counts(),
+                active_requests=get_download_service().active_requests())
+
+@app.on_event("shutdown")
+def stop_sync_workers():
+    """Let running jobs finish (up to SYNC_WORKER_SHUTDOWN_SECONDS), then flush job logs."""
+    from job_store import get_job_store
+    from watchlist import get_watchlist_scheduler
+    get_watchlist_scheduler().stop()
+    get_sync_worker_pool().shutdown()
+    get_job_store().flush_all()
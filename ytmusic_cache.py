@@ -0,0 +1,135 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional
+from credential import get_state_dir
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS youtube_search (
+    key TEXT PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    video_title TEXT,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_youtube_search_last_used ON youtube_search(last_used);
+"""
+
+
+class SharedYTMusic:
+    """
+    One YTMusic client shared by every caller. ytmusicapi keeps a requests session
+    with mutable state, so calls are serialized through a lock.
+    """
+
+    def __init__(self):
+        from ytmusicapi import YTMusic
+        self._client = YTMusic()
+        self._lock = threading.Lock()
+
+    def search(self, *args, **kwargs):
+        with self._lock:
+            return self._client.search(*args, **kwargs)
+
+
+def normalize_search_key(artist: str, title: str) -> str:
+    """Cache key from artist and title: lowercase, punctuation stripped, whitespace collapsed."""
+    def normalize(s):
+        s = re.sub(r'[^\w\s]', ' ', (s or '').lower())
+        return re.sub(r'\s+', ' ', s).strip()
+    return f"{normalize(artist)}|{normalize(title)}"
+
+
+class YouTubeSearchCache:
+    """
+    Persistent artist/title -> YouTube video ID cache with a TTL and LRU eviction,
+    so retries and re-syncs resolve video IDs without another ytmusic.search call.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def get(self, artist: str, title: str) -> Optional[Dict]:
+        """Returns {'video_id', 'video_title'} for a fresh entry, else None."""
+        key = normalize_search_key(artist, title)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT video_id, video_title, created_at FROM youtube_search WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[2] <= self.ttl_seconds:
+                self._conn.execute("UPDATE youtube_search SET last_used = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits += 1
+                return {'video_id': row[0], 'video_title': row[1]}
+            if row:
+                self._conn.execute("DELETE FROM youtube_search WHERE key = ?", (key,))
+                self._conn.commit()
+            self.misses += 1
+            return None
+
+    def put(self, artist: str, title: str, video_id: str, video_title: Optional[str] = None) -> None:
+        key = normalize_search_key(artist, title)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO youtube_search (key, video_id, video_title, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, video_id, video_title, now, now),
+            )
+            # Evict least recently used entries beyond max_entries
+            self._conn.execute(
+                "DELETE FROM youtube_search WHERE key IN ("
+                "SELECT key FROM youtube_search ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM youtube_search").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_ytmusic = None
+_cache = None
+_lock = threading.Lock()
+
+
+def get_ytmusic() -> SharedYTMusic:
+    """Returns the process-wide YTMusic client."""
+    global _ytmusic
+    with _lock:
+        if _ytmusic is None:
+            _ytmusic = SharedYTMusic()
+        return _ytmusic
+
+
+def get_youtube_search_cache() -> YouTubeSearchCache:
+    """Returns the process-wide YouTube search cache stored under STATE_DIR."""
+    global _cache
+    with _lock:
+        if _cache is None:
+            ttl_days = float(os.environ.get('YTMUSIC_CACHE_TTL_DAYS', '30'))
+            max_entries = int(os.environ.get('YTMUSIC_CACHE_MAX_ENTRIES', '50000'))
+            _cache = YouTubeSearchCache(os.path.join(get_state_dir(), "ytmusic_cache.db"), ttl_days * 86400, max_entries)
+        return _cache